@@ -1,32 +1,56 @@
 import os
 import json
+import asyncio
+import math
+import bisect
 import logging
 import re
 import sqlite3
+import random
+import struct
+import hashlib
+import secrets
+import atexit
+import threading
+import queue
+import time
+import mmap
+import fcntl
+from array import array
 from datetime import datetime, timedelta, date
-from dateutil.parser import parse as parse_date
 from flask import (
     Flask, request, jsonify, render_template,
-    send_from_directory, session, redirect, url_for, abort
+    send_from_directory, session, redirect, url_for, abort,
+    Response, stream_with_context, g, has_request_context
 )
 from dotenv import load_dotenv
 from flask_cors import CORS
 from google import genai
-from langdetect import detect
+from google.genai import types as genai_types
+from google.genai import errors as genai_errors
 from symspellpy.symspellpy import SymSpell, Verbosity
 from google.api_core import exceptions as google_exceptions
+from requests import exceptions as requests_exceptions
 from werkzeug.middleware.proxy_fix import ProxyFix
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
-from flask_session import Session
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+from itsdangerous import Signer, BadSignature
 import bleach
+from bleach.html5lib_shim import HTML_TAGS_BLOCK_LEVEL, match_entity, next_possible_entity, convert_entity
 from difflib import SequenceMatcher
+from urllib.parse import urlsplit
+from functools import lru_cache, wraps
+from abc import ABC, abstractmethod
+from collections import Counter, OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures, FIRST_COMPLETED
+from concurrent.futures import TimeoutError as FutureTimeout
 
 # ==================== Logging ====================
+# LOG_FILE: bench/test mengarahkan log ke direktori sementara (default app.log di CWD)
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(levelname)s - %(message)s",
-    filename="app.log"
+    filename=os.getenv("LOG_FILE", "app.log")
 )
 logger = logging.getLogger(__name__)
 
@@ -53,13 +77,11 @@ if _render_url and _render_url not in ALLOWED_ORIGINS:
 
 # Storage paths (Render-safe). Gunakan DB_PATH jika ada volume persisten.
 TMP_DIR = "/tmp"
-SESSION_DIR = os.path.join(TMP_DIR, "flask_session")
 DEFAULT_DB_PATH = os.path.join(TMP_DIR, "timu.db")
 DB_PATH = os.getenv("DB_PATH", DEFAULT_DB_PATH)
-CHAT_JSON_BACKUP = os.path.join(TMP_DIR, "chat_history_backup.json")
+CHAT_JSON_BACKUP = os.path.join(TMP_DIR, "chat_history_backup-{day}.jsonl")  # rotasi harian
 BACKUP_JSON = os.getenv("BACKUP_JSON", "0") == "1"
 
-os.makedirs(SESSION_DIR, exist_ok=True)
 os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 
 # ==================== Flask init ====================
@@ -69,84 +91,752 @@ app.secret_key = FLASK_SECRET
 # Trust proxy
 app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1)
 
-# Session & security
+# Session & security (store sesi: SQLiteSessionInterface, lihat bagian Database)
 app.config.update(
-    SESSION_TYPE="filesystem",
-    SESSION_FILE_DIR=SESSION_DIR,
-    SESSION_PERMANENT=False,
-    SESSION_USE_SIGNER=True,
     SESSION_COOKIE_SECURE=True,
     SESSION_COOKIE_HTTPONLY=True,
     SESSION_COOKIE_SAMESITE="Lax",
     MAX_CONTENT_LENGTH=16 * 1024,  # 16KB
     PERMANENT_SESSION_LIFETIME=timedelta(hours=6),
     PREFERRED_URL_SCHEME="https",
+    RATELIMIT_ENABLED=os.getenv("RATELIMIT_ENABLED", "1") == "1",  # 0 hanya untuk uji beban lokal
 )
-Session(app)
 
-# CORS & Rate limit
+# CORS (rate limit: lihat Origin/Rate Guard)
 CORS(app, resources={r"/*": {"origins": ALLOWED_ORIGINS}})
-limiter = Limiter(get_remote_address, app=app,
-                  default_limits=["600 per hour", "60 per minute"])
 
 # ==================== Gemini client ====================
-client = genai.Client(api_key=GEMINI_API_KEY)
+# GEMINI_BASE_URL: arahkan client ke endpoint lain (mis. bench/fake_gemini.py)
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "").strip()
+client = genai.Client(api_key=GEMINI_API_KEY,
+                      http_options={"base_url": GEMINI_BASE_URL} if GEMINI_BASE_URL else None)
+GEMINI_MODEL = "gemini-2.5-flash"
+
+# ====== Resilience: deadline, retry + jitter, circuit breaker, hedging ======
+# google-genai 0.3.0 tidak punya opsi timeout, jadi setiap panggilan dijalankan
+# di pool thread dan ditunggu dengan batas waktu. Thread yang macet tetap
+# berjalan sampai jaringan menyerah, tapi worker sudah bebas melayani yang lain.
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "15"))     # per percobaan (detik)
+GEMINI_DEADLINE = float(os.getenv("GEMINI_DEADLINE", "25"))   # total termasuk retry
+GEMINI_RETRIES = int(os.getenv("GEMINI_RETRIES", "2"))
+GEMINI_BACKOFF = (0.25, 2.0)   # basis & batas backoff eksponensial (full jitter)
+GEMINI_BREAKER_THRESHOLD = int(os.getenv("GEMINI_BREAKER_THRESHOLD", "5"))
+GEMINI_BREAKER_COOLDOWN = float(os.getenv("GEMINI_BREAKER_COOLDOWN", "30"))
+GEMINI_HEDGE = os.getenv("GEMINI_HEDGE", "0") == "1"
+GEMINI_HEDGE_MIN = 0.5         # jangan hedge lebih cepat dari ini (detik)
+GEMINI_HEDGE_SAMPLES = 20      # sampel latensi minimal sebelum hedging aktif
+GEMINI_MAX_INFLIGHT = int(os.getenv("GEMINI_MAX_INFLIGHT", "32"))
+_RETRY_CODES = {408, 429, 500, 502, 503, 504}
+
+class GeminiUnavailable(Exception):
+    """Gemini tidak bisa dipakai: breaker terbuka, deadline lewat, atau retry habis."""
+
+def _gemini_retryable(e) -> bool:
+    if isinstance(e, (TimeoutError, requests_exceptions.ConnectionError, requests_exceptions.Timeout)):
+        return True
+    if isinstance(e, (genai_errors.APIError, google_exceptions.GoogleAPIError)):
+        return getattr(e, "code", None) in _RETRY_CODES
+    return False
+
+class CircuitBreaker:
+    """closed -> open setelah N kegagalan beruntun; setelah cooldown satu probe (half_open)."""
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state, self.probing = "half_open", False
+            if self.state == "half_open" and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def success(self):
+        with self.lock:
+            if self.state != "closed":
+                logger.info("🟢 Circuit breaker Gemini tertutup kembali")
+            self.state, self.failures, self.probing = "closed", 0, False
+
+    def release(self):
+        """Lepas probe tanpa menilai upstream (error lokal): permintaan berikutnya boleh probe."""
+        with self.lock:
+            if self.state == "half_open":
+                self.probing = False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.threshold):
+                logger.warning("🔴 Circuit breaker Gemini terbuka (%d kegagalan)", self.failures)
+                self.state, self.opened_at, self.probing = "open", time.monotonic(), False
+
+class ResilientGemini:
+    """Pembungkus client.models: generate_content (sync), agenerate_content (async)
+    dan generate_content_stream dengan deadline, retry, breaker dan hedging opsional."""
+
+    def __init__(self, client, timeout=GEMINI_TIMEOUT, deadline=GEMINI_DEADLINE,
+                 retries=GEMINI_RETRIES, hedge=GEMINI_HEDGE,
+                 breaker=None, max_inflight=GEMINI_MAX_INFLIGHT):
+        self.client = client
+        self.timeout = timeout
+        self.deadline = deadline
+        self.retries = retries
+        self.hedge = hedge
+        self.breaker = breaker or CircuitBreaker(GEMINI_BREAKER_THRESHOLD, GEMINI_BREAKER_COOLDOWN)
+        self.pool = ThreadPoolExecutor(max_inflight, thread_name_prefix="gemini")
+        self.latencies = deque(maxlen=200)
+        self.stats = Counter()
+
+    # --- util ---
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(GEMINI_BACKOFF[1], GEMINI_BACKOFF[0] * (2 ** attempt)))
+
+    def hedge_delay(self):
+        if not self.hedge or len(self.latencies) < GEMINI_HEDGE_SAMPLES:
+            return None
+        lat = sorted(self.latencies)
+        return max(GEMINI_HEDGE_MIN, lat[int(len(lat) * 0.95) - 1])
+
+    def _admit(self):
+        if not self.breaker.allow():
+            self.stats["short_circuit"] += 1
+            raise GeminiUnavailable("circuit breaker terbuka")
+
+    def _failed(self, e, attempt: int, remaining: float) -> float:
+        """Catat kegagalan; -> jeda sebelum retry, atau raise GeminiUnavailable
+        (error lokal non-API diteruskan apa adanya)."""
+        if not _gemini_retryable(e):
+            if not isinstance(e, genai_errors.APIError):
+                # bug lokal (TypeError, KeyError, ...): jangan disamarkan jadi "AI tidak tersedia"
+                self.breaker.release()
+                raise e
+            self.stats["error"] += 1
+            if isinstance(e, genai_errors.ClientError):
+                # upstream menjawab 4xx (mis. 400): bukan alasan membuka breaker, juga menutup probe
+                self.breaker.success()
+            else:
+                self.breaker.failure()  # 5xx yang tidak layak di-retry (mis. 501)
+            raise GeminiUnavailable(str(e)) from e
+        self.stats["error"] += 1
+        self.breaker.failure()
+        pause = self._backoff(attempt)
+        if attempt >= self.retries or remaining - pause < 1.0 or not self.breaker.allow():
+            raise GeminiUnavailable(f"Gemini gagal setelah {attempt + 1} percobaan: {e}") from e
+        self.stats["retry"] += 1
+        logger.warning("Gemini retry %d setelah %.2fs: %s", attempt + 1, pause, e)
+        return pause
+
+    def _succeeded(self, started: float):
+        self.latencies.append(time.monotonic() - started)
+        self.stats["ok"] += 1
+        self.breaker.success()
+
+    # --- satu percobaan (dengan hedging) ---
+    def _attempt(self, kwargs: dict, timeout: float):
+        started = time.monotonic()
+        futures = [self.pool.submit(self.client.models.generate_content, **kwargs)]
+        delay = self.hedge_delay()
+        if delay is not None and delay < timeout:
+            done, _ = wait_futures(futures, timeout=delay)
+            if not done:
+                self.stats["hedge"] += 1
+                futures.append(self.pool.submit(self.client.models.generate_content, **kwargs))
+        error = None
+        while futures:
+            done, _ = wait_futures(futures, timeout=max(0.0, started + timeout - time.monotonic()),
+                                   return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for f in done:
+                futures.remove(f)
+                if f.exception() is None:
+                    for other in futures:
+                        other.cancel()
+                    self._succeeded(started)
+                    return f.result()
+                error = f.exception()
+        if futures or error is None:
+            for f in futures:
+                f.cancel()
+            self.stats["timeout"] += 1
+            raise TimeoutError(f"Gemini tidak menjawab dalam {timeout:.1f}s")
+        raise error
+
+    async def _aattempt(self, kwargs: dict, timeout: float):
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+
+        def submit():
+            return loop.run_in_executor(self.pool, lambda: self.client.models.generate_content(**kwargs))
+
+        tasks = {submit()}
+        delay = self.hedge_delay()
+        if delay is not None and delay < timeout:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self.stats["hedge"] += 1
+                tasks.add(submit())
+        error = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, timeout=max(0.0, started + timeout - time.monotonic()),
+                                             return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for t in done:
+                if t.exception() is None:
+                    for other in tasks:
+                        other.cancel()
+                    self._succeeded(started)
+                    return t.result()
+                error = t.exception()
+        if tasks or error is None:
+            for t in tasks:
+                t.cancel()
+            self.stats["timeout"] += 1
+            raise TimeoutError(f"Gemini tidak menjawab dalam {timeout:.1f}s")
+        raise error
+
+    # --- API publik ---
+    def generate_content(self, **kwargs):
+        self._admit()
+        end = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            remaining = end - time.monotonic()
+            try:
+                return self._attempt(kwargs, min(self.timeout, remaining))
+            except Exception as e:
+                time.sleep(self._failed(e, attempt, remaining))
+            attempt += 1
+
+    async def agenerate_content(self, **kwargs):
+        self._admit()
+        end = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            remaining = end - time.monotonic()
+            try:
+                return await self._aattempt(kwargs, min(self.timeout, remaining))
+            except Exception as e:
+                await asyncio.sleep(self._failed(e, attempt, remaining))
+            attempt += 1
+
+    def generate_content_stream(self, **kwargs):
+        """Retry hanya sebelum potongan pertama; setelah itu tiap potongan diberi timeout."""
+        self._admit()
+        end = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            remaining = end - time.monotonic()
+            started = time.monotonic()
+            try:
+                it = iter(self.client.models.generate_content_stream(**kwargs))
+                first = self._next(it, min(self.timeout, remaining))
+                break
+            except Exception as e:
+                time.sleep(self._failed(e, attempt, remaining))
+            attempt += 1
+        self._succeeded(started)
+        chunk = first
+        while chunk is not _STREAM_END:
+            yield chunk
+            try:
+                chunk = self._next(it, self.timeout)
+            except Exception as e:
+                if not isinstance(e, genai_errors.APIError) and not _gemini_retryable(e):
+                    raise
+                self.stats["error"] += 1
+                if _gemini_retryable(e):
+                    self.breaker.failure()
+                raise GeminiUnavailable(f"stream Gemini terputus: {e}") from e
+
+    def _next(self, it, timeout: float):
+        f = self.pool.submit(next, it, _STREAM_END)
+        try:
+            return f.result(timeout=timeout)
+        except FutureTimeout:
+            self.stats["timeout"] += 1
+            raise TimeoutError(f"Gemini tidak mengirim potongan dalam {timeout:.1f}s")
+
+_STREAM_END = object()
+gemini = ResilientGemini(client)
 
 # ==================== Load JSON data ====================
+# trisakti_info.json dimuat menjadi snapshot yang tidak pernah diubah: data +
+# versi (sha1 isi file, sama di semua worker sehingga ai_cache/L1/balasan lokal
+# bisa memakainya sebagai kunci invalidasi) + struktur turunan (index retrieval,
+# prefix prompt, timeline pendaftaran, router). Struktur turunan didaftarkan di
+# bagiannya masing-masing lewat knowledge.derive(). Thread watcher per worker
+# memeriksa mtime file; bila isinya berubah snapshot baru dibangun di thread itu
+# lalu referensinya ditukar, jadi permintaan tidak pernah melihat data setengah jadi.
 JSON_PATH = os.path.join(os.path.dirname(__file__), "trisakti_info.json")
-try:
-    with open(JSON_PATH, "r", encoding="utf-8") as jf:
-        TRISAKTI = json.load(jf)
-    ig = TRISAKTI.get("institution", {}).get("contact", {}).get("instagram", "")
+KB_WATCH_SECS = float(os.getenv("KB_WATCH_SECS", "5"))  # 0 = tanpa hot reload
+KB_FALLBACK = {
+    "institution": {"contact": {"whatsapp": "+6287742997808", "instagram": "tmm_trisakti"}}
+}
+
+def parse_kb(raw: bytes) -> dict:
+    data = json.loads(raw.decode("utf-8"))
+    ig = data.get("institution", {}).get("contact", {}).get("instagram", "")
     if ig:
         ig = ig.split("/")[-1].strip("@")
-        TRISAKTI["institution"]["contact"]["instagram"] = ig
+        data["institution"]["contact"]["instagram"] = ig
+    # tanggal/jam kosong diisi per permintaan di _build_prompt, bukan dibekukan saat load
+    ctx = data.setdefault("current_context", {})
+    for key in ("date", "time"):
+        if not ctx.get(key):
+            ctx.pop(key, None)
+    return data
+
+class KBSnapshot:
+    __slots__ = ("version", "data", "loaded_at", "derived")
+
+    def __init__(self, version: str, data: dict):
+        self.version, self.data = version, data
+        self.loaded_at = datetime.now()
+        self.derived = {}
+
+    def __getitem__(self, name):
+        return self.derived[name]
+
+class KnowledgeBase:
+    def __init__(self, path: str, watch_secs: float):
+        self.path, self.watch_secs = path, watch_secs
+        self.builders = {}  # nama -> build(data), urutan pendaftaran
+        self.lock = threading.Lock()
+        self.mtime = None
+        self.reloads = 0
+        self.watcher_pid = None
+        self.snapshot = self._initial()
+
+    def _initial(self) -> KBSnapshot:
+        try:
+            self.mtime = os.stat(self.path).st_mtime_ns
+            with open(self.path, "rb") as f:
+                raw = f.read()
+            snap = KBSnapshot(hashlib.sha1(raw).hexdigest()[:12], parse_kb(raw))
+            logger.info("✅ trisakti_info.json dimuat: %s", snap.data.get("institution", {}).get("name"))
+            return snap
+        except Exception as e:
+            logger.critical("Gagal memuat trisakti_info.json: %s", str(e))
+            return KBSnapshot("", json.loads(json.dumps(KB_FALLBACK)))
+
+    def derive(self, name: str, build):
+        """Daftarkan struktur turunan; dibangun untuk snapshot ini dan setiap reload."""
+        self.builders[name] = build
+        self.snapshot.derived[name] = build(self.snapshot.data)
+
+    def current(self) -> KBSnapshot:
+        if self.watch_secs > 0 and self.watcher_pid != os.getpid():
+            self.watcher_pid = os.getpid()
+            threading.Thread(target=self._watch_loop, name="kb-watch", daemon=True).start()
+        return self.snapshot
+
+    @property
+    def version(self) -> str:
+        return self.snapshot.version
+
+    def reload(self) -> bool:
+        """Muat ulang bila isi file berubah -> True bila snapshot ditukar."""
+        with self.lock:
+            t0 = time.perf_counter()
+            old = self.snapshot
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+                with open(self.path, "rb") as f:
+                    raw = f.read()
+                self.mtime = mtime  # file setengah tertulis dicoba lagi saat mtime berubah
+                version = hashlib.sha1(raw).hexdigest()[:12]
+                if version == old.version:
+                    return False
+                snap = KBSnapshot(version, parse_kb(raw))
+                for name, build in self.builders.items():
+                    snap.derived[name] = build(snap.data)
+            except Exception as e:
+                logger.error("Reload trisakti_info.json gagal, data lama tetap dipakai: %s", e)
+                return False
+            self.snapshot = snap
+            self.reloads += 1
+        logger.info("🔄 trisakti_info.json dimuat ulang: %s -> %s (%.0f ms)",
+                    old.version, snap.version, (time.perf_counter() - t0) * 1000)
+        return True
 
-    now = datetime.now()
-    TRISAKTI.setdefault("current_context", {})
-    TRISAKTI["current_context"]["date"] = TRISAKTI["current_context"].get("date") or now.strftime("%d %B %Y")
-    TRISAKTI["current_context"]["time"] = TRISAKTI["current_context"].get("time") or now.strftime("%H:%M WIB")
-    logger.info("✅ trisakti_info.json dimuat: %s", TRISAKTI.get("institution", {}).get("name"))
-except Exception as e:
-    logger.critical("Gagal memuat trisakti_info.json: %s", str(e))
-    TRISAKTI = {
-        "institution": {"contact": {"whatsapp": "+6287742997808", "instagram": "tmm_trisakti"}}
-    }
+    def _watch_loop(self):
+        while True:
+            time.sleep(self.watch_secs)
+            try:
+                if os.stat(self.path).st_mtime_ns != self.mtime:
+                    self.reload()
+            except OSError:
+                pass
+
+knowledge = KnowledgeBase(JSON_PATH, KB_WATCH_SECS)
+
+# ==================== Retrieval (BM25) ====================
+# trisakti_info.json dipecah per bagian/item saat load. Prompt AI hanya memuat
+# data inti, bagian yang terkait kategori, dan top-k potongan hasil BM25.
+PROMPT_RETRIEVAL = os.getenv("PROMPT_RETRIEVAL", "1") == "1"
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "6"))
+KB_SKIP_SECTIONS = ("keywords", "misc")
+KB_CORE = (
+    ("institution", "name"), ("institution", "official_abbreviation"),
+    ("institution", "address"), ("institution", "contact"), ("institution", "website"),
+    ("current_context", None),
+)
+CATEGORY_SECTIONS = {
+    "prodi": ("academic_programs", "accreditation"),
+    "beasiswa": ("scholarships", "kip_schedule", "kip_contact"),
+    "pendaftaran": ("registration", "admission_process", "payment"),
+    "fasilitas": ("facilities",),
+    "testimoni": ("testimonials",),
+}
+
+# nama key JSON berbahasa Inggris -> kata yang dipakai pengguna
+KB_KEY_ALIASES = {
+    "history": "sejarah", "foundation_year": "tahun berdiri didirikan", "vision": "visi",
+    "mission": "misi", "why_choose": "keunggulan kenapa memilih", "address": "alamat lokasi",
+    "contact": "kontak hubungi telepon", "academic_programs": "prodi jurusan program studi",
+    "accreditation": "akreditasi", "facilities": "fasilitas", "payment": "biaya bayar",
+    "admission_process": "seleksi tes masuk", "scholarships": "beasiswa",
+    "student_activities": "kegiatan mahasiswa", "faq": "pertanyaan", "events": "acara kegiatan",
+    "academic_calendar": "kalender akademik jadwal kuliah", "collaborations": "kerja sama kolaborasi",
+    "testimonials": "testimoni alumni", "requirements": "syarat persyaratan",
+}
+
+def _tokens(text: str) -> list:
+    return re.findall(r"[^\W_]+", (text or "").lower())
+
+def _flatten_text(value) -> str:
+    if isinstance(value, dict):
+        return " ".join(f"{k} {_flatten_text(v)}" for k, v in value.items())
+    if isinstance(value, list):
+        return " ".join(_flatten_text(v) for v in value)
+    return str(value)
+
+def _kb_chunks(data: dict) -> list:
+    """Potongan (section, key, value): sub-key untuk dict, item untuk list."""
+    chunks = []
+    for section, value in data.items():
+        if section in KB_SKIP_SECTIONS:
+            continue
+        if isinstance(value, dict) and section != "current_context":
+            chunks += [(section, k, v) for k, v in value.items()]
+        elif isinstance(value, list):
+            chunks += [(section, i, v) for i, v in enumerate(value)]
+        else:
+            chunks.append((section, None, value))
+    return chunks
+
+class BM25Index:
+    def __init__(self, docs: list, k1: float = 1.5, b: float = 0.75):
+        self.k1, self.b = k1, b
+        self.postings = {}  # term -> [(doc, tf)]
+        self.lengths = []
+        for i, doc in enumerate(docs):
+            tf = Counter(_tokens(doc))
+            self.lengths.append(sum(tf.values()))
+            for term, n in tf.items():
+                self.postings.setdefault(term, []).append((i, n))
+        n_docs = len(docs) or 1
+        self.avg_len = (sum(self.lengths) / n_docs) or 1.0
+        self.idf = {
+            t: math.log(1 + (n_docs - len(p) + 0.5) / (len(p) + 0.5))
+            for t, p in self.postings.items()
+        }
+
+    def search(self, query: str, k: int) -> list:
+        scores = {}
+        for term in set(_tokens(query)):
+            idf = self.idf.get(term)
+            if not idf:
+                continue
+            for doc, tf in self.postings[term]:
+                norm = tf + self.k1 * (1 - self.b + self.b * self.lengths[doc] / self.avg_len)
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return sorted(scores, key=scores.get, reverse=True)[:k]
+
+def build_knowledge_index(data: dict) -> dict:
+    chunks = _kb_chunks(data)
+    docs = []
+    for sec, key, val in chunks:
+        key = key if isinstance(key, str) else ""
+        docs.append(f"{sec} {KB_KEY_ALIASES.get(sec, '')} {key} {KB_KEY_ALIASES.get(key, '')} {_flatten_text(val)}")
+    by_section = {}
+    for i, (sec, key, _) in enumerate(chunks):
+        by_section.setdefault(sec, []).append(i)
+    core = [i for i, (sec, key, _) in enumerate(chunks) if (sec, key if isinstance(key, str) else None) in KB_CORE]
+    return {"chunks": chunks, "bm25": BM25Index(docs), "by_section": by_section, "core": core}
+
+def _render_chunks(chunks: list, ids) -> str:
+    out = {}
+    for i in sorted(set(ids)):
+        sec, key, val = chunks[i]
+        if key is None:
+            out[sec] = val
+        elif isinstance(key, int):
+            out.setdefault(sec, []).append(val)
+        else:
+            out.setdefault(sec, {})[key] = val
+    return json.dumps(out, ensure_ascii=False)
+
+def retrieve_knowledge(question: str, category: str = "general", k: int = RETRIEVAL_TOP_K, kb=None) -> str:
+    """Potongan trisakti_info.json yang relevan (JSON) untuk dimasukkan ke prompt."""
+    kb = kb or knowledge.current()
+    index = kb["index"]
+    if not PROMPT_RETRIEVAL or not index["chunks"]:
+        return json.dumps(kb.data, ensure_ascii=False)
+    ids = list(index["core"])
+    for sec in CATEGORY_SECTIONS.get(category, ()):
+        ids += index["by_section"].get(sec, [])
+    ids += index["bm25"].search(question, k)
+    return _render_chunks(index["chunks"], ids)
+
+knowledge.derive("index", build_knowledge_index)
+
+# ==================== Prompt template ====================
+# Bagian statis prompt (persona + data penuh bila retrieval mati) dirender sekali
+# per versi data. Prefix ini bisa disimpan sebagai context cache Gemini agar
+# tidak ditagih dan diproses ulang di setiap permintaan.
+PROMPT_PERSONA = (
+    "Kamu adalah TIMU, asisten dari Trisakti School of Multimedia (TMM). "
+    "Gaya bicara: manusiawi, hangat, ringkas, tidak kaku. "
+    "Gunakan BAHASA INDONESIA sebagai default. "
+    "Gunakan bahasa lain (Inggris/Jawa/Sunda) HANYA jika pengguna menulis dalam bahasa tersebut. "
+    "Jangan menyebut 'saya asisten AI'. Gunakan data berikut bila relevan:\n\n"
+)
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "auto").lower()  # auto | gemini | local | off
+GEMINI_CACHE_TTL = int(os.getenv("GEMINI_CACHE_TTL", "3600"))  # detik
+
+def build_prompt_prefix(data: dict) -> str:
+    if PROMPT_RETRIEVAL:
+        return PROMPT_PERSONA
+    return PROMPT_PERSONA + json.dumps(data, ensure_ascii=False) + "\n\n"
+
+knowledge.derive("prompt_prefix", build_prompt_prefix)
+
+class PromptContextCache(ABC):
+    """Memetakan prefix statis ke nama cached content; dibuat ulang bila prefix berubah
+    atau TTL habis. Kegagalan membuat cache menonaktifkannya sementara."""
+
+    COOLDOWN = 600
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entry = None         # (sha1 prefix, nama cache, expires_at)
+        self.disabled_until = 0.0
+
+    @abstractmethod
+    def _create(self, prefix: str) -> str:
+        """Buat cached content untuk prefix dan kembalikan namanya."""
+
+    def name_for(self, prefix: str):
+        now = time.time()
+        if now < self.disabled_until:
+            return None
+        key = hashlib.sha1(prefix.encode("utf-8")).hexdigest()
+        with self.lock:
+            if self.entry and self.entry[0] == key and self.entry[2] - 60 > now:
+                return self.entry[1]
+            try:
+                name = self._create(prefix)
+            except Exception as e:
+                logger.warning("Context cache tidak tersedia: %s", e)
+                self.disabled_until = now + self.COOLDOWN
+                self.entry = None
+                return None
+            self.entry = (key, name, now + self.ttl)
+            return name
+
+    def request(self, prefix: str, dynamic: str) -> dict:
+        """Argumen generate_content: pakai cached content bila ada, jika tidak kirim utuh."""
+        name = self.name_for(prefix)
+        if not name:
+            return {"model": GEMINI_MODEL, "contents": prefix + dynamic}
+        return {"model": GEMINI_MODEL, "contents": dynamic,
+                "config": genai_types.GenerateContentConfig(cached_content=name)}
+
+class GeminiContextCache(PromptContextCache):
+    def _create(self, prefix: str) -> str:
+        cached = client.caches.create(
+            model=GEMINI_MODEL,
+            config=genai_types.CreateCachedContentConfig(
+                contents=[prefix], ttl=f"{self.ttl}s", display_name="timu-prompt-prefix"
+            ),
+        )
+        logger.info("🧊 Context cache Gemini dibuat: %s", cached.name)
+        return cached.name
+
+class LocalContextCache(PromptContextCache):
+    """Stub lokal (tes/benchmark): menyimpan prefix di memori, tanpa jaringan."""
+
+    def __init__(self, ttl: int):
+        super().__init__(ttl)
+        self.store = {}
+        self.created = 0
+        self.hits = 0
+
+    def _create(self, prefix: str) -> str:
+        self.created += 1
+        name = f"local/{hashlib.sha1(prefix.encode('utf-8')).hexdigest()[:16]}"
+        self.store[name] = prefix
+        return name
+
+    def request(self, prefix: str, dynamic: str) -> dict:
+        name = self.name_for(prefix)
+        if name:
+            self.hits += 1
+            return {"model": GEMINI_MODEL, "contents": self.store[name] + dynamic}
+        return {"model": GEMINI_MODEL, "contents": prefix + dynamic}
+
+class NoContextCache(PromptContextCache):
+    # context caching mati: prefix selalu dikirim utuh
+    def _create(self, prefix: str):
+        return None
+
+    def name_for(self, prefix: str):
+        return None
+
+def _make_context_cache() -> PromptContextCache:
+    mode = GEMINI_CONTEXT_CACHE
+    if mode == "auto":
+        # prefix persona saja terlalu kecil untuk context caching Gemini
+        mode = "off" if PROMPT_RETRIEVAL else "gemini"
+    if mode == "gemini":
+        return GeminiContextCache(GEMINI_CACHE_TTL)
+    if mode == "local":
+        return LocalContextCache(GEMINI_CACHE_TTL)
+    return NoContextCache(GEMINI_CACHE_TTL)
+
+context_cache = _make_context_cache()
 
 # ==================== SymSpell ====================
-symspell = SymSpell(max_dictionary_edit_distance=2, prefix_length=7)
+# Index delete SymSpell dibangun langsung dari kamus (~3000 kata, hitungan
+# milidetik) -- sengaja tanpa snapshot pickle: memuat pickle dari direktori
+# bersama seperti /tmp sama dengan mengeksekusi file yang bisa ditanam orang lain.
+# Koreksi per kata di-memo dengan LRU karena kosakata chat sangat berulang.
+SYMSPELL_MAX_EDIT = 2
+SYMSPELL_PREFIX_LEN = 7
+SYMSPELL_MEMO_SIZE = 4096
+symspell = SymSpell(max_dictionary_edit_distance=SYMSPELL_MAX_EDIT, prefix_length=SYMSPELL_PREFIX_LEN)
 DICT_PATH = os.path.join(os.path.dirname(__file__), "indonesia_dictionary_3000.txt")
+
+def _load_symspell() -> bool:
+    # Kamus bertab tapi dimuat dengan separator default (spasi) seperti semula.
+    # Jangan ganti ke "\t" tanpa gating: 451 kata domain akan menulis ulang kata
+    # umum ("saya" -> "biaya") dan quick reply ("iya"), lihat tests/test_typo.py.
+    return symspell.load_dictionary(DICT_PATH, 0, 1)
+
 _symspell_loaded = False
 try:
-    _symspell_loaded = symspell.load_dictionary(DICT_PATH, 0, 1)
+    _symspell_loaded = _load_symspell()
 except Exception as e:
     logger.warning("⚠️ Kamus SymSpell gagal dimuat: %s. Koreksi typo dinonaktifkan.", e)
 
+@lru_cache(maxsize=SYMSPELL_MEMO_SIZE)
+def _correct_word(word: str) -> str:
+    # kata yang sudah ada di kamus tidak perlu lookup (hasilnya pasti kata itu sendiri)
+    if word in symspell.words:
+        return word
+    suggestions = symspell.lookup(word, Verbosity.CLOSEST, max_edit_distance=SYMSPELL_MAX_EDIT)
+    return suggestions[0].term if suggestions else word
+
 def correct_typo(text: str) -> str:
     if not _symspell_loaded:
         return text
-    corrected = []
-    for word in text.split():
-        suggestions = symspell.lookup(word, Verbosity.CLOSEST, max_edit_distance=2)
-        corrected.append(suggestions[0].term if suggestions else word)
-    return " ".join(corrected)
+    return " ".join(_correct_word(word) for word in text.split())
 
 # ==================== Utils ====================
-def detect_language(text: str) -> str:
+# Deteksi bahasa bertingkat: skor stopword + n-gram karakter menyelesaikan
+# sebagian besar pesan dalam mikrodetik; langdetect hanya untuk yang ambigu.
+LANG_STOPWORDS = {
+    "id": set("yang dan di ke dari ini itu apa bagaimana berapa kapan dimana siapa tidak bisa ada "
+              "untuk dengan saya aku kamu kak mau ingin tanya apakah caranya "
+              "sudah belum juga atau karena kalau masih boleh dong ya gimana gak nggak".split()),
+    "en": set("the and is are what how when where who which can do does i you to of in for with "
+              "about is there my your want need please apply course fee tuition major".split()),
+    "jv": set("opo piye pripun kepiye sing lan karo ora mboten aku kowe sampeyan panjenengan "
+              "iki kuwi wis durung arep pengen saged iso ngendi endi piro pinten nggih carane neng "
+              "kono kene ning nang "
+              "inggih monggo matur nuwun".split()),
+    "su": set("naon kumaha iraha dimana saha abdi anjeun urang teu henteu aya bade hoyong tiasa "
+              "sabaraha ieu eta mah teh atuh nuhun hatur pun oge sareng kana carana dieu ditu".split()),
+}
+LANG_NGRAMS = {
+    "id": ("nya ", "kan ", "ang ", " me", " ber"),
+    "en": ("ing ", "tion", "th", " wh", "ou"),
+    "jv": ("ipun", "ake ", "dh", "opo", "ne "),
+    "su": ("eu", "na ", " teh", "keun", "mah "),
+}
+LANG_NGRAM_WEIGHT = 0.25
+LANG_MIN_SCORE = 2.0
+LANG_MARGIN = 1.5  # skor terbaik harus >= 1.5x skor kedua
+LANGDETECT_SEED = int(os.getenv("LANGDETECT_SEED", "0"))  # hasil deterministik
+
+# langdetect (+ ~55 profil bahasa, ~0.3 detik) baru dimuat saat pesan ambigu
+# pertama; di mode preload gunicorn master memuatnya sebelum fork (warm_shared_state).
+_langdetect_lock = threading.Lock()
+_langdetect_fn = None
+
+def _langdetect():
+    global _langdetect_fn
+    if _langdetect_fn is None:
+        with _langdetect_lock:
+            if _langdetect_fn is None:
+                from langdetect import detect, DetectorFactory
+                from langdetect.detector_factory import init_factory
+                DetectorFactory.seed = LANGDETECT_SEED
+                try:
+                    init_factory()
+                except Exception as e:
+                    logger.warning("Profil langdetect gagal dimuat: %s", e)
+                _langdetect_fn = detect
+    return _langdetect_fn
+
+def _score_language(text: str):
+    words = text.split()
+    padded = f" {text} "
+    scores = {}
+    for lang, stop in LANG_STOPWORDS.items():
+        sc = sum(1 for w in words if w in stop)
+        sc += LANG_NGRAM_WEIGHT * sum(padded.count(g) for g in LANG_NGRAMS[lang])
+        scores[lang] = sc
+    ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+    (best, s1), (_, s2) = ranked[0], ranked[1]
+    if s1 >= LANG_MIN_SCORE and s1 >= LANG_MARGIN * s2:
+        return best
+    return None
+
+@lru_cache(maxsize=2048)
+def _detect_language_norm(norm: str) -> str:
     try:
-        if len(text.strip().split()) < 3:
-            return "id"
-        return detect(text) or "id"
+        return _score_language(norm) or _langdetect()(norm) or "id"
     except Exception:
         return "id"
 
+def detect_language(text: str) -> str:
+    norm = " ".join(re.sub(r"[^\w\s]", " ", (text or "").lower()).split())
+    if len(norm.split()) < 3:
+        return "id"
+    return _detect_language_norm(norm)
+
 def clean_response(text):
     return re.sub(r"[*`]+", "", text or "")
 
-def format_links(text):
+def format_links(text, seen=None):
     if not text:
         return text
-    seen = set()
+    seen = set() if seen is None else seen
     def repl(match):
         url = match.group(0)
         if re.search(r"<a\s+href=", url, flags=re.I):
@@ -165,13 +855,261 @@ def format_links(text):
 BLEACH_TAGS = ["a", "b", "strong", "em", "br"]
 BLEACH_ATTRS = {"a": ["href", "target", "rel"]}
 BLEACH_PROTOCOLS = ["http", "https"]
-def sanitize_html(html_text: str) -> str:
+def bleach_clean(html_text: str) -> str:
     return bleach.clean(html_text or "", tags=BLEACH_TAGS, attributes=BLEACH_ATTRS,
                         protocols=BLEACH_PROTOCOLS, strip=True)
 
+# ====== Sanitizer cepat untuk allowlist di atas ======
+# Satu scan linear: tag yang diizinkan diserialisasi ulang, tag lain dibuang,
+# teks di-escape, dan (format_reply) URL polos dijadikan link sekaligus.
+# Hasilnya identik dengan bleach_clean(format_links(...)). Konstruksi yang
+# jarang/ambigu (komentar, tag bersilang, atribut tanpa kutip, karakter
+# kontrol, ...) dilempar ke bleach agar jalur cepat tidak pernah menebak.
+# Bukti kesetaraan: bench/sanitizer_fuzz.py (fuzz diferensial vs bleach).
+_TAG_RE = re.compile(
+    r"<(/?)([A-Za-z][^\t\n\x0c />]*)"
+    r"((?:[\t\n\x0c ]+[^\t\n\x0c />\"'<=]+(?:[\t\n\x0c ]*=[\t\n\x0c ]*(?:\"[^\"]*\"|'[^']*'))?)*)"
+    r"[\t\n\x0c ]*(/?)>"
+)
+_ATTR_RE = re.compile(r"([^\t\n\x0c />\"'<=]+)(?:[\t\n\x0c ]*=[\t\n\x0c ]*(?:\"([^\"]*)\"|'([^']*)'))?")
+_URL_RE = re.compile(r"(?<!href=['\"])(https?://[^\s<>'\"()]+)")
+_WS_RUN_RE = re.compile(r"\s{2,}")
+_UNSAFE_CHARS_RE = re.compile("[\x00-\x08\x0b-\x1f\x7f\ufffd\ue000]")
+# href yang pasti lolos filter protokol bleach: http(s) absolut atau relatif tanpa ":"/entitas
+_HREF_OK_RE = re.compile(r"(?:https?://[^\x00-\x20\x7f-\xa0'\"<>]*|[^\x00-\x20\x7f-\xa0'\"<>:&]*)\Z", re.I)
+_LINK_MARK = "\ue000"
+_FORMATTING_TAGS = ("a", "b", "strong", "em")
+_TAG_NOT_TEXT = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ/!?")
+
+class _SanitizerBail(Exception):
+    """Input di luar subset yang dijamin identik; serahkan ke bleach."""
+
+def _text_tokens(s: str, run: list):
+    """Pecah teks jadi token seperti bleach: (False, karakter) / (True, nama entitas)."""
+    if "&" not in s:
+        run.append((False, s))
+        return
+    for part in next_possible_entity(s):
+        if part.startswith("&"):
+            ent = match_entity(part)
+            if ent is not None:
+                # &amp; jadi karakter "&" biasa, entitas lain dibiarkan apa adanya
+                run.append((False, "&") if ent == "amp" else (True, ent))
+                part = part[len(ent) + 2:]
+        if part:
+            run.append((False, part))
+
+def _flush_text(run: list, out: list, after_end_tag: bool):
+    # Serializer bleach menganggap dirinya masih "di dalam tag" setelah end tag
+    # sampai start tag berikutnya; di sana token teks "=" membuat entitas
+    # sesudahnya diperlakukan sebagai nilai atribut. Ditiru agar hasil identik
+    # (spasi HTML di awal node teks adalah token tersendiri).
+    chars, prev, first = [], None, True
+    for is_entity, data in run + [(True, None)]:
+        if not is_entity:
+            chars.append(data)
+            continue
+        if chars:
+            prev = "".join(chars)
+            chars.clear()
+            out.append(prev.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;"))
+            if first:
+                prev = prev.lstrip("\t\n\x0c\r ")
+        first = False
+        if data is None:
+            break
+        if after_end_tag and prev == "=" and convert_entity(data) is None:
+            out.append(f"&amp;{data};")
+        else:
+            out.append(f"&{data};")
+        prev = None
+    run.clear()
+
+def _escape_attr(v: str) -> str:
+    v = v.replace("<", "&lt;")
+    if "&" not in v:
+        return v
+    # & polos di-escape; entitas valid yang tidak ambigu dibiarkan (seperti bleach)
+    out = []
+    for part in next_possible_entity(v):
+        if part.startswith("&"):
+            ent = match_entity(part)
+            if ent is not None and convert_entity(ent) is not None:
+                out.append(f"&{ent};")
+                out.append(part[len(ent) + 2:])
+                continue
+        out.append(part.replace("&", "&amp;"))
+    return "".join(out)
+
+_LINK_OPEN = '<a href="{}" target="_blank" rel="noopener noreferrer nofollow">'
+
+def _tokenize_html(text: str):
+    """-> [(None, teks) | (match tag, sumber)], raise _SanitizerBail bila ambigu."""
+    tokens, pos, run_start, n = [], 0, 0, len(text)
+    while True:
+        lt = text.find("<", pos)
+        if lt < 0:
+            break
+        m = _TAG_RE.match(text, lt)
+        if m is None:
+            if lt + 1 < n and text[lt + 1] in _TAG_NOT_TEXT:
+                raise _SanitizerBail
+            pos = lt + 1  # "<" biasa (mis. "a < b") tetap teks
+            continue
+        if lt > run_start:
+            tokens.append((None, text[run_start:lt]))
+        tokens.append((m, m.group(0)))
+        pos = run_start = m.end()
+    if run_start < n:
+        tokens.append((None, text[run_start:]))
+    return tokens
+
+def _fast_clean(text: str, linkify: bool = False, seen=None, new_seen=None) -> str:
+    if _UNSAFE_CHARS_RE.search(text):
+        raise _SanitizerBail
+    out, run, stack = [], [], []
+    emitted_tag = False   # bleach: tag blok yang dibuang jadi "\n" hanya setelah tag pertama
+    after_end = False     # tag terakhir yang ditulis adalah end tag
+
+    def emit_tag(html: str, end: bool = False):
+        nonlocal emitted_tag, after_end
+        if run:
+            _flush_text(run, out, after_end)
+        out.append(html)
+        emitted_tag, after_end = True, end
+
+    links = []
+    if linkify:
+        # format_links di level string: URL -> penanda, rapikan spasi, strip
+        def repl(m):
+            url = m.group(0)
+            key = url.strip().rstrip("/").lower()
+            if key in seen or key in new_seen:
+                return ""
+            new_seen.add(key)
+            links.append(url)
+            return _LINK_MARK
+        text = _WS_RUN_RE.sub(" ", _URL_RE.sub(repl, text)).strip()
+    tokens = _tokenize_html(text)
+    link_iter = iter(links)
+
+    for m, src in tokens:
+        if m is None:
+            pieces = src.split(_LINK_MARK) if links else (src,)
+            _text_tokens(pieces[0], run)
+            for piece in pieces[1:]:
+                if "a" in stack:
+                    raise _SanitizerBail  # link di dalam <a>: html5lib menutup <a> luar
+                url = next(link_iter)
+                emit_tag(_LINK_OPEN.format(_escape_attr(url)))
+                _text_tokens("🔗 " + url, run)
+                emit_tag("</a>", end=True)
+                _text_tokens(piece, run)
+            continue
+        if links and _LINK_MARK in src:
+            raise _SanitizerBail  # URL di dalam atribut
+        attrs_src = m.group(3)
+        closing, name, self_closing = m.group(1) == "/", m.group(2), m.group(4) == "/"
+        if name.isascii():
+            name = name.lower()
+        if name not in BLEACH_TAGS:
+            if not closing and name in HTML_TAGS_BLOCK_LEVEL and emitted_tag:
+                run.append((False, "\n"))
+            emitted_tag = True
+            continue
+        if name == "br":
+            if closing:
+                raise _SanitizerBail
+            emit_tag("<br>")
+            continue
+        if closing:
+            if stack and stack[-1] == name:
+                stack.pop()
+                emit_tag(f"</{name}>", end=True)
+            elif name in stack:
+                raise _SanitizerBail  # tag bersilang: adoption agency html5lib
+            else:
+                emitted_tag = True
+            continue
+        if self_closing or (name == "a" and "a" in stack):
+            raise _SanitizerBail
+        stack.append(name)
+        if name != "a":
+            emit_tag(f"<{name}>")
+            continue
+        attrs = {}
+        for am in _ATTR_RE.finditer(attrs_src):
+            key = am.group(1)
+            key = key.lower() if key.isascii() else key
+            if key in attrs:
+                continue  # atribut ganda: yang pertama menang
+            value = am.group(2) if am.group(2) is not None else (am.group(3) or "")
+            attrs[key] = value
+        rendered = []
+        for key, value in attrs.items():
+            if key not in BLEACH_ATTRS["a"]:
+                continue
+            if "'" in value or '"' in value or (key == "href" and not _HREF_OK_RE.match(value)):
+                raise _SanitizerBail
+            rendered.append(f' {key}="{_escape_attr(value)}"')
+        emit_tag(f"<a{''.join(rendered)}>")
+    for name in reversed(stack):
+        emit_tag(f"</{name}>", end=True)
+    if run:
+        _flush_text(run, out, after_end)
+    return "".join(out)
+
+def sanitize_html(html_text: str) -> str:
+    if not html_text:
+        return ""
+    try:
+        return _fast_clean(html_text)
+    except _SanitizerBail:
+        return bleach_clean(html_text)
+
+def format_reply(text: str, seen=None) -> str:
+    """Setara sanitize_html(format_links(text, seen)) dalam satu pass."""
+    if not text:
+        return ""
+    seen = set() if seen is None else seen
+    new_seen = set()
+    try:
+        html = _fast_clean(text, linkify=True, seen=seen, new_seen=new_seen)
+    except _SanitizerBail:
+        return bleach_clean(format_links(text, seen))
+    seen.update(new_seen)
+    return html
+
 # ==================== SQLite Layer ====================
+# Satu koneksi per thread (dan per proses setelah fork), dipakai ulang oleh semua
+# fungsi di bawah. WAL membuat pembaca tidak memblokir penulis antar worker, dan
+# cached_statements menyimpan prepared statement yang sering dipakai.
+DB_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-8000",      # ~8 MB page cache
+    "PRAGMA mmap_size=67108864",    # 64 MB
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=10000",
+)
+_db_local = threading.local()
+
 def db_conn():
-    return sqlite3.connect(DB_PATH, timeout=10, check_same_thread=False)
+    conn = getattr(_db_local, "conn", None)
+    if conn is None or _db_local.pid != os.getpid():
+        conn = sqlite3.connect(DB_PATH, timeout=10, check_same_thread=False, cached_statements=256)
+        for pragma in DB_PRAGMAS:
+            conn.execute(pragma)
+        _db_local.conn, _db_local.pid = conn, os.getpid()
+    return conn
+
+def close_db_conn():
+    # koneksi SQLite tidak boleh dibawa melewati fork: saat objeknya ditutup/di-GC di
+    # anak, close() fd-nya melepas lock POSIX milik koneksi baru proses itu
+    conn = getattr(_db_local, "conn", None)
+    if conn is not None:
+        _db_local.conn = None
+        conn.close()
 
 def init_db():
     with db_conn() as conn:
@@ -195,18 +1133,205 @@ def init_db():
         )
         """)
         c.execute("CREATE INDEX IF NOT EXISTS idx_cache_q ON ai_cache(question_norm)")
+        # migrasi: signature MinHash + tabel bucket LSH untuk dedup
+        cols = {r[1] for r in c.execute("PRAGMA table_info(ai_cache)")}
+        if "sig" not in cols:
+            c.execute("ALTER TABLE ai_cache ADD COLUMN sig BLOB")
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS ai_cache_lsh (
+            bucket INTEGER NOT NULL,
+            cache_id INTEGER NOT NULL,
+            PRIMARY KEY (bucket, cache_id)
+        ) WITHOUT ROWID
+        """)
+        c.execute("CREATE INDEX IF NOT EXISTS idx_lsh_cache ON ai_cache_lsh(cache_id)")
+        # snapshot NgramIndex (bitmap per gram + metadata '#...'), lihat cache_index
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS ai_cache_ngram (
+            key TEXT PRIMARY KEY,
+            value BLOB NOT NULL
+        ) WITHOUT ROWID
+        """)
+        _backfill_lsh(conn)
+        # migrasi: metadata eviction (LRU/LFU/TTL)
+        if "last_hit_ts" not in cols:
+            c.execute("ALTER TABLE ai_cache ADD COLUMN last_hit_ts TEXT")
+            c.execute("UPDATE ai_cache SET last_hit_ts = ts WHERE last_hit_ts IS NULL")
+        if "kb_version" not in cols:
+            c.execute("ALTER TABLE ai_cache ADD COLUMN kb_version TEXT")
+            # baris lama dianggap dibuat dari data saat ini
+            c.execute("UPDATE ai_cache SET kb_version = ?", (knowledge.version,))
+        # migrasi: jawaban disanitasi sekali saat ditulis, bukan di setiap hit
+        if "sanitized" not in cols:
+            c.execute("ALTER TABLE ai_cache ADD COLUMN sanitized INTEGER NOT NULL DEFAULT 0")
+        legacy = c.execute("SELECT id, answer FROM ai_cache WHERE sanitized = 0").fetchall()
+        c.executemany("UPDATE ai_cache SET answer = ?, sanitized = 1 WHERE id = ?",
+                      [(sanitize_html(answer), cid) for cid, answer in legacy])
+        c.execute("CREATE INDEX IF NOT EXISTS idx_cache_ts ON ai_cache(ts)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_cache_last_hit ON ai_cache(last_hit_ts)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_cache_hits ON ai_cache(hits, last_hit_ts)")
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+        """)
+        # lease single-flight (pertanyaan yang sedang menunggu jawaban Gemini)
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS inflight (
+            key INTEGER PRIMARY KEY,
+            question_norm TEXT NOT NULL,
+            owner TEXT NOT NULL,
+            expires REAL NOT NULL
+        )
+        """)
+        c.execute("CREATE INDEX IF NOT EXISTS idx_inflight_owner ON inflight(owner)")
+        # sesi server-side: data kecil (JSON) + riwayat per giliran
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS sessions (
+            sid TEXT PRIMARY KEY,
+            data TEXT NOT NULL DEFAULT '{}',
+            expires REAL NOT NULL
+        ) WITHOUT ROWID
+        """)
+        c.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires)")
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS session_turns (
+            sid TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            PRIMARY KEY (sid, seq)
+        ) WITHOUT ROWID
+        """)
+        # statistik: kolom day berindeks + agregat yang dirawat saat insert
+        chat_cols = {r[1] for r in c.execute("PRAGMA table_info(chat_history)")}
+        if "day" not in chat_cols:
+            c.execute("ALTER TABLE chat_history ADD COLUMN day TEXT")
+            c.execute("UPDATE chat_history SET day = substr(ts, 1, 10)")
+        if "latency_ms" not in chat_cols:
+            c.execute("ALTER TABLE chat_history ADD COLUMN latency_ms REAL")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_chat_day ON chat_history(day)")
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS stats_hourly (
+            day TEXT NOT NULL,
+            hour INTEGER NOT NULL,
+            source TEXT NOT NULL,
+            chats INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, hour, source)
+        ) WITHOUT ROWID
+        """)
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS stats_questions (
+            question_norm TEXT PRIMARY KEY,
+            cnt INTEGER NOT NULL DEFAULT 0,
+            last_ts TEXT
+        )
+        """)
+        c.execute("CREATE INDEX IF NOT EXISTS idx_stats_q_cnt ON stats_questions(cnt)")
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS stats_latency (
+            day TEXT NOT NULL,
+            source TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            cnt INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, source, bucket)
+        ) WITHOUT ROWID
+        """)
+        if "day" not in chat_cols:
+            _backfill_stats(conn)
         conn.commit()
 
-def save_chat_db(user_msg: str, ai_msg: str, source: str = "ai"):
+def _backfill_stats(conn):
+    # sekali saat migrasi: bangun agregat dari riwayat yang sudah ada
+    conn.execute("""
+        INSERT OR REPLACE INTO stats_hourly (day, hour, source, chats)
+        SELECT substr(ts, 1, 10), CAST(substr(ts, 12, 2) AS INTEGER), source, COUNT(*)
+        FROM chat_history GROUP BY 1, 2, 3
+    """)
+    conn.execute("""
+        INSERT OR REPLACE INTO stats_questions (question_norm, cnt, last_ts)
+        SELECT LOWER(TRIM(user_msg)), COUNT(*), MAX(ts) FROM chat_history GROUP BY 1
+    """)
+    conn.execute("""
+        INSERT OR REPLACE INTO counters (name, value)
+        SELECT 'chats_' || source, COUNT(*) FROM chat_history GROUP BY source
+    """)
+    conn.execute("""
+        INSERT OR REPLACE INTO counters (name, value)
+        SELECT 'cache_hits', COALESCE(SUM(hits), 0) FROM ai_cache
+    """)
+
+# ====== Write-behind: chat_history + backup JSONL ======
+# Handler hanya memasukkan baris ke antrean; thread penulis menggabungkan
+# beberapa baris menjadi satu transaksi multi-row dan menambah backup JSONL.
+CHAT_WRITE_BATCH = 200
+CHAT_WRITE_INTERVAL = 1.0  # detik tunggu maksimal sebelum batch ditulis
+_chat_queue = queue.Queue()
+_chat_write_lock = threading.Lock()
+_chat_pending = threading.Event()
+_chat_writer = {"pid": None}
+
+def _daily_backup_json(rows):
+    if not BACKUP_JSON or not rows:
+        return
     try:
-        with db_conn() as conn:
-            conn.execute(
-                "INSERT INTO chat_history (ts, user_msg, ai_msg, source) VALUES (?, ?, ?, ?)",
-                (datetime.now().isoformat(), user_msg, ai_msg, source)
-            )
-            conn.commit()
+        by_day = {}
+        for r in rows:
+            by_day.setdefault(r[0][:10], []).append(r)
+        for day, items in by_day.items():
+            with open(CHAT_JSON_BACKUP.format(day=day), "a", encoding="utf-8") as f:
+                f.writelines(
+                    json.dumps({"timestamp": ts, "user": u, "ai": a, "source": src}, ensure_ascii=False) + "\n"
+                    for ts, u, a, src, _ in items
+                )
     except Exception as e:
-        logger.warning("Gagal insert chat_history: %s", e)
+        logger.warning("Backup JSON gagal: %s", e)
+
+def _drain_chat_queue():
+    # ambil + tulis di bawah lock: flush saat shutdown menunggu batch yang sedang ditulis
+    with _chat_write_lock:
+        rows = []
+        while len(rows) < CHAT_WRITE_BATCH:
+            try:
+                rows.append(_chat_queue.get_nowait())
+            except queue.Empty:
+                break
+        if not rows:
+            return 0
+        try:
+            with db_conn() as conn:
+                conn.executemany(
+                    "INSERT INTO chat_history (ts, day, user_msg, ai_msg, source, latency_ms) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [(ts, ts[:10], u, a, src, ms) for ts, u, a, src, ms in rows]
+                )
+                _stats_add(conn, rows)
+        except Exception as e:
+            logger.warning("Gagal insert chat_history (%d baris): %s", len(rows), e)
+        _daily_backup_json(rows)
+        return len(rows)
+
+def _chat_writer_loop():
+    while True:
+        _chat_pending.wait()
+        time.sleep(CHAT_WRITE_INTERVAL)  # beri kesempatan baris lain ikut satu batch
+        _chat_pending.clear()
+        flush_chat_writes()
+
+def flush_chat_writes():
+    """Tulis semua baris yang masih antre (dipanggil saat worker berhenti)."""
+    while _drain_chat_queue():
+        pass
+
+def save_chat_db(user_msg: str, ai_msg: str, source: str = "ai", latency_ms=None):
+    _chat_queue.put((datetime.now().isoformat(), user_msg, ai_msg, source, latency_ms))
+    _chat_pending.set()
+    if _chat_writer["pid"] != os.getpid():
+        _chat_writer["pid"] = os.getpid()
+        threading.Thread(target=_chat_writer_loop, name="chat-writer", daemon=True).start()
+
+atexit.register(flush_chat_writes)
 
 def read_latest_chats(limit=5):
     try:
@@ -221,35 +1346,120 @@ def read_latest_chats(limit=5):
         logger.warning("Gagal read_latest_chats: %s", e)
         return []
 
+def counter_add(conn, name: str, n: int = 1):
+    if n:
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, n)
+        )
+
+def read_counters(prefix: str = ""):
+    try:
+        with db_conn() as conn:
+            rows = conn.execute(
+                "SELECT name, value FROM counters WHERE name LIKE ? ORDER BY name", (prefix + "%",)
+            ).fetchall()
+            return {r[0]: r[1] for r in rows}
+    except Exception as e:
+        logger.warning("Gagal read_counters: %s", e)
+        return {}
+
+# ====== Statistik teragregasi ======
+# Dashboard membaca tabel agregat kecil (per jam/sumber, frekuensi pertanyaan,
+# histogram latensi) yang diperbarui di transaksi write-behind yang sama dengan
+# insert chat_history, jadi biayanya tidak tumbuh bersama riwayat.
+LATENCY_BUCKET_BASE = 1.25  # batas atas bucket ke-i: 1.25^i ms (resolusi ~25%)
+LATENCY_BUCKETS = 64
+STATS_LATENCY_DAYS = 7
+
+def _latency_bucket(ms: float) -> int:
+    return min(LATENCY_BUCKETS - 1, max(0, math.ceil(math.log(max(ms, 1.0), LATENCY_BUCKET_BASE))))
+
+def _bucket_percentile(buckets: dict, q: float) -> float:
+    """buckets: {bucket: jumlah} -> batas atas bucket yang memuat persentil q."""
+    total = sum(buckets.values())
+    seen = 0
+    for b in sorted(buckets):
+        seen += buckets[b]
+        if seen >= q * total:
+            return round(LATENCY_BUCKET_BASE ** b, 1)
+    return 0.0
+
+def _stats_add(conn, rows):
+    hourly, sources, latency = Counter(), Counter(), Counter()
+    for ts, _, _, source, ms in rows:
+        hourly[(ts[:10], int(ts[11:13]), source)] += 1
+        sources[source] += 1
+        if ms is not None:
+            latency[(ts[:10], source, _latency_bucket(ms))] += 1
+    conn.executemany(
+        "INSERT INTO stats_hourly (day, hour, source, chats) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(day, hour, source) DO UPDATE SET chats = chats + excluded.chats",
+        [(*key, n) for key, n in hourly.items()]
+    )
+    # normalisasi sama dengan query lama: LOWER(TRIM(user_msg))
+    conn.executemany(
+        "INSERT INTO stats_questions (question_norm, cnt, last_ts) VALUES (LOWER(TRIM(?)), 1, ?) "
+        "ON CONFLICT(question_norm) DO UPDATE SET cnt = cnt + 1, last_ts = MAX(last_ts, excluded.last_ts)",
+        [(u, ts) for ts, u, _, _, _ in rows]
+    )
+    conn.executemany(
+        "INSERT INTO stats_latency (day, source, bucket, cnt) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(day, source, bucket) DO UPDATE SET cnt = cnt + excluded.cnt",
+        [(*key, n) for key, n in latency.items()]
+    )
+    for source, n in sources.items():
+        counter_add(conn, f"chats_{source}", n)
+
 def stats_overview():
+    empty = {"total": 0, "today": 0, "cache_hits": 0, "top": [], "by_source": {},
+             "hourly": [0] * 24, "latency": {}}
     try:
+        today = date.today().isoformat()
+        since = (date.today() - timedelta(days=STATS_LATENCY_DAYS - 1)).isoformat()
+        counters = read_counters("")
         with db_conn() as conn:
-            total = conn.execute("SELECT COUNT(*) FROM chat_history").fetchone()[0]
-            today = conn.execute(
-                "SELECT COUNT(*) FROM chat_history WHERE date(ts)=date('now','localtime')"
-            ).fetchone()[0]
-            cache_hits = conn.execute(
-                "SELECT COALESCE(SUM(hits),0) FROM ai_cache"
-            ).fetchone()[0]
-            top = conn.execute("""
-                SELECT question_norm, COUNT(*) as cnt
-                FROM (
-                    SELECT LOWER(TRIM(user_msg)) as question_norm FROM chat_history
-                )
-                GROUP BY question_norm
-                ORDER BY cnt DESC
-                LIMIT 5
-            """).fetchall()
-            top_list = [{"question": r[0], "count": r[1]} for r in top]
-            return {"total": total, "today": today, "cache_hits": cache_hits, "top": top_list}
+            hourly = [0] * 24
+            for hour, n in conn.execute(
+                "SELECT hour, SUM(chats) FROM stats_hourly WHERE day = ? GROUP BY hour", (today,)
+            ):
+                hourly[hour] = n
+            top = conn.execute(
+                "SELECT question_norm, cnt FROM stats_questions ORDER BY cnt DESC LIMIT 5"
+            ).fetchall()
+            buckets = {}
+            for source, bucket, n in conn.execute(
+                "SELECT source, bucket, SUM(cnt) FROM stats_latency WHERE day >= ? GROUP BY source, bucket",
+                (since,)
+            ):
+                buckets.setdefault(source, {})[bucket] = n
+        by_source = {k[len("chats_"):]: v for k, v in counters.items() if k.startswith("chats_")}
+        return {
+            "total": sum(by_source.values()),
+            "today": sum(hourly),
+            "cache_hits": counters.get("cache_hits", 0),
+            "top": [{"question": r[0], "count": r[1]} for r in top],
+            "by_source": dict(sorted(by_source.items(), key=lambda kv: -kv[1])),
+            "hourly": hourly,
+            "latency": {
+                source: {"n": sum(b.values()), "p50_ms": _bucket_percentile(b, 0.50),
+                         "p95_ms": _bucket_percentile(b, 0.95)}
+                for source, b in sorted(buckets.items())
+            },
+        }
     except Exception as e:
         logger.warning("Gagal stats_overview: %s", e)
-        return {"total": 0, "today": 0, "cache_hits": 0, "top": []}
+        return empty
 
 # ====== Cache helpers (SQLite) ======
 CACHE_MAX_ENTRIES = 2000
 SIM_THRESHOLD_HIT = 0.82
 SIM_THRESHOLD_DEDUP = 0.95
+CACHE_EVICT_BATCH = 100
+CACHE_EVICTION = os.getenv("CACHE_EVICTION", "ttl").lower()  # lru | lfu | ttl
+CACHE_TTL_HOURS = float(os.getenv("CACHE_TTL_HOURS", "72"))
+CACHE_TTL_MAX_WEIGHT = 8  # entri populer hidup hingga 8x TTL dasar
 
 def _norm_q(q: str) -> str:
     q = (q or "").lower().strip()
@@ -260,132 +1470,1012 @@ def _norm_q(q: str) -> str:
 def _similar(a: str, b: str) -> float:
     return SequenceMatcher(None, _norm_q(a), _norm_q(b)).ratio()
 
-def cache_get_answer(user_msg: str):
+# ====== Cache similarity index (n-gram, in-process) ======
+# Index trigram karakter atas ai_cache.question_norm. Setiap gram menyimpan
+# bitmap (int Python) berisi slot entri yang memuatnya. Lookup menjumlahkan
+# bitmap semua gram pertanyaan secara bit-sliced (satu "bit plane" per bit
+# hitungan), jadi overlap dihitung untuk SELURUH set gram tanpa loop per
+# posting. Entri dengan overlap tertinggi di-rerank dengan koefisien Dice dan
+# shortlist-nya diverifikasi dengan SequenceMatcher (ambang SIM_THRESHOLD_HIT).
+# Snapshot disimpan di tabel ai_cache_ngram (bukan pickle) oleh thread latar.
+NGRAM_N = 3
+NGRAM_SHORTLIST = 8
+NGRAM_RERANK = 4          # kandidat (x shortlist) dengan overlap tertinggi yang di-rerank Dice
+NGRAM_SAVE_SECS = 60      # snapshot ke SQLite paling sering sekali per menit
+NGRAM_SNAPSHOT_VERSION = 3
+
+def _ngrams(qn: str) -> set:
+    s = f" {qn} "
+    if len(s) <= NGRAM_N:
+        return {s}
+    return {s[i:i + NGRAM_N] for i in range(len(s) - NGRAM_N + 1)}
+
+def _at_least(planes: list, need: int) -> int:
+    # bitmap slot yang hitungan bit-sliced-nya >= need (perbandingan per bit, MSB dulu)
+    if need >= 1 << len(planes):
+        return 0
+    gt, eq = 0, -1
+    for j in range(len(planes) - 1, -1, -1):
+        p = planes[j]
+        if need >> j & 1:
+            eq &= p
+        else:
+            gt |= eq & p
+            eq &= ~p
+    return gt | eq
+
+def _max_count(planes: list) -> int:
+    # hitungan tertinggi di antara semua slot
+    alive, best = -1, 0
+    for j in range(len(planes) - 1, -1, -1):
+        t = alive & planes[j]
+        if t:
+            alive = t
+            best |= 1 << j
+    return best
+
+def _bitmap(slots: list) -> int:
+    if len(slots) == 1:
+        return 1 << slots[0]
+    ba = bytearray((max(slots) >> 3) + 1)
+    for s in slots:
+        ba[s >> 3] |= 1 << (s & 7)
+    return int.from_bytes(ba, "little")
+
+def _bit_positions(x: int):
+    if x.bit_count() <= 8:
+        while x:  # sedikit bit: lebih murah daripada bin() seluruh bitmap
+            low = x & -x
+            yield low.bit_length() - 1
+            x ^= low
+        return
+    s = bin(x)
+    top = len(s) - 1
+    i = s.find("1", 2)
+    while i != -1:
+        yield top - i
+        i = s.find("1", i + 1)
+
+class NgramIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loaded = False
+        self._saved_at = 0.0
+        self._reset()
+
+    def _reset(self):
+        self.entries = {}    # id -> (slot, question_norm)
+        self.bits = {}       # gram -> bitmap slot
+        self.slot_cid = []   # slot -> id (0 = kosong)
+        self.slot_size = []  # slot -> jumlah gram entri
+        self.by_size = {}    # jumlah gram -> bitmap slot
+        self.free = []
+        self.last_id = 0
+        self._dirty = False
+        self._shared = False  # struktur sedang dibaca snapshot: salin sebelum diubah
+
+    def _own(self):
+        # copy-on-write: snapshot memegang referensi lama tanpa lock
+        if self._shared:
+            self.bits = dict(self.bits)
+            self.by_size = dict(self.by_size)
+            self.slot_cid = list(self.slot_cid)
+            self.slot_size = list(self.slot_size)
+            self._shared = False
+
+    def add_many(self, rows):
+        # rows: [(id, question_norm)]; bitmap tiap gram dibangun sekali per batch
+        postings, sizes = {}, {}
+        with self.lock:
+            self._own()
+            for cid, qn in rows:
+                if cid in self.entries:
+                    self._remove(cid)
+                grams = _ngrams(qn)
+                if self.free:
+                    slot = self.free.pop()
+                    self.slot_cid[slot], self.slot_size[slot] = cid, len(grams)
+                else:
+                    slot = len(self.slot_cid)
+                    self.slot_cid.append(cid)
+                    self.slot_size.append(len(grams))
+                for gram in grams:
+                    postings.setdefault(gram, []).append(slot)
+                sizes.setdefault(len(grams), []).append(slot)
+                self.entries[cid] = (slot, qn)
+                self.last_id = max(self.last_id, cid)
+            for table, new in ((self.bits, postings), (self.by_size, sizes)):
+                for key, slots in new.items():
+                    table[key] = table.get(key, 0) | _bitmap(slots)
+            self._dirty = self._dirty or bool(rows)
+
+    def add(self, cid: int, qn: str):
+        self.add_many([(cid, qn)])
+
+    def _remove(self, cid: int):
+        item = self.entries.pop(cid, None)
+        if item is None:
+            return
+        slot, qn = item
+        mask = ~(1 << slot)
+        bits = self.bits
+        for gram in _ngrams(qn):
+            v = bits.get(gram, 0) & mask
+            if v:
+                bits[gram] = v
+            else:
+                bits.pop(gram, None)
+        size = self.slot_size[slot]
+        v = self.by_size.get(size, 0) & mask
+        if v:
+            self.by_size[size] = v
+        else:
+            self.by_size.pop(size, None)
+        self.slot_cid[slot] = 0
+        self.free.append(slot)
+        self._dirty = True
+
+    def remove(self, cid: int):
+        with self.lock:
+            if cid in self.entries:
+                self._own()
+                self._remove(cid)
+
+    def search(self, qn: str, limit: int = NGRAM_SHORTLIST):
+        """Shortlist (id, question_norm) dengan koefisien Dice trigram tertinggi."""
+        grams = _ngrams(qn)
+        nq = len(grams)
+        with self.lock:
+            planes = []
+            for gram in grams:
+                carry = self.bits.get(gram, 0)
+                j = 0
+                while carry:
+                    if j == len(planes):
+                        planes.append(carry)
+                        break
+                    p = planes[j]
+                    planes[j] = p ^ carry
+                    carry &= p
+                    j += 1
+            if not planes:
+                return []
+            # overlap terendah yang masih memberi <= want kandidat (jumlahnya monoton)
+            want = limit * NGRAM_RERANK
+            lo, hi = 1, _max_count(planes)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if _at_least(planes, mid).bit_count() <= want:
+                    hi = mid
+                else:
+                    lo = mid + 1
+            pick = _at_least(planes, lo)
+            if pick.bit_count() > want:
+                pick = self._shortest(pick, want)
+            elif lo > 1 and pick.bit_count() < want:
+                # sisa kuota dari tingkat berikutnya (overlap sama: yang terpendek dulu)
+                pick |= self._shortest(_at_least(planes, lo - 1) & ~pick, want - pick.bit_count())
+            # hitungan overlap per kandidat dibaca dari plane (bytes: akses O(1) per bit)
+            size = (max(p.bit_length() for p in planes) + 7) // 8
+            rows = [p.to_bytes(size, "little") for p in planes]
+            found = []  # (dice, id)
+            for slot in _bit_positions(pick):
+                i, b = slot >> 3, 1 << (slot & 7)
+                overlap = sum(1 << j for j, row in enumerate(rows) if row[i] & b)
+                found.append((2 * overlap / (nq + self.slot_size[slot]), self.slot_cid[slot]))
+            found.sort(reverse=True)
+            return [(cid, self.entries[cid][1]) for _, cid in found[:limit]]
+
+    def _shortest(self, slots: int, k: int) -> int:
+        # overlap sama: Dice tertinggi milik entri dengan gram paling sedikit
+        pick = 0
+        for size in sorted(self.by_size):
+            pick |= slots & self.by_size[size]
+            if pick.bit_count() >= k:
+                break
+        return pick
+
+    def sync(self, conn):
+        # ambil baris baru (id > last_id) — range scan di PRIMARY KEY
+        rows = conn.execute(
+            "SELECT id, question_norm FROM ai_cache WHERE id > ? ORDER BY id", (self.last_id,)
+        ).fetchall()
+        if rows:
+            self.add_many(rows)
+
+    def _restore(self, conn) -> bool:
+        # snapshot tabel ai_cache_ngram (bukan pickle): bitmap per gram + slot -> id
+        snap = dict(conn.execute("SELECT key, value FROM ai_cache_ngram").fetchall())
+        meta = json.loads(snap.pop("#meta", "{}"))
+        max_id = conn.execute("SELECT COALESCE(MAX(id),0) FROM ai_cache").fetchone()[0]
+        # snapshot dari format lain / DB yang sudah direset -> bangun ulang
+        if meta.get("v") != NGRAM_SNAPSHOT_VERSION or meta.get("n") != NGRAM_N \
+                or not 0 < meta.get("last_id", 0) <= max_id:
+            return False
+        slot_cid = array("q", snap.pop("#slots")).tolist()
+        slot_size = array("q", snap.pop("#sizes")).tolist()
+        bits = {gram: int.from_bytes(b, "little") for gram, b in snap.items()}
+        last_id = meta["last_id"]
+        rows = dict(conn.execute("SELECT id, question_norm FROM ai_cache WHERE id <= ?", (last_id,)))
+        entries, dead = {}, 0
+        for slot, cid in enumerate(slot_cid):
+            if not cid:
+                continue
+            if cid in rows:
+                entries[cid] = (slot, rows[cid])
+            else:
+                dead |= 1 << slot  # sudah di-evict sejak snapshot dibuat
+                slot_cid[slot] = 0
+        if dead:
+            bits = {gram: v & ~dead for gram, v in bits.items() if v & ~dead}
+        sizes = {}
+        for slot, cid in enumerate(slot_cid):
+            if cid:
+                sizes.setdefault(slot_size[slot], []).append(slot)
+        with self.lock:
+            self.entries, self.bits = entries, bits
+            self.slot_cid, self.slot_size = slot_cid, slot_size
+            self.by_size = {size: _bitmap(slots) for size, slots in sizes.items()}
+            self.free = [s for s, cid in enumerate(slot_cid) if not cid]
+            self.last_id = last_id
+        # baris lama yang belum masuk snapshot (ditulis worker lain bersamaan)
+        self.add_many([(cid, cq) for cid, cq in rows.items() if cid not in entries])
+        return True
+
+    def load(self, conn):
+        if self.loaded:
+            return
+        try:
+            restored = self._restore(conn)
+        except Exception as e:
+            logger.warning("Snapshot index cache tidak valid, dibangun ulang: %s", e)
+            restored = False
+        if not restored:
+            with self.lock:
+                self._reset()
+        self.sync(conn)
+        self.loaded = True
+        logger.info("🔎 Index cache dimuat: %d entri (%s)", len(self.entries),
+                    "snapshot" if restored else "dibangun dari ai_cache")
+
+    def save(self, force: bool = False):
+        # dipanggil thread latar (cache-hit-flush) dan saat exit, bukan di request
+        if not self.loaded or not self._dirty:
+            return
+        if not force and time.monotonic() - self._saved_at < NGRAM_SAVE_SECS:
+            return
+        with self.lock:
+            bits, slot_cid, slot_size = self.bits, self.slot_cid, self.slot_size
+            meta = {"v": NGRAM_SNAPSHOT_VERSION, "n": NGRAM_N, "last_id": self.last_id}
+            self._shared = True
+            self._dirty = False
+        self._saved_at = time.monotonic()
+        try:
+            rows = [(gram, v.to_bytes((v.bit_length() + 7) // 8, "little")) for gram, v in bits.items()]
+            rows += [("#meta", json.dumps(meta)),
+                     ("#slots", array("q", slot_cid).tobytes()),
+                     ("#sizes", array("q", slot_size).tobytes())]
+            with db_conn() as conn:
+                conn.execute("DELETE FROM ai_cache_ngram")
+                conn.executemany("INSERT INTO ai_cache_ngram (key, value) VALUES (?, ?)", rows)
+        except Exception as e:
+            self._dirty = True
+            logger.warning("Gagal menyimpan index cache: %s", e)
+
+cache_index = NgramIndex()
+atexit.register(lambda: cache_index.save(force=True))
+
+# ====== LSH (MinHash) untuk dedup cache_put_answer ======
+# Signature MinHash atas trigram; baris hanya dibandingkan dengan baris yang
+# berbagi minimal satu bucket (band) di ai_cache_lsh. Dengan 16 band x 4 baris,
+# pasangan Jaccard 0.8 hampir pasti bertemu, Jaccard 0.3 jarang.
+LSH_BANDS = 16
+LSH_ROWS = 4
+_MERSENNE = (1 << 61) - 1
+_lsh_rng = random.Random(1337)  # seed tetap: signature harus sama di semua worker
+_MINHASH_PERMS = [
+    (_lsh_rng.randrange(1, _MERSENNE), _lsh_rng.randrange(0, _MERSENNE))
+    for _ in range(LSH_BANDS * LSH_ROWS)
+]
+
+def _gram_hash(g: str) -> int:
+    return int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=8).digest(), "little")
+
+def _minhash(qn: str) -> list:
+    hs = [_gram_hash(g) for g in _ngrams(qn)]
+    return [min((a * h + b) % _MERSENNE for h in hs) for a, b in _MINHASH_PERMS]
+
+def _lsh_buckets(sig: list) -> list:
+    out = []
+    for band in range(LSH_BANDS):
+        rows = sig[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        d = hashlib.blake2b(struct.pack(f"<I{LSH_ROWS}Q", band, *rows), digest_size=8).digest()
+        out.append(int.from_bytes(d, "little", signed=True))
+    return out
+
+def _pack_sig(sig: list) -> bytes:
+    return struct.pack(f"<{len(sig)}Q", *sig)
+
+def _lsh_index_row(conn, cid: int, qn: str, sig: list = None):
+    sig = sig or _minhash(qn)
+    conn.execute("UPDATE ai_cache SET sig=? WHERE id=?", (_pack_sig(sig), cid))
+    conn.execute("DELETE FROM ai_cache_lsh WHERE cache_id=?", (cid,))
+    conn.executemany(
+        "INSERT OR IGNORE INTO ai_cache_lsh (bucket, cache_id) VALUES (?, ?)",
+        [(b, cid) for b in _lsh_buckets(sig)]
+    )
+
+def _backfill_lsh(conn):
+    rows = conn.execute("SELECT id, question_norm FROM ai_cache WHERE sig IS NULL").fetchall()
+    for cid, cq in rows:
+        _lsh_index_row(conn, cid, cq)
+    if rows:
+        logger.info("🧮 Backfill signature LSH: %d baris", len(rows))
+
+def _lsh_candidates(conn, sig: list):
+    buckets = _lsh_buckets(sig)
+    marks = ",".join("?" * len(buckets))
+    return conn.execute(
+        f"SELECT DISTINCT c.id, c.question_norm FROM ai_cache_lsh l "
+        f"JOIN ai_cache c ON c.id = l.cache_id WHERE l.bucket IN ({marks})",
+        buckets
+    ).fetchall()
+
+def _cache_delete(conn, ids):
+    conn.executemany("DELETE FROM ai_cache_lsh WHERE cache_id = ?", [(i,) for i in ids])
+    conn.executemany("DELETE FROM ai_cache WHERE id = ?", [(i,) for i in ids])
+    for i in ids:
+        cache_index.remove(i)
+    if ids:
+        cache_generation.bump()
+
+# ====== Eviction (LRU / LFU / TTL berbobot hits) ======
+def _ttl_hours(hits: int) -> float:
+    return CACHE_TTL_HOURS * min(1 + (hits or 0), CACHE_TTL_MAX_WEIGHT)
+
+def _cache_expired(hits, last_hit_ts, kb_version) -> bool:
+    """Hanya berlaku untuk kebijakan ttl: kadaluarsa atau dibuat dari data lama."""
+    if CACHE_EVICTION != "ttl":
+        return False
+    if kb_version != knowledge.version:
+        return True
+    try:
+        age = datetime.now() - datetime.fromisoformat(last_hit_ts)
+    except (TypeError, ValueError):
+        return False
+    return age > timedelta(hours=_ttl_hours(hits))
+
+def _evict_lru(conn, n):
+    return [r[0] for r in conn.execute(
+        "SELECT id FROM ai_cache ORDER BY last_hit_ts ASC LIMIT ?", (n,))]
+
+def _evict_lfu(conn, n):
+    return [r[0] for r in conn.execute(
+        "SELECT id FROM ai_cache ORDER BY hits ASC, last_hit_ts ASC LIMIT ?", (n,))]
+
+def _evict_ttl(conn, n):
+    # data lama (kb_version beda) dulu, lalu yang lewat TTL berbobot, sisanya LRU
+    ids = [r[0] for r in conn.execute(
+        "SELECT id FROM ai_cache WHERE kb_version IS NOT ? LIMIT ?", (knowledge.version, n))]
+    if len(ids) < n:
+        ids += [r[0] for r in conn.execute(
+            "SELECT id FROM ai_cache WHERE kb_version IS ? AND "
+            "(julianday('now','localtime') - julianday(last_hit_ts)) * 24 > ? * MIN(1 + hits, ?) "
+            "ORDER BY last_hit_ts ASC LIMIT ?",
+            (knowledge.version, CACHE_TTL_HOURS, CACHE_TTL_MAX_WEIGHT, n - len(ids)))]
+    if len(ids) < n:
+        seen = set(ids)
+        ids += [i for i in _evict_lru(conn, n) if i not in seen][:n - len(ids)]
+    return ids
+
+EVICTION_POLICIES = {"lru": _evict_lru, "lfu": _evict_lfu, "ttl": _evict_ttl}
+if CACHE_EVICTION not in EVICTION_POLICIES:
+    logger.warning("CACHE_EVICTION=%s tidak dikenal, memakai lru", CACHE_EVICTION)
+    CACHE_EVICTION = "lru"
+
+def cache_evict(conn, n: int = CACHE_EVICT_BATCH):
+    ids = EVICTION_POLICIES[CACHE_EVICTION](conn, n)
+    _cache_delete(conn, ids)
+    counter_add(conn, f"evict_{CACHE_EVICTION}", len(ids))
+    return len(ids)
+
+# ====== L1: LRU in-process di depan ai_cache ======
+# Pertanyaan yang sama persis (setelah _norm_q) dilayani dari memori tanpa
+# menyentuh SQLite. Worker lain membatalkan L1 lewat counter generasi di file
+# mmap yang dinaikkan setiap kali jawaban cache diubah atau dihapus.
+CACHE_L1_SIZE = int(os.getenv("CACHE_L1_SIZE", "512"))
+CACHE_L1_TTL = 600          # detik
+CACHE_HIT_FLUSH_SECS = 5    # interval flush counter hits ke SQLite
+CACHE_GEN_PATH = os.getenv("CACHE_GEN_PATH", DB_PATH + ".gen")
+
+class SharedGeneration:
+    def __init__(self, path: str):
+        self.path = path
+        # flock berlaku per fd, jadi tidak mengecualikan thread lain di proses ini
+        # (loop ASGI + executor WSGI): setiap flock dibungkus lock lokal ini
+        self.lock = threading.Lock()
+        self._fd = None
+        self._mm = None
+        self._pid = None
+
+    def _map(self):
+        # mmap dibuka ulang setelah fork agar fd tidak dibagi antar proses
+        if self._pid != os.getpid():
+            with self.lock:
+                if self._pid != os.getpid():
+                    self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                    if os.fstat(self._fd).st_size < 8:
+                        os.ftruncate(self._fd, 8)
+                    self._mm = mmap.mmap(self._fd, 8)
+                    self._pid = os.getpid()
+        return self._mm
+
+    def read(self) -> int:
+        try:
+            return struct.unpack_from("<Q", self._map(), 0)[0]
+        except Exception:
+            return 0
+
+    def bump(self):
+        try:
+            mm = self._map()
+            with self.lock:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+                try:
+                    struct.pack_into("<Q", mm, 0, struct.unpack_from("<Q", mm, 0)[0] + 1)
+                finally:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+        except Exception as e:
+            logger.warning("Gagal menaikkan generasi cache: %s", e)
+
+cache_generation = SharedGeneration(CACHE_GEN_PATH)
+
+class AnswerLRU:
+    def __init__(self, size: int):
+        self.size = size
+        self.data = OrderedDict()  # question_norm -> (answer, cache_id, kb_version, t)
+        self.lock = threading.Lock()
+        self.gen = None
+
+    def _check_gen(self):
+        g = cache_generation.read()
+        if g != self.gen:
+            self.data.clear()
+            self.gen = g
+
+    def get(self, qn: str):
+        with self.lock:
+            self._check_gen()
+            item = self.data.get(qn)
+            if not item:
+                return None
+            answer, cid, kbv, t = item
+            if kbv != knowledge.version or time.monotonic() - t > CACHE_L1_TTL:
+                del self.data[qn]
+                return None
+            self.data.move_to_end(qn)
+            return answer, cid
+
+    def put(self, qn: str, answer: str, cid: int):
+        if self.size <= 0:
+            return
+        with self.lock:
+            self._check_gen()
+            self.data[qn] = (answer, cid, knowledge.version, time.monotonic())
+            self.data.move_to_end(qn)
+            while len(self.data) > self.size:
+                self.data.popitem(last=False)
+
+answer_l1 = AnswerLRU(CACHE_L1_SIZE)
+
+# Counter hits dikumpulkan di memori lalu di-flush berkala (satu transaksi)
+_pending_hits = {}  # cache_id -> [jumlah, last_hit_ts]
+_hits_lock = threading.Lock()
+_hit_flusher = {"pid": None}
+
+def flush_cache_hits():
+    with _hits_lock:
+        if not _pending_hits:
+            return
+        batch = [(n, ts, cid) for cid, (n, ts) in _pending_hits.items()]
+        _pending_hits.clear()
     try:
-        qn = _norm_q(user_msg)
         with db_conn() as conn:
-            # ambil kandidat kecil (LIKE) untuk efisiensi
-            token = qn.split(" ")[0] if qn else ""
-            if token:
-                cur = conn.execute(
-                    "SELECT id, question_norm, answer, hits FROM ai_cache WHERE question_norm LIKE ?",
-                    (f"%{token}%",)
-                )
-                candidates = cur.fetchall()
-            else:
-                candidates = conn.execute("SELECT id, question_norm, answer, hits FROM ai_cache").fetchall()
+            conn.executemany(
+                "UPDATE ai_cache SET hits = hits + ?, last_hit_ts = MAX(COALESCE(last_hit_ts, ''), ?) WHERE id = ?",
+                batch
+            )
+            # total hit tetap terhitung walau entrinya nanti di-evict
+            counter_add(conn, "cache_hits", sum(n for n, _, _ in batch))
+            conn.commit()
+    except Exception as e:
+        logger.warning("Gagal flush hits cache: %s", e)
 
-            best_id, best_ans, best_score = None, None, 0.0
-            for cid, cq, ca, hits in candidates:
-                sc = _similar(cq, user_msg)
-                if sc > best_score:
-                    best_id, best_ans, best_score = cid, ca, sc
+def _hit_flush_loop():
+    while True:
+        time.sleep(CACHE_HIT_FLUSH_SECS)
+        flush_cache_hits()
+        cache_index.save()  # snapshot index (dibatasi NGRAM_SAVE_SECS)
 
-            if best_id and best_score >= SIM_THRESHOLD_HIT:
-                conn.execute("UPDATE ai_cache SET hits = hits + 1 WHERE id = ?", (best_id,))
-                conn.commit()
-                logger.info("💾 Cache HIT (%.2f): %s", best_score, user_msg[:80])
-                return best_ans
+def _start_hit_flusher():
+    if _hit_flusher["pid"] != os.getpid():
+        _hit_flusher["pid"] = os.getpid()
+        threading.Thread(target=_hit_flush_loop, name="cache-hit-flush", daemon=True).start()
+
+def _record_hit(cid: int):
+    with _hits_lock:
+        item = _pending_hits.setdefault(cid, [0, ""])
+        item[0] += 1
+        item[1] = datetime.now().isoformat()
+    _start_hit_flusher()
+
+atexit.register(flush_cache_hits)
+
+def cache_get_answer(user_msg: str):
+    try:
+        qn = _norm_q(user_msg)
+        if not qn:
+            return None
+        hit = answer_l1.get(qn)
+        if hit:
+            _record_hit(hit[1])
+            logger.info("💾 Cache HIT (L1): %s", user_msg[:80])
+            return hit[0]
+        with db_conn() as conn:
+            cache_index.load(conn)
+            cache_index.sync(conn)
+            # qn sebagai seq2: indeks karakternya dibangun sekali untuk semua kandidat;
+            # batas atas real_quick_ratio/quick_ratio melewati kandidat yang tidak
+            # mungkin melewati ambang atau skor terbaik sejauh ini
+            sm = SequenceMatcher(None, "", qn)
+            scored, best = [], SIM_THRESHOLD_HIT
+            for cid, cq in cache_index.search(qn):
+                sm.set_seq1(cq)
+                if sm.real_quick_ratio() >= best and sm.quick_ratio() >= best:
+                    score = sm.ratio()
+                    if score >= best:
+                        scored.append((score, cid))
+                        best = score
+            scored.sort(reverse=True)
+            for score, cid in scored:
+                if score < SIM_THRESHOLD_HIT:
+                    break
+                row = conn.execute(
+                    "SELECT answer, hits, last_hit_ts, kb_version, sanitized FROM ai_cache WHERE id = ?", (cid,)
+                ).fetchone()
+                if not row:
+                    # sudah dihapus (eviction di worker lain)
+                    cache_index.remove(cid)
+                    continue
+                if _cache_expired(row[1], row[2], row[3]):
+                    _cache_delete(conn, [cid])
+                    counter_add(conn, "evict_expired")
+                    conn.commit()
+                    continue
+                # baris dari versi lama (belum disanitasi) dibersihkan saat dibaca
+                answer = row[0] if row[4] else sanitize_html(row[0])
+                _record_hit(cid)
+                answer_l1.put(qn, answer, cid)
+                logger.info("💾 Cache HIT (%.2f): %s", score, user_msg[:80])
+                return answer
     except Exception as e:
         logger.warning("cache_get_answer error: %s", e)
     return None
 
 def cache_put_answer(user_msg: str, answer: str):
+    """answer harus HTML yang sudah disanitasi (ditandai sanitized=1)."""
     if not user_msg or not answer:
         return
     try:
         qn = _norm_q(user_msg)
+        sig = _minhash(qn)
         with db_conn() as conn:
-            # dedup by similarity
-            cur = conn.execute("SELECT id, question_norm FROM ai_cache")
-            for cid, cq in cur.fetchall():
-                if _similar(cq, user_msg) >= SIM_THRESHOLD_DEDUP:
+            # dedup: hanya bandingkan dengan kandidat satu bucket LSH
+            for cid, cq in _lsh_candidates(conn, sig):
+                if _similar(cq, qn) >= SIM_THRESHOLD_DEDUP:
+                    now_iso = datetime.now().isoformat()
                     conn.execute(
-                        "UPDATE ai_cache SET answer=?, ts=?, hits=0 WHERE id=?",
-                        (answer, datetime.now().isoformat(), cid)
+                        "UPDATE ai_cache SET answer=?, ts=?, last_hit_ts=?, kb_version=?, hits=0, sanitized=1 WHERE id=?",
+                        (answer, now_iso, now_iso, knowledge.version, cid)
                     )
                     conn.commit()
+                    cache_generation.bump()
                     return
             # trim jika melebihi kapasitas
             count = conn.execute("SELECT COUNT(*) FROM ai_cache").fetchone()[0]
             if count >= CACHE_MAX_ENTRIES:
-                conn.execute("DELETE FROM ai_cache WHERE id IN (SELECT id FROM ai_cache ORDER BY ts ASC LIMIT 100)")
-            conn.execute(
-                "INSERT INTO ai_cache (question_norm, answer, ts, hits) VALUES (?, ?, ?, 0)",
-                (qn, answer, datetime.now().isoformat())
+                cache_evict(conn)
+            now_iso = datetime.now().isoformat()
+            cur = conn.execute(
+                "INSERT INTO ai_cache (question_norm, answer, ts, last_hit_ts, kb_version, hits, sanitized) "
+                "VALUES (?, ?, ?, ?, ?, 0, 1)",
+                (qn, answer, now_iso, now_iso, knowledge.version)
             )
+            _lsh_index_row(conn, cur.lastrowid, qn, sig)
             conn.commit()
+            # sync (bukan add) agar baris worker lain dengan id lebih kecil tidak terlewat
+            cache_index.load(conn)
+            cache_index.sync(conn)
+        _start_hit_flusher()
     except Exception as e:
         logger.warning("cache_put_answer error: %s", e)
 
-# ==================== Kategori & Pendaftaran ====================
-def get_category(msg):
-    msg = msg.lower()
-    for cat, keys in (TRISAKTI.get("keywords") or {}).items():
-        for k in keys:
-            if k in msg:
-                return cat
-    return "general"
+# ====== Single-flight: satu panggilan Gemini untuk pertanyaan kembar ======
+# Permintaan pertama memegang lease di tabel inflight dengan kunci hash _norm_q
+# ditambah bucket LSH-nya. Permintaan lain yang mirip (>= SIM_THRESHOLD_HIT)
+# menunggu lease dilepas lalu mengambil jawaban leader dari ai_cache. Antar
+# worker lewat polling SQLite, di dalam satu worker lewat threading.Event.
+SINGLEFLIGHT = os.getenv("SINGLEFLIGHT", "1") == "1"
+SINGLEFLIGHT_LEASE_SECS = 60     # lease kadaluarsa bila leader mati di tengah jalan
+SINGLEFLIGHT_WAIT_SECS = 25      # setelah ini follower memanggil Gemini sendiri
+SINGLEFLIGHT_POLL = (0.05, 0.4)  # interval polling lintas worker (awal, maks)
+_inflight_events = {}  # owner -> threading.Event untuk lease milik proses ini
+_inflight_lock = threading.Lock()
+
+def _exact_key(qn: str) -> int:
+    return int.from_bytes(hashlib.blake2b(qn.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+def _lease_acquire(qn: str, sig: list):
+    """-> (owner, None) bila menjadi leader, atau (None, owner lease yang sedang berjalan)."""
+    keys = [_exact_key(qn)] + _lsh_buckets(sig)
+    marks = ",".join("?" * len(keys))
+    now = time.time()
+    conn = db_conn()
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM inflight WHERE expires < ?", (now,))
+        rows = conn.execute(
+            f"SELECT DISTINCT question_norm, owner FROM inflight WHERE key IN ({marks})", keys
+        ).fetchall()
+        for cq, owner in rows:
+            if cq == qn or _similar(cq, qn) >= SIM_THRESHOLD_HIT:
+                conn.commit()
+                return None, owner
+        owner = f"{os.getpid()}:{threading.get_ident()}:{random.getrandbits(32):08x}"
+        # bucket yang kebetulan dipegang pertanyaan lain (tidak mirip) dilewati
+        conn.executemany(
+            "INSERT OR IGNORE INTO inflight (key, question_norm, owner, expires) VALUES (?, ?, ?, ?)",
+            [(k, qn, owner, now + SINGLEFLIGHT_LEASE_SECS) for k in keys]
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    with _inflight_lock:
+        _inflight_events[owner] = threading.Event()
+    return owner, None
+
+def _lease_wait(owner: str, user_msg: str):
+    """Tunggu leader selesai lalu ambil jawabannya dari cache (None bila tidak ada)."""
+    deadline = time.monotonic() + SINGLEFLIGHT_WAIT_SECS
+    with _inflight_lock:
+        event = _inflight_events.get(owner)
+    if event is not None:
+        event.wait(SINGLEFLIGHT_WAIT_SECS)
+        return cache_get_answer(user_msg)
+    delay = SINGLEFLIGHT_POLL[0]
+    conn = db_conn()
+    while time.monotonic() < deadline:
+        time.sleep(delay)
+        delay = min(delay * 2, SINGLEFLIGHT_POLL[1])
+        if not conn.execute("SELECT 1 FROM inflight WHERE owner = ? LIMIT 1", (owner,)).fetchone():
+            return cache_get_answer(user_msg)
+    return None
 
-_last_reg = {"t": None, "v": "Belum ada informasi pendaftaran."}
+def _lease_release(owner: str):
+    try:
+        with db_conn() as conn:
+            conn.execute("DELETE FROM inflight WHERE owner = ?", (owner,))
+    except Exception as e:
+        logger.warning("Gagal melepas lease single-flight: %s", e)
+    with _inflight_lock:
+        event = _inflight_events.pop(owner, None)
+    if event is not None:
+        event.set()
+
+def singleflight_enter(user_msg: str):
+    """-> (lease, jawaban bersama). Lease (bisa None) wajib dilepas lewat singleflight_leave."""
+    qn = _norm_q(user_msg)
+    if not SINGLEFLIGHT or not qn:
+        return None, None
+    try:
+        sig = _minhash(qn)
+        # putaran kedua: leader gagal tanpa jawaban -> coba jadi leader sendiri
+        for _ in range(2):
+            lease, holder = _lease_acquire(qn, sig)
+            if lease:
+                return lease, None
+            answer = _lease_wait(holder, user_msg)
+            if answer:
+                with db_conn() as conn:
+                    counter_add(conn, "coalesce_shared")
+                logger.info("🤝 Single-flight: jawaban dibagi untuk %s", user_msg[:80])
+                return None, answer
+        with db_conn() as conn:
+            counter_add(conn, "coalesce_miss")
+    except Exception as e:
+        logger.warning("single-flight error: %s", e)
+    return None, None
+
+def singleflight_leave(lease):
+    if lease:
+        _lease_release(lease)
+
+# ====== Session store: SQLite ======
+# Pengganti Flask-Session filesystem (satu file pickle per sesi, ditulis ulang
+# utuh di setiap pesan dan tidak pernah dibersihkan). Data kecil sesi
+# (mis. admin_logged_in) disimpan sebagai JSON di tabel sessions; percakapan
+# disimpan per giliran di session_turns sehingga satu pesan hanya menambah
+# baris, dan yang disimpan hanya jendela riwayat yang dipakai prompt.
+# Sesi idle dihapus bertahap lewat index expires.
+SESSION_HISTORY_TURNS = 6
+SESSION_SWEEP_SECS = 300
+SESSION_SWEEP_BATCH = 500
+_session_sweep = {"next": 0.0}
+
+class SQLiteSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False, expires=0.0):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid, self.new, self.expires = sid, new, expires
+        self.modified = False
+        self.pending_turns = []      # giliran baru yang belum ditulis
+        self.history_cleared = False
+        self._history = None         # dimuat dari DB saat pertama dibutuhkan
+
+    def history(self) -> list:
+        if self._history is None:
+            self._history = [] if self.new else _load_turns(self.sid)
+        return (self._history + self.pending_turns)[-SESSION_HISTORY_TURNS:]
+
+    def append_turn(self, role: str, content: str):
+        self.pending_turns.append({"role": role, "content": content})
+
+    def clear_history(self):
+        self.history_cleared = True
+        self._history = []
+        self.pending_turns.clear()
+
+    def clear(self):
+        super().clear()
+        self.clear_history()
+
+def _load_turns(sid: str) -> list:
+    try:
+        rows = db_conn().execute(
+            "SELECT role, content FROM session_turns WHERE sid = ? ORDER BY seq DESC LIMIT ?",
+            (sid, SESSION_HISTORY_TURNS)
+        ).fetchall()
+    except Exception as e:
+        logger.warning("Gagal memuat riwayat sesi: %s", e)
+        return []
+    return [{"role": role, "content": content} for role, content in reversed(rows)]
+
+def sweep_sessions(conn, now=None) -> int:
+    expired = [(sid,) for (sid,) in conn.execute(
+        "SELECT sid FROM sessions WHERE expires <= ? LIMIT ?",
+        (now or time.time(), SESSION_SWEEP_BATCH)
+    )]
+    if expired:
+        conn.executemany("DELETE FROM session_turns WHERE sid = ?", expired)
+        conn.executemany("DELETE FROM sessions WHERE sid = ?", expired)
+        conn.commit()
+        logger.info("🧹 %d sesi kedaluwarsa dihapus", len(expired))
+    return len(expired)
+
+class SQLiteSessionInterface(SessionInterface):
+    salt = "flask-session"
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt=self.salt, key_derivation="hmac")
+
+    def open_session(self, app, request):
+        raw = request.cookies.get(self.get_cookie_name(app))
+        if raw:
+            try:
+                sid = self._signer(app).unsign(raw).decode()
+                row = db_conn().execute(
+                    "SELECT data, expires FROM sessions WHERE sid = ? AND expires > ?", (sid, time.time())
+                ).fetchone()
+                if row:
+                    return SQLiteSession(json.loads(row[0]), sid=sid, expires=row[1])
+            except BadSignature:
+                pass
+            except Exception as e:
+                logger.warning("Gagal membuka sesi: %s", e)
+        # sid dari cookie yang tidak dikenal tidak dipakai ulang (session fixation)
+        return SQLiteSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain, path = self.get_cookie_domain(app), self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add("Cookie")
+        if session.new and not session and not session.pending_turns:
+            return
+        now = time.time()
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        try:
+            with _stage("db"), db_conn() as conn:
+                if not session and session.history_cleared and not session.pending_turns:
+                    # session.clear(): hapus sesi beserta riwayatnya
+                    conn.execute("DELETE FROM session_turns WHERE sid = ?", (session.sid,))
+                    conn.execute("DELETE FROM sessions WHERE sid = ?", (session.sid,))
+                    if not session.new:
+                        response.delete_cookie(name, domain=domain, path=path,
+                                               secure=self.get_cookie_secure(app),
+                                               samesite=self.get_cookie_samesite(app),
+                                               httponly=self.get_cookie_httponly(app))
+                    return
+                # sesi yang hanya dibaca cukup diperpanjang sesekali
+                if not (session.new or session.modified or session.pending_turns
+                        or session.history_cleared or session.expires - now < lifetime / 2):
+                    return
+                conn.execute(
+                    "INSERT INTO sessions (sid, data, expires) VALUES (?, ?, ?) "
+                    "ON CONFLICT(sid) DO UPDATE SET data = excluded.data, expires = excluded.expires",
+                    (session.sid, json.dumps(dict(session), ensure_ascii=False), now + lifetime)
+                )
+                if session.history_cleared:
+                    conn.execute("DELETE FROM session_turns WHERE sid = ?", (session.sid,))
+                if session.pending_turns:
+                    conn.executemany(
+                        "INSERT INTO session_turns (sid, seq, role, content) "
+                        "SELECT ?, COALESCE(MAX(seq), 0) + 1, ?, ? FROM session_turns WHERE sid = ?",
+                        [(session.sid, t["role"], t["content"], session.sid) for t in session.pending_turns]
+                    )
+                    conn.execute(
+                        "DELETE FROM session_turns WHERE sid = ? AND "
+                        "seq <= (SELECT MAX(seq) FROM session_turns WHERE sid = ?) - ?",
+                        (session.sid, session.sid, SESSION_HISTORY_TURNS)
+                    )
+        except Exception as e:
+            logger.warning("Gagal menyimpan sesi: %s", e)
+            return
+        if session._history is not None:
+            session._history = session.history()
+        session.pending_turns.clear()
+        session.expires, session.modified, session.history_cleared = now + lifetime, False, False
+        if session.new:
+            session.new = False
+            response.set_cookie(name, self._signer(app).sign(session.sid).decode(),
+                                expires=self.get_expiration_time(app, session),
+                                httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                                secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+        if now >= _session_sweep["next"]:
+            _session_sweep["next"] = now + SESSION_SWEEP_SECS
+            try:
+                sweep_sessions(db_conn(), now)
+            except Exception as e:
+                logger.warning("Sweep sesi gagal: %s", e)
+
+app.session_interface = SQLiteSessionInterface()
+
+# Skema + migrasi dijalankan saat import (gunicorn tidak melewati __main__)
+try:
+    init_db()
+except Exception as e:
+    logger.critical("Gagal inisialisasi DB: %s", e)
 
-def get_current_registration_status():
-    """
-    Menghasilkan status pendaftaran dengan dukungan:
-    - Format baru: wave { "start": "YYYY-MM-DD", "end": "YYYY-MM-DD" }
-    - Fallback format lama: wave { "period": "YYYY-MM-DD - YYYY-MM-DD" }
-    Meng-cache hasil 10 menit untuk efisiensi.
-    """
+# ==================== Kategori & Pendaftaran ====================
+# ====== Timeline pendaftaran ======
+# Tanggal gelombang diparse sekali saat data dimuat menjadi titik batas terurut
+# (awal gelombang dan hari setelah akhir gelombang). Di antara dua batas status
+# tidak berubah, jadi teks status + HTML balasan dirender per segmen dan dipilih
+# dengan bisect; pilihan itu hanya dihitung ulang saat tengah malam melewati batas.
+REG_EMPTY = "Belum ada informasi pendaftaran."
+
+def _parse_date(s: str) -> date:
+    # ISO (format JSON sekarang) langsung; dateutil hanya untuk teks bebas format lama.
+    # dayfirst=True tidak boleh dipakai untuk ISO: "2025-10-01" terbaca 10 Januari.
     try:
-        if _last_reg["t"] and (datetime.now() - _last_reg["t"]).seconds < 600:
-            return _last_reg["v"]
+        return date.fromisoformat(s.strip())
+    except ValueError:
+        from dateutil.parser import parse
+        return parse(s, dayfirst=True).date()
+
+def _parse_wave(w):
+    """-> (start, end) sebagai date, atau None bila tidak bisa diparse.
+    Format baru {"start","end"}; fallback format lama {"period": "A - B"}."""
+    if w.get("start") and w.get("end"):
+        try:
+            return _parse_date(w["start"]), _parse_date(w["end"])
+        except Exception:
+            pass
+    if isinstance(w.get("period"), str) and " - " in w["period"]:
+        try:
+            start_str, end_str = [s.strip() for s in w["period"].split(" - ")]
+            return _parse_date(start_str), _parse_date(end_str)
+        except Exception:
+            pass
+    return None
 
-        today = datetime.now().date()
-        out = []
+def _midnight_ts(d: date) -> float:
+    return datetime.combine(d, datetime.min.time()).timestamp()
 
-        for p in TRISAKTI.get("registration", {}).get("paths", []):
+class RegistrationTimeline:
+    def __init__(self, data: dict):
+        reg = data.get("registration", {}) or {}
+        self.waves = []  # (start, end, wave_name, path_name) sesuai urutan data
+        for p in reg.get("paths", []):
             for w in p.get("waves", []):
-                start, end = None, None
-
-                # Format baru (start/end)
-                if w.get("start") and w.get("end"):
-                    try:
-                        start = parse_date(w["start"], dayfirst=True).date()
-                        end = parse_date(w["end"], dayfirst=True).date()
-                    except Exception:
-                        start = end = None
-
-                # Fallback format lama (period)
-                if (start is None or end is None) and isinstance(w.get("period"), str) and " - " in w["period"]:
-                    try:
-                        start_str, end_str = [s.strip() for s in w["period"].split(" - ")]
-                        start = parse_date(start_str, dayfirst=True).date()
-                        end = parse_date(end_str, dayfirst=True).date()
-                    except Exception:
-                        start = end = None
-
-                if not (start and end):
-                    # Skip wave yang tidak bisa diparse, jangan blokir lainnya
-                    continue
+                parsed = _parse_wave(w)
+                if parsed:  # wave yang tidak bisa diparse dilewati, jangan blokir lainnya
+                    self.waves.append((*parsed, w.get("wave", "Gelombang"), p.get("name") or ""))
+        self.bounds = sorted({s for s, _, _, _ in self.waves} | {e + timedelta(days=1) for _, e, _, _ in self.waves})
+        self.links_html = self._links_html(reg)
+        # segmen i berlaku untuk hari di [bounds[i-1], bounds[i])
+        firsts = [self.bounds[0] - timedelta(days=1)] + self.bounds if self.bounds else [date.min]
+        self.segments = [self._render(day) for day in firsts]
+        self.lock = threading.Lock()
+        self.current = (0.0, 0.0, self.segments[0])  # (berlaku_dari_ts, berlaku_sampai_ts, segmen)
+
+    @staticmethod
+    def _links_html(reg: dict) -> str:
+        # Kumpulkan link per-path bila ada, jika tidak pakai link global
+        links = []
+        for p in reg.get("paths", []):
+            l = p.get("link")
+            if l and l not in links:
+                links.append(l)
+        if links:
+            return "<br>".join([f"<a href='{l}' target='_blank' rel='noopener'>{l}</a>" for l in links])
+        global_link = reg.get("link", "")
+        return f"<a href='{global_link}' target='_blank' rel='noopener'>{global_link}</a>" if global_link else "Belum tersedia"
 
-                wave_name = w.get("wave", "Gelombang")
-                path_name = p.get("name") or ""
-                if today < start:
-                    out.append(f"{wave_name} ({path_name}) akan dibuka {start.strftime('%d %B %Y')}.")
-                elif start <= today <= end:
-                    out.append(f"{wave_name} ({path_name}) sedang berlangsung hingga {end.strftime('%d %B %Y')}.")
-                else:
-                    out.append(f"{wave_name} ({path_name}) sudah ditutup {end.strftime('%d %B %Y')}.")
-
-        val = "\n".join(out)
-        if not val.strip():
-            val = "Belum ada informasi pendaftaran."
-        _last_reg["t"], _last_reg["v"] = datetime.now(), val
-        logger.info("📅 Registration status generated:\n%s", val)
-        return val
+    def _render(self, today: date):
+        out = []
+        for start, end, wave_name, path_name in self.waves:
+            if today < start:
+                out.append(f"{wave_name} ({path_name}) akan dibuka {start.strftime('%d %B %Y')}.")
+            elif today <= end:
+                out.append(f"{wave_name} ({path_name}) sedang berlangsung hingga {end.strftime('%d %B %Y')}.")
+            else:
+                out.append(f"{wave_name} ({path_name}) sudah ditutup {end.strftime('%d %B %Y')}.")
+        status = "\n".join(out) if out else REG_EMPTY
+        status_html = status.replace("\n", "<br>")
+        reply = sanitize_html(f"📝 <b>Link pendaftaran resmi:</b><br>{self.links_html}<br><br>{status_html}")
+        return status, reply
+
+    def segment(self):
+        """-> (status, reply_html) untuk hari ini; bisect hanya saat melewati batas."""
+        now = time.time()
+        since, until, seg = self.current
+        if since <= now < until:
+            return seg
+        with self.lock:
+            today = date.today()
+            i = bisect.bisect_right(self.bounds, today)
+            since = _midnight_ts(self.bounds[i - 1]) if i > 0 else float("-inf")
+            until = _midnight_ts(self.bounds[i]) if i < len(self.bounds) else float("inf")
+            self.current = (since, until, self.segments[i])
+            logger.debug("📅 Segmen status pendaftaran %d/%d berlaku s.d. %s", i, len(self.bounds),
+                         self.bounds[i] if i < len(self.bounds) else "-")
+            return self.segments[i]
+
+def build_registration_timeline(data: dict):
+    try:
+        return RegistrationTimeline(data)
     except Exception as e:
-        logger.warning("Gagal menentukan status pendaftaran: %s", e)
+        logger.warning("Gagal menyusun timeline pendaftaran: %s", e)
+        return None
+
+knowledge.derive("timeline", build_registration_timeline)
+
+def get_current_registration_status():
+    timeline = knowledge.current()["timeline"]
+    if timeline is None:
         return "Status pendaftaran tidak tersedia."
+    return timeline.segment()[0]
+
+def registration_reply_html():
+    timeline = knowledge.current()["timeline"]
+    if timeline is None:
+        return sanitize_html("📝 Status pendaftaran tidak tersedia.")
+    return timeline.segment()[1]
 
 def _normalize_specs(specs):
     if not isinstance(specs, list):
@@ -400,41 +2490,155 @@ def _normalize_specs(specs):
             out.append(s)
     return out
 
-def find_program_by_alias(query):
-    q = (query or "").lower()
-    for prog in TRISAKTI.get("academic_programs", []):
-        name = (prog.get("name") or "").lower()
-        if name and (name in q or q in name):
-            return prog
-        for a in (prog.get("aliases") or []):
-            if a and (a.lower() in q or q in a.lower()):
-                return prog
+def _spec_clone(prog, s):
+    return {
+        "name": prog.get("name"),
+        "description": prog.get("description", ""),
+        "specializations": _normalize_specs(prog.get("specializations")),
+        "career_prospects": (s.get("career_prospects") if isinstance(s, dict) else None) or prog.get("career_prospects", []),
+        "accreditation": (s.get("accreditation") if isinstance(s, dict) else None) or prog.get("accreditation", "BAIK"),
+        "evening_class": (s.get("evening_class") if isinstance(s, dict) else None) or prog.get("evening_class", False)
+    }
+
+# ====== Router: Aho-Corasick untuk kategori + prodi ======
+# Semua keyword kategori dan nama/alias/spesialisasi prodi dikompilasi sekali
+# menjadi satu automaton; satu kali scan pesan menghasilkan kategori dan prodi.
+# Match harus diawali batas kata ("lab" tidak cocok di "kolaborasi"), akhiran
+# tetap boleh ("pendaftarannya").
+class KeywordAutomaton:
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]  # node -> [(panjang pattern, payload)]
+
+    def add(self, pattern: str, payload):
+        node = 0
+        for ch in pattern:
+            nxt = self.goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+            node = nxt
+        self.out[node].append((len(pattern), payload))
+
+    def build(self):
+        pending = deque(self.goto[0].values())  # anak root: fail = root
+        while pending:
+            node = pending.popleft()
+            for ch, nxt in self.goto[node].items():
+                pending.append(nxt)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+        return self
+
+    def scan(self, text: str):
+        node = 0
+        goto, fail, out = self.goto, self.fail, self.out
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for length, payload in out[node]:
+                start = i - length + 1
+                if start == 0 or not text[start - 1].isalnum():
+                    yield payload
+
+def build_router(data: dict) -> dict:
+    ac = KeywordAutomaton()
+    for order, (cat, keys) in enumerate((data.get("keywords") or {}).items()):
+        for k in keys:
+            if k:
+                ac.add(k.lower(), ("cat", order, cat))
+    # urutan rank = urutan pemeriksaan lama: per prodi -> nama, alias, spesialisasi
+    terms, results = [], []
+    for prog in data.get("academic_programs", []):
+        entries = [(prog.get("name") or "", prog)]
+        entries += [(a or "", prog) for a in (prog.get("aliases") or [])]
         specs = prog.get("specializations", [])
         if isinstance(specs, list):
             for s in specs:
                 title = (s.get("title") if isinstance(s, dict) else s) or ""
-                title_l = title.lower()
-                if title_l and (title_l in q or q in title_l):
-                    clone = {
-                        "name": prog.get("name"),
-                        "description": prog.get("description", ""),
-                        "specializations": _normalize_specs(prog.get("specializations")),
-                        "career_prospects": (s.get("career_prospects") if isinstance(s, dict) else None) or prog.get("career_prospects", []),
-                        "accreditation": (s.get("accreditation") if isinstance(s, dict) else None) or prog.get("accreditation", "BAIK"),
-                        "evening_class": (s.get("evening_class") if isinstance(s, dict) else None) or prog.get("evening_class", False)
-                    }
-                    return clone
-    return None
+                entries.append((title, _spec_clone(prog, s)))
+        for term, result in entries:
+            term = term.lower()
+            if not term:
+                continue
+            ac.add(term, ("prog", len(results)))
+            terms.append(term)
+            results.append(result)
+    # arah sebaliknya (query di dalam nama): satu find() di string gabungan
+    offsets, pos = [], 0
+    for t in terms:
+        offsets.append(pos)
+        pos += len(t) + 1
+    return {"ac": ac.build(), "joined": "\x00".join(terms), "offsets": offsets, "results": results}
+
+def route_message(msg: str, router=None):
+    """Satu kali scan -> (kategori, prodi atau None)."""
+    router = router or knowledge.current()["router"]
+    q = (msg or "").lower()
+    cat_best, prog_best = None, None
+    for payload in router["ac"].scan(q):
+        if payload[0] == "cat":
+            if cat_best is None or payload[1] < cat_best[0]:
+                cat_best = payload[1:]
+        elif prog_best is None or payload[1] < prog_best:
+            prog_best = payload[1]
+    if q and "\x00" not in q:
+        at = router["joined"].find(q)
+        if at >= 0:
+            rank = bisect.bisect_right(router["offsets"], at) - 1
+            prog_best = rank if prog_best is None else min(prog_best, rank)
+    category = cat_best[1] if cat_best else "general"
+    program = router["results"][prog_best] if prog_best is not None else None
+    return category, program
+
+def get_category(msg):
+    return route_message(msg)[0]
+
+def find_program_by_alias(query):
+    return route_message(query)[1]
+
+knowledge.derive("router", build_router)
+
+# ==================== Origin/Rate Guard ====================
+# ====== Origin: lookup hash atas origin yang sudah di-parse ======
+# ALLOWED_ORIGINS dinormalisasi sekali menjadi "scheme://host[:port]" (huruf kecil,
+# port default dibuang). Origin/Referer permintaan di-parse dengan cara yang sama
+# lalu dicek di frozenset; prefix seperti https://trisaktimultimedia.ac.id.evil.com
+# tidak lagi lolos seperti pada pencocokan startswith.
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+ALLOW_TESTING = os.getenv("ALLOW_TESTING", "0") == "1"
+
+@lru_cache(maxsize=1024)
+def _origin_key(url: str):
+    try:
+        parts = urlsplit(url.strip())
+        scheme, host, port = parts.scheme.lower(), parts.hostname, parts.port
+    except ValueError:
+        return None
+    if not scheme or not host:
+        return None
+    if port and port != _DEFAULT_PORTS.get(scheme):
+        return f"{scheme}://{host}:{port}"
+    return f"{scheme}://{host}"
+
+_ALLOWED_ORIGIN_KEYS = frozenset(k for k in map(_origin_key, ALLOWED_ORIGINS) if k)
 
-# ==================== Origin/Size Guard ====================
 def _is_allowed_origin(req) -> bool:
-    origin = req.headers.get("Origin") or ""
-    referer = req.headers.get("Referer") or ""
-    if origin and any(origin.startswith(o) for o in ALLOWED_ORIGINS):
+    origin = req.headers.get("Origin")
+    if origin and _origin_key(origin) in _ALLOWED_ORIGIN_KEYS:
         return True
-    if referer and any(referer.startswith(o) for o in ALLOWED_ORIGINS):
+    referer = req.headers.get("Referer")
+    if referer and _origin_key(referer) in _ALLOWED_ORIGIN_KEYS:
         return True
-    return os.getenv("ALLOW_TESTING", "0") == "1"
+    return ALLOW_TESTING
 
 def _precheck_request():
     if not _is_allowed_origin(request):
@@ -442,6 +2646,174 @@ def _precheck_request():
     if request.content_length and request.content_length > 4 * 1024:
         abort(413)
 
+# ====== Rate limit: token bucket bersama antar worker ======
+# Storage in-memory Flask-Limiter terpisah per worker, jadi limit efektif ikut
+# berlipat dengan -w. Di sini bucket disimpan di tabel hash dalam file mmap (pola
+# yang sama dengan SharedGeneration): slot = (hash kunci, sisa token, waktu
+# update), open addressing dengan RATELIMIT_PROBES langkah, satu flock per
+# permintaan. Bucket yang sudah penuh kembali setara dengan slot kosong sehingga
+# boleh ditimpa; bila semua langkah terisi bucket aktif, yang paling lama tidak
+# dipakai digusur (fail-open: kunci itu mendapat bucket penuh baru).
+RATELIMIT_PATH = os.getenv("RATELIMIT_PATH", DB_PATH + ".ratelimit")
+RATELIMIT_SLOTS = int(os.getenv("RATELIMIT_SLOTS", "16384"))
+RATELIMIT_PROBES = 8
+_RATE_UNITS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+_RATE_RE = re.compile(r"\s*(\d+)\s*(?:/|per)\s*(second|minute|hour|day)s?\s*")
+
+# per: "ip" (alamat klien setelah ProxyFix) atau "session" (cookie sesi)
+RateLimit = namedtuple("RateLimit", "spec capacity rate per")
+
+def parse_rate(spec: str, per: str = "ip") -> RateLimit:
+    # "60/minute" atau "600 per hour" -> kapasitas 60, isi ulang 1 token/detik
+    m = _RATE_RE.fullmatch(spec)
+    if not m:
+        raise ValueError(f"Format rate limit tidak dikenal: {spec!r}")
+    n = int(m.group(1))
+    return RateLimit(f"{n}/{m.group(2)}", n, n / _RATE_UNITS[m.group(2)], per)
+
+def _bucket_hash(key: str) -> int:
+    # 0 menandai slot kosong
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+
+class TokenBucketTable:
+    SLOT = struct.Struct("<Qdd")  # hash kunci, token tersisa, waktu update (epoch detik)
+
+    def __init__(self, path: str, slots: int, probes: int = RATELIMIT_PROBES):
+        self.path = path
+        self.slots = slots
+        self.probes = probes
+        self.size = slots * self.SLOT.size
+        self.lock = threading.Lock()  # lihat SharedGeneration: flock tidak mengecualikan thread
+        self._fd = None
+        self._mm = None
+        self._pid = None
+
+    def _map(self):
+        # mmap dibuka ulang setelah fork agar fd tidak dibagi antar proses
+        if self._pid != os.getpid():
+            with self.lock:
+                if self._pid != os.getpid():
+                    self._open()
+        return self._mm
+
+    def _open(self):
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size != self.size:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(self._fd).st_size != self.size:  # ukuran tabel berubah: mulai kosong
+                    os.ftruncate(self._fd, 0)
+                    os.ftruncate(self._fd, self.size)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._mm = mmap.mmap(self._fd, self.size)
+        self._pid = os.getpid()
+
+    def _find(self, mm, h, capacity, rate, now):
+        # -> (offset slot, token saat ini)
+        slot = self.SLOT
+        start = h % self.slots
+        free = oldest = None
+        oldest_ts = float("inf")
+        for i in range(self.probes):
+            off = ((start + i) % self.slots) * slot.size
+            key, tokens, ts = slot.unpack_from(mm, off)
+            if key == h:
+                return off, min(capacity, tokens + max(0.0, now - ts) * rate)
+            if free is None:
+                if key == 0 or ts + capacity / rate <= now:
+                    free = off
+                elif ts < oldest_ts:
+                    oldest, oldest_ts = off, ts
+        return (free if free is not None else oldest), float(capacity)
+
+    def take(self, buckets) -> float:
+        """buckets: [(hash, kapasitas, token/detik)]. Ambil satu token dari semua
+        bucket dan kembalikan 0; bila ada yang kosong tidak ada yang diambil dan
+        hasilnya detik sampai token berikutnya tersedia."""
+        mm = self._map()
+        with self.lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                now = time.time()
+                found, wait = [], 0.0
+                for h, capacity, rate in buckets:
+                    off, tokens = self._find(mm, h, capacity, rate, now)
+                    if tokens < 1:
+                        wait = max(wait, (1 - tokens) / rate)
+                    found.append((off, h, tokens))
+                if wait:
+                    return wait
+                for off, h, tokens in found:
+                    self.SLOT.pack_into(mm, off, h, tokens - 1, now)
+                return 0.0
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+class RateLimiter:
+    """Pengganti Flask-Limiter dengan bucket bersama antar worker.
+
+    @limiter.limit("60/minute", per_session="20/minute", scope="chat") memasang
+    limit route yang MENGGANTIKAN default (tidak ditumpuk); route tanpa dekorator
+    memakai default_limits per endpoint. Route dengan scope sama berbagi bucket."""
+
+    def __init__(self, app, table: TokenBucketTable, default_limits=()):
+        self.app = app
+        self.table = table
+        self.defaults = tuple(parse_rate(s) for s in default_limits)
+        self.routes = {}  # endpoint -> (scope, limits)
+        self.errors = 0
+        app.before_request(self._check_default)
+
+    def limit(self, spec: str, per_session: str = None, scope: str = None):
+        limits = (parse_rate(spec),) + ((parse_rate(per_session, "session"),) if per_session else ())
+
+        def decorator(fn):
+            self.routes[fn.__name__] = (scope or fn.__name__, limits)
+
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                self.check()
+                return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _check_default(self):
+        endpoint = request.endpoint
+        if endpoint is None or endpoint == "static" or endpoint in self.routes:
+            return  # 404, file statis, atau dicek dekorator route
+        self.check()
+
+    def check(self):
+        # juga dipanggil asgi.py yang menjalankan handler tanpa lewat view
+        if not self.app.config.get("RATELIMIT_ENABLED", True):
+            return
+        endpoint = request.endpoint
+        scope, limits = self.routes.get(endpoint) or (endpoint, self.defaults)
+        ip = request.remote_addr or "127.0.0.1"
+        sid = request.cookies.get(self.app.config["SESSION_COOKIE_NAME"])
+        buckets = []
+        for lim in limits:
+            if lim.per == "session":
+                if not sid:
+                    continue  # klien tanpa cookie tetap dibatasi bucket IP
+                who = "s:" + sid
+            else:
+                who = "ip:" + ip
+            buckets.append((_bucket_hash(f"{scope}|{lim.spec}|{who}"), lim.capacity, lim.rate))
+        try:
+            wait = self.table.take(buckets)
+        except Exception as e:
+            self.errors += 1
+            logger.warning("⚠️ Rate limiter gagal, permintaan diloloskan: %s", e)
+            return
+        if wait:
+            g.retry_after = math.ceil(wait)
+            abort(429)
+
+limiter = RateLimiter(app, TokenBucketTable(RATELIMIT_PATH, RATELIMIT_SLOTS),
+                      default_limits=("600 per hour", "60 per minute"))
+
 # ==================== Routes (UI) ====================
 @app.route("/")
 @limiter.limit("30/minute")
@@ -476,6 +2848,14 @@ def admin_stats():
         "today": ov["today"],
         "cache_hits": ov["cache_hits"],
         "top_questions": ov["top"],
+        "by_source": ov["by_source"],
+        "hourly": ov["hourly"],
+        "latency": ov["latency"],
+        "evictions": read_counters("evict_"),
+        "eviction_policy": CACHE_EVICTION,
+        "coalescing": read_counters("coalesce_"),
+        "kb": knowledge.current(),
+        "kb_reloads": knowledge.reloads,
         "latest": latest
     })
 
@@ -493,20 +2873,32 @@ def download_brosur():
     return send_from_directory(app.static_folder, "brosur_tmm.pdf", as_attachment=True)
 
 # ==================== API ====================
+# Ketiga endpoint chat berbagi bucket: per IP (NAT kampus) dan per sesi
+CHAT_RATE = os.getenv("CHAT_RATE", "60/minute")
+CHAT_SESSION_RATE = os.getenv("CHAT_SESSION_RATE", "20/minute")
+
 # GET init untuk load history sesi (untuk front-end)
 @app.route("/api/chat", methods=["GET", "POST"])
-@limiter.limit("60/minute")
+@limiter.limit(CHAT_RATE, per_session=CHAT_SESSION_RATE, scope="chat")
 def api_chat():
     if request.method == "GET":
         if not _is_allowed_origin(request):
             abort(403)
-        return jsonify({"conversation": session.get("conversation", [])})
+        return jsonify({"conversation": session.history()})
     _precheck_request()
+    if request.accept_mimetypes.best == "text/event-stream":
+        return _chat_stream_handler()
     return _chat_handler()
 
+@app.route("/api/chat/stream", methods=["POST"])
+@limiter.limit(CHAT_RATE, per_session=CHAT_SESSION_RATE, scope="chat")
+def api_chat_stream():
+    _precheck_request()
+    return _chat_stream_handler()
+
 # Endpoint kompatibel widget yang POST ke /chat
 @app.route("/chat", methods=["POST"])
-@limiter.limit("60/minute")
+@limiter.limit(CHAT_RATE, per_session=CHAT_SESSION_RATE, scope="chat")
 def chat_from_widget():
     _precheck_request()
     return _chat_handler()
@@ -515,229 +2907,672 @@ def chat_from_widget():
 @limiter.limit("15/minute")
 def clear_session():
     _precheck_request()
-    session.pop("conversation", None)
+    session.clear_history()
     return jsonify({"ok": True})
 
 # ==================== Core chat handler ====================
-def _daily_backup_json(history_row):
-    if not BACKUP_JSON:
-        return
-    try:
-        # backup sekali per hari (append)
-        today_str = date.today().isoformat()
-        data = []
-        if os.path.exists(CHAT_JSON_BACKUP):
-            with open(CHAT_JSON_BACKUP, "r", encoding="utf-8") as f:
-                try:
-                    data = json.load(f) or []
-                except Exception:
-                    data = []
-        data.append(history_row)
-        with open(CHAT_JSON_BACKUP, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        logger.warning("Backup JSON gagal: %s", e)
-
 def _append_session(role, content):
-    session.setdefault("conversation", [])
-    session["conversation"].append({"role": role, "content": content})
-    session["conversation"] = session["conversation"][-50:]
+    session.append_turn(role, content)
 
-def _chat_handler():
+# sumber yang dilaporkan di body JSON (kompatibel dengan front-end lama)
+_SOURCE_IN_BODY = ("cache", "ai", "fallback")
+
+def _read_message():
+    g.chat_started = time.perf_counter()  # latensi per sumber di dashboard
+    g.stages = {}                          # detik per tahap -> /metrics (lihat Metrics)
+    _profile_start()
     payload = request.get_json(silent=True) or {}
     message = (payload.get("message") or "").strip()
     if not message:
-        return jsonify({"error": "Pesan kosong."}), 400
+        return None, (jsonify({"error": "Pesan kosong."}), 400)
     if len(message) > 1000:
-        return jsonify({"error": "Pesan terlalu panjang (max 1000 karakter)."}), 413
-
-    lang = detect_language(message)
-    corrected = correct_typo(message)
-    _append_session("user", corrected)
+        return None, (jsonify({"error": "Pesan terlalu panjang (max 1000 karakter)."}), 413)
+    return message, None
+
+def _record_reply(corrected, reply, source):
+    _append_session("bot", reply)
+    g.chat_source = source
+    started = g.get("chat_started")
+    latency_ms = (time.perf_counter() - started) * 1000 if started else None
+    with _stage("db"):
+        save_chat_db(corrected, reply, source=source, latency_ms=latency_ms)
+
+def _reply_response(corrected, reply, source, status=200, body=None):
+    """body: JSON yang sudah di-encode (jawaban lokal pre-render), jika ada."""
+    _record_reply(corrected, reply, source)
+    if body is not None:
+        resp = app.response_class(body, mimetype=app.json.mimetype)
+    else:
+        payload = {"reply": reply}
+        if source in _SOURCE_IN_BODY:
+            payload["source"] = source
+        resp = jsonify(payload)
+    resp.headers["Cache-Control"] = "no-store"
+    return resp, status
+
+def _local_response(corrected, local):
+    return _reply_response(corrected, local.reply, local.source, body=local.body)
+
+# ====== Jawaban lokal pre-render ======
+# Jawaban lokal yang statis (quick reply, brosur, pendaftaran, kartu prodi)
+# dirender + disanitasi sekali per versi data, lalu disimpan bersama body JSON
+# dan event SSE yang sudah di-encode sehingga jalur "gratis" tidak memanggil bleach.
+QUICK_REPLIES = {
+    "ga": "Oke 😊",
+    "nggak": "Siap, nggak masalah kok 😄",
+    "enggak": "Baiklah 😌",
+    "iya": "Iya, siap! 🙌",
+    "ok": "Oke 👍",
+    "oke": "Siap~ 🚀",
+    "wkwk": "Hehe 😆",
+    "hmm": "Hmm, bisa dijelasin sedikit lagi?"
+}
+LOCAL_REPLY_LIMIT = 512
+
+LocalReply = namedtuple("LocalReply", "reply source body event")
+
+class LocalReplyCache:
+    def __init__(self, limit: int = LOCAL_REPLY_LIMIT):
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.version = None
+        self.items = {}  # key -> (pin, LocalReply)
+
+    def get(self, key, source: str, render, pin=None) -> LocalReply:
+        """render() -> HTML yang sudah disanitasi; dipanggil hanya saat miss.
+        pin: objek sumber (mis. dict prodi) yang harus identik agar entri berlaku."""
+        with self.lock:
+            if self.version != knowledge.version:
+                self.items.clear()
+                self.version = knowledge.version
+            item = self.items.get(key)
+        if item is not None and item[0] is pin:
+            return item[1]
+        with _stage("sanitize"):
+            html = render()
+        entry = LocalReply(
+            html, source,
+            app.json.response({"reply": html}).get_data(),
+            _sse("done", {"reply": html, "source": source}).encode("utf-8"),
+        )
+        with self.lock:
+            if len(self.items) >= self.limit:
+                self.items.clear()
+            self.items[key] = (pin, entry)
+        return entry
+
+local_replies = LocalReplyCache()
+
+def _program_card_html(program):
+    specs_list = _normalize_specs(program.get("specializations"))
+    career = program.get("career_prospects") or []
+    accreditation = program.get("accreditation", "BAIK")
+    evening_class = program.get("evening_class", False)
+    return sanitize_html(
+        f"🎓 <b>{program.get('name')}</b><br>"
+        f"{program.get('description', '')}<br><br>"
+        f"📚 Spesialisasi: {', '.join(specs_list) if specs_list else 'Tidak tersedia'}<br>"
+        f"🎯 Prospek Karier: {', '.join(career) if career else 'Tidak tersedia'}<br>"
+        f"🏫 Akreditasi: {accreditation}<br>"
+        f"{'🕓 Tersedia kelas malam (Alih Jenjang/AJ).' if evening_class else 'Tidak Tersedia Kelas Malam.'}"
+    )
 
-    category = get_category(corrected)
-    reg_status = get_current_registration_status()
+def _brosur_html(brosur_url):
+    return sanitize_html(
+        f"📄 Brosur resmi TMM siap diunduh:<br><a href='{brosur_url}' target='_blank' rel='noopener'>⬇️ Unduh Brosur</a>"
+    )
 
+def _local_reply(corrected, category, program=None, with_cache=True):
+    """Jawaban tanpa AI (quick reply, data lokal, prodi, cache) -> LocalReply atau None."""
     # Quick replies
-    quick_replies = {
-        "ga": "Oke 😊",
-        "nggak": "Siap, nggak masalah kok 😄",
-        "enggak": "Baiklah 😌",
-        "iya": "Iya, siap! 🙌",
-        "ok": "Oke 👍",
-        "oke": "Siap~ 🚀",
-        "wkwk": "Hehe 😆",
-        "hmm": "Hmm, bisa dijelasin sedikit lagi?"
-    }
     msg_lower = corrected.lower().strip()
-    if msg_lower in quick_replies:
-        reply = sanitize_html(quick_replies[msg_lower])
-        _append_session("bot", reply)
-        save_chat_db(corrected, reply, source="quick")
-        _daily_backup_json({"timestamp": datetime.now().isoformat(), "user": corrected, "ai": reply, "source": "quick"})
-        resp = jsonify({"reply": reply})
-        resp.headers["Cache-Control"] = "no-store"
-        return resp
+    if msg_lower in QUICK_REPLIES:
+        return local_replies.get(("quick", msg_lower), "quick",
+                                 lambda: sanitize_html(QUICK_REPLIES[msg_lower]))
 
     # Kategori data lokal
     if category == "brosur":
+        # URL absolut tergantung host permintaan
         brosur_url = url_for("download_brosur", _external=True)
-        reply = f"📄 Brosur resmi TMM siap diunduh:<br><a href='{brosur_url}' target='_blank' rel='noopener'>⬇️ Unduh Brosur</a>"
-        reply = sanitize_html(reply)
-        _append_session("bot", reply)
-        save_chat_db(corrected, reply, source="local")
-        _daily_backup_json({"timestamp": datetime.now().isoformat(), "user": corrected, "ai": reply, "source": "local"})
-        resp = jsonify({"reply": reply})
-        resp.headers["Cache-Control"] = "no-store"
-        return resp
+        return local_replies.get(("brosur", brosur_url), "local", lambda: _brosur_html(brosur_url))
 
     if category in ("pendaftaran", "registration"):
-        # Kumpulkan link per-path bila ada, jika tidak pakai link global
-        links = []
-        for p in TRISAKTI.get("registration", {}).get("paths", []):
-            l = p.get("link")
-            if l and l not in links:
-                links.append(l)
-        if links:
-            links_html = "<br>".join([f"<a href='{l}' target='_blank' rel='noopener'>{l}</a>" for l in links])
-        else:
-            global_link = TRISAKTI.get("registration", {}).get("link", "")
-            links_html = f"<a href='{global_link}' target='_blank' rel='noopener'>{global_link}</a>" if global_link else "Belum tersedia"
-
-        status_html = get_current_registration_status().replace("\n", "<br>")
-        reply = f"📝 <b>Link pendaftaran resmi:</b><br>{links_html}<br><br>{status_html}"
-        reply = sanitize_html(reply)
-        _append_session("bot", reply)
-        save_chat_db(corrected, reply, source="local")
-        _daily_backup_json({"timestamp": datetime.now().isoformat(), "user": corrected, "ai": reply, "source": "local"})
-        resp = jsonify({"reply": reply})
-        resp.headers["Cache-Control"] = "no-store"
-        return resp
-
-    # Prodi
-    program = find_program_by_alias(corrected)
+        html = registration_reply_html()  # sudah disanitasi per segmen timeline
+        return local_replies.get(("registration", html), "local", lambda: html)
+
+    # Prodi (hasil router dari _prepare_turn): satu entri per prodi / spesialisasi
     if program:
-        specs_list = _normalize_specs(program.get("specializations"))
-        career = program.get("career_prospects") or []
-        accreditation = program.get("accreditation", "BAIK")
-        evening_class = program.get("evening_class", False)
-        reply = (
-            f"🎓 <b>{program.get('name')}</b><br>"
-            f"{program.get('description', '')}<br><br>"
-            f"📚 Spesialisasi: {', '.join(specs_list) if specs_list else 'Tidak tersedia'}<br>"
-            f"🎯 Prospek Karier: {', '.join(career) if career else 'Tidak tersedia'}<br>"
-            f"🏫 Akreditasi: {accreditation}<br>"
-            f"{'🕓 Tersedia kelas malam (Alih Jenjang/AJ).' if evening_class else 'Tidak Tersedia Kelas Malam.'}"
-        )
-        reply = sanitize_html(reply)
-        _append_session("bot", reply)
-        save_chat_db(corrected, reply, source="local-prodi")
-        _daily_backup_json({"timestamp": datetime.now().isoformat(), "user": corrected, "ai": reply, "source": "local-prodi"})
-        resp = jsonify({"reply": reply})
-        resp.headers["Cache-Control"] = "no-store"
-        return resp
-
-    # Cache sebelum AI
-    cached = cache_get_answer(corrected)
+        return local_replies.get(("prodi", id(program)), "local-prodi",
+                                 lambda: _program_card_html(program), pin=program)
+
+    # Cache sebelum AI (jalur async memanggilnya sendiri di thread)
+    if not with_cache:
+        return None
+    with _stage("cache"):
+        cached = cache_get_answer(corrected)
     if cached:
-        reply = sanitize_html(cached)
-        _append_session("bot", reply)
-        save_chat_db(corrected, reply, source="cache")
-        _daily_backup_json({"timestamp": datetime.now().isoformat(), "user": corrected, "ai": reply, "source": "cache"})
-        resp = jsonify({"reply": reply, "source": "cache"})
-        resp.headers["Cache-Control"] = "no-store"
-        return resp
+        return LocalReply(cached, "cache", None, None)
+    return None
 
-    # AI
-    short_history = session.get("conversation", [])[-6:]
-    system_prompt = (
-        "Kamu adalah TIMU, asisten dari Trisakti School of Multimedia (TMM). "
-        "Gaya bicara: manusiawi, hangat, ringkas, tidak kaku. "
-        "Gunakan BAHASA INDONESIA sebagai default. "
-        "Gunakan bahasa lain (Inggris/Jawa/Sunda) HANYA jika pengguna menulis dalam bahasa tersebut. "
-        "Jangan menyebut 'saya asisten AI'. Gunakan data berikut bila relevan:\n\n"
-        f"{json.dumps(TRISAKTI, ensure_ascii=False)}\n\n"
+def _build_prompt(corrected, lang, reg_status, category="general"):
+    """-> (prefix statis yang sudah di-render, bagian dinamis per permintaan)."""
+    kb = knowledge.current()
+    short_history = session.history()
+    kb_text = f"{retrieve_knowledge(corrected, category, kb=kb)}\n\n" if PROMPT_RETRIEVAL else ""
+    ctx, now = kb.data.get("current_context", {}), datetime.now()
+    dynamic = (
+        f"{kb_text}"
         f"Status Pendaftaran:\n{reg_status}\n\n"
         f"Riwayat Singkat:\n{json.dumps(short_history, ensure_ascii=False)}"
-    )
-    user_prompt = (
-        f"Tanggal: {TRISAKTI.get('current_context', {}).get('date')} | "
-        f"Jam: {TRISAKTI.get('current_context', {}).get('time')}\n"
+        "\n\n"
+        f"Tanggal: {ctx.get('date') or now.strftime('%d %B %Y')} | "
+        f"Jam: {ctx.get('time') or now.strftime('%H:%M WIB')}\n"
         f"Pertanyaan: {corrected}\nBahasa terdeteksi: {lang.upper()}\n"
         "Balas singkat, jelas, dan natural."
     )
+    return kb["prompt_prefix"], dynamic
 
-    try:
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=system_prompt + "\n\n" + user_prompt
-        )
-        reply_text = clean_response((response.text or "").strip())
-        if not reply_text:
+def _finalize_ai_reply(corrected, raw_text):
+    """Bersihkan jawaban Gemini dan simpan ke cache -> (reply, source)."""
+    reply_text = clean_response((raw_text or "").strip())
+    if not reply_text:
+        with _stage("cache"):
             cached2 = cache_get_answer(corrected)
-            if cached2:
-                reply = sanitize_html(format_links(cached2))
-                _append_session("bot", reply)
-                save_chat_db(corrected, reply, source="cache")
-                _daily_backup_json({"timestamp": datetime.now().isoformat(), "user": corrected, "ai": reply, "source": "cache"})
-                resp = jsonify({"reply": reply, "source": "cache"})
-                resp.headers["Cache-Control"] = "no-store"
-                return resp
-            kontak = TRISAKTI.get("institution", {}).get("contact", {})
-            wa = kontak.get("whatsapp")
-            ig = kontak.get("instagram")
-            wa_link = f"<a href='https://wa.me/{wa.replace('+','')}' target='_blank' rel='noopener'>{wa}</a>" if wa else "Belum tersedia"
-            ig_link = f"<a href='https://www.instagram.com/{ig}' target='_blank' rel='noopener'>@{ig}</a>" if ig else "Belum tersedia"
-            reply_text = (
-                "Aku belum punya info lengkap untuk itu 😅<br>"
-                "Hubungi petugas kami ya:<br>"
-                f"📱 WhatsApp: {wa_link}<br>"
-                f"📸 Instagram: {ig_link}"
-            )
+        if cached2:
+            return cached2, "cache"
+        kontak = knowledge.current().data.get("institution", {}).get("contact", {})
+        wa = kontak.get("whatsapp")
+        ig = kontak.get("instagram")
+        wa_link = f"<a href='https://wa.me/{wa.replace('+','')}' target='_blank' rel='noopener'>{wa}</a>" if wa else "Belum tersedia"
+        ig_link = f"<a href='https://www.instagram.com/{ig}' target='_blank' rel='noopener'>@{ig}</a>" if ig else "Belum tersedia"
+        reply_text = (
+            "Aku belum punya info lengkap untuk itu 😅<br>"
+            "Hubungi petugas kami ya:<br>"
+            f"📱 WhatsApp: {wa_link}<br>"
+            f"📸 Instagram: {ig_link}"
+        )
 
-        reply_text = format_links(reply_text)
-        reply_text = sanitize_html(reply_text)
-        try:
+    with _stage("sanitize"):
+        reply_text = format_reply(reply_text)
+    try:
+        with _stage("db"):
             cache_put_answer(corrected, reply_text)
-        except Exception as e:
-            logger.warning("Cache put error: %s", e)
-
-        _append_session("bot", reply_text)
-        save_chat_db(corrected, reply_text, source="ai")
-        _daily_backup_json({"timestamp": datetime.now().isoformat(), "user": corrected, "ai": reply_text, "source": "ai"})
-        resp = jsonify({"reply": reply_text, "source": "ai"})
-        resp.headers["Cache-Control"] = "no-store"
-        return resp
+    except Exception as e:
+        logger.warning("Cache put error: %s", e)
+    return reply_text, "ai"
 
-    except google_exceptions.GoogleAPIError as e:
-        logger.error("Gemini API Error: %s", e)
+def _api_error_reply(corrected, e):
+    logger.error("Gemini API Error: %s", e)
+    with _stage("cache"):
         cached3 = cache_get_answer(corrected)
-        if cached3:
-            reply = sanitize_html(format_links(cached3))
-            _append_session("bot", reply)
-            save_chat_db(corrected, reply, source="cache")
-            _daily_backup_json({"timestamp": datetime.now().isoformat(), "user": corrected, "ai": reply, "source": "cache"})
-            resp = jsonify({"reply": reply, "source": "cache"})
-            resp.headers["Cache-Control"] = "no-store"
-            return resp
-        kontak = TRISAKTI.get("institution", {}).get("contact", {})
-        wa = kontak.get("whatsapp", "")
-        ig = kontak.get("instagram", "")
-        reply_text = (
-            "Koneksi AI sedang bermasalah. Coba lagi nanti ya 🙏<br>"
-            f"📱 WhatsApp: <a href='https://wa.me/{wa.replace('+','')}' target='_blank' rel='noopener'>{wa}</a><br>"
-            f"📸 Instagram: <a href='https://www.instagram.com/{ig}' target='_blank' rel='noopener'>@{ig}</a>"
-        )
-        reply_text = sanitize_html(reply_text)
-        _append_session("bot", reply_text)
-        save_chat_db(corrected, reply_text, source="fallback")
-        _daily_backup_json({"timestamp": datetime.now().isoformat(), "user": corrected, "ai": reply_text, "source": "fallback"})
-        resp = jsonify({"reply": reply_text, "source": "fallback"})
-        resp.headers["Cache-Control"] = "no-store"
-        return resp, 500
+    if cached3:
+        return cached3, "cache"
+    kontak = knowledge.current().data.get("institution", {}).get("contact", {})
+    wa = kontak.get("whatsapp", "")
+    ig = kontak.get("instagram", "")
+    reply_text = (
+        "Koneksi AI sedang bermasalah. Coba lagi nanti ya 🙏<br>"
+        f"📱 WhatsApp: <a href='https://wa.me/{wa.replace('+','')}' target='_blank' rel='noopener'>{wa}</a><br>"
+        f"📸 Instagram: <a href='https://www.instagram.com/{ig}' target='_blank' rel='noopener'>@{ig}</a>"
+    )
+    with _stage("sanitize"):
+        return sanitize_html(reply_text), "fallback"
+
+def _prepare_turn(message):
+    with _stage("lang"):
+        lang = detect_language(message)
+    with _stage("typo"):
+        corrected = correct_typo(message)
+    _append_session("user", corrected)
+    with _stage("route"):
+        category, program = route_message(corrected)
+        reg_status = get_current_registration_status()
+    return lang, corrected, category, program, reg_status
+
+def _chat_handler():
+    message, error = _read_message()
+    if error:
+        return error
+    lang, corrected, category, program, reg_status = _prepare_turn(message)
+
+    local = _local_reply(corrected, category, program)
+    if local:
+        return _local_response(corrected, local)
+
+    # AI (single-flight: pertanyaan kembar yang sedang diproses cukup ditunggu)
+    lease, shared = singleflight_enter(corrected)
+    if shared:
+        return _reply_response(corrected, shared, "cache")
+    prefix, dynamic = _build_prompt(corrected, lang, reg_status, category)
+    try:
+        with _stage("gemini"):
+            response = gemini.generate_content(**context_cache.request(prefix, dynamic))
+        return _reply_response(corrected, *_finalize_ai_reply(corrected, response.text))
+    except (google_exceptions.GoogleAPIError, GeminiUnavailable) as e:
+        reply, source = _api_error_reply(corrected, e)
+        return _reply_response(corrected, reply, source, 500 if source == "fallback" else 200)
     except Exception as e:
         logger.error("Internal Error: %s", e)
         return jsonify({"error": "Kesalahan sistem internal."}), 500
+    finally:
+        singleflight_leave(lease)
+
+# ====== Async (ASGI, lihat asgi.py) ======
+async def chat_handler_async():
+    """Versi async _chat_handler. Routing lokal tetap sinkron; cache SQLite, Gemini dan
+    simpan cache di-await sehingga satu worker melayani banyak permintaan sekaligus."""
+    message, error = _read_message()
+    if error:
+        return error
+    lang, corrected, category, program, reg_status = _prepare_turn(message)
+
+    local = _local_reply(corrected, category, program, with_cache=False)
+    if local:
+        return _local_response(corrected, local)
+    with _stage("cache"):
+        cached = await asyncio.to_thread(cache_get_answer, corrected)
+    if cached:
+        return _reply_response(corrected, cached, "cache")
+
+    # AI
+    lease, shared = await asyncio.to_thread(singleflight_enter, corrected)
+    if shared:
+        return _reply_response(corrected, shared, "cache")
+    prefix, dynamic = _build_prompt(corrected, lang, reg_status, category)
+    try:
+        with _stage("gemini"):
+            kwargs = await asyncio.to_thread(context_cache.request, prefix, dynamic)
+            response = await gemini.agenerate_content(**kwargs)
+        reply, source = await asyncio.to_thread(_finalize_ai_reply, corrected, response.text)
+        return _reply_response(corrected, reply, source)
+    except (google_exceptions.GoogleAPIError, GeminiUnavailable) as e:
+        reply, source = await asyncio.to_thread(_api_error_reply, corrected, e)
+        return _reply_response(corrected, reply, source, 500 if source == "fallback" else 200)
+    except Exception as e:
+        logger.error("Internal Error: %s", e)
+        return jsonify({"error": "Kesalahan sistem internal."}), 500
+    finally:
+        await asyncio.to_thread(singleflight_leave, lease)
+
+# ====== Streaming (SSE) ======
+_STREAM_INLINE_TAG = re.compile(r"<(/?)(a|b|strong|em)\b[^>]*>", re.I)
+
+class StreamFormatter:
+    """Format potongan jawaban Gemini secara bertahap, hanya di batas yang aman:
+    setelah spasi, di luar tag, dan tidak saat tag inline masih terbuka."""
+
+    def __init__(self):
+        self.buf = ""
+        self.seen = set()  # URL yang sudah dijadikan link (dedup lintas potongan)
+
+    def feed(self, text: str) -> str:
+        self.buf += text or ""
+        cut = self._safe_cut()
+        if cut <= 0:
+            return ""
+        seg, self.buf = self.buf[:cut], self.buf[cut:]
+        return self._render(seg)
+
+    def close(self) -> str:
+        seg, self.buf = self.buf, ""
+        return self._render(seg)
+
+    def _safe_cut(self) -> int:
+        i = max(self.buf.rfind(" "), self.buf.rfind("\n"))
+        if i < 0:
+            return 0
+        head = self.buf[:i + 1]
+        if head.rfind("<") > head.rfind(">"):
+            return 0
+        depth = 0
+        for m in _STREAM_INLINE_TAG.finditer(head):
+            depth += -1 if m.group(1) else 1
+        return 0 if depth > 0 else i + 1
+
+    def _render(self, seg: str) -> str:
+        if not seg:
+            return ""
+        with _stage("sanitize"):
+            html = format_reply(clean_response(seg), seen=self.seen)
+        # format_links men-strip spasi; pertahankan pemisah antar potongan
+        return html + " " if html and seg[-1].isspace() else html
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _sse_response(body):
+    return Response(body, mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"})
+
+def _save_session_now():
+    # header (cookie) sudah terkirim saat streaming; simpan isi sesi secara manual
+    try:
+        app.session_interface.save_session(app, session, app.response_class())
+    except Exception as e:
+        logger.warning("Gagal menyimpan sesi setelah streaming: %s", e)
+
+def _chat_stream_handler():
+    message, error = _read_message()
+    if error:
+        return error
+    lang, corrected, category, program, reg_status = _prepare_turn(message)
+
+    local = _local_reply(corrected, category, program)
+    if local:
+        _record_reply(corrected, local.reply, local.source)
+        return _sse_response([local.event or _sse("done", {"reply": local.reply, "source": local.source})])
+
+    lease, shared = singleflight_enter(corrected)
+    if shared:
+        _record_reply(corrected, shared, "cache")
+        return _sse_response([_sse("done", {"reply": shared, "source": "cache"})])
+    prefix, dynamic = _build_prompt(corrected, lang, reg_status, category)
+
+    @stream_with_context
+    def generate():
+        parts, fmt = [], StreamFormatter()
+        try:
+            # tahap gemini = menunggu potongan berikutnya; format per potongan masuk sanitize
+            with _stage("gemini"):
+                it = iter(gemini.generate_content_stream(**context_cache.request(prefix, dynamic)))
+            while True:
+                with _stage("gemini"):
+                    chunk = next(it, None)
+                if chunk is None:
+                    break
+                text = getattr(chunk, "text", None) or ""
+                parts.append(text)
+                html = fmt.feed(text)
+                if html:
+                    yield _sse("chunk", {"html": html})
+            tail = fmt.close()
+            if tail:
+                yield _sse("chunk", {"html": tail})
+            reply, source = _finalize_ai_reply(corrected, "".join(parts))
+        except (google_exceptions.GoogleAPIError, GeminiUnavailable) as e:
+            reply, source = _api_error_reply(corrected, e)
+        except Exception as e:
+            logger.error("Internal Error (stream): %s", e)
+            yield _sse("error", {"error": "Kesalahan sistem internal."})
+            return
+        finally:
+            singleflight_leave(lease)
+        _record_reply(corrected, reply, source)
+        _save_session_now()
+        # jawaban final (kanonik) menggantikan potongan di sisi klien
+        yield _sse("done", {"reply": reply, "source": source})
+
+    resp = _sse_response(generate())
+    # cadangan bila generator tidak pernah berjalan (klien putus sebelum stream mulai)
+    resp.call_on_close(lambda: singleflight_leave(lease))
+    return resp
+
+# ==================== Metrics ====================
+# Timer per tahap pipeline chat dikumpulkan per permintaan di g.stages, lalu saat
+# teardown dimasukkan ke histogram per (tahap, source). Bucket log 1.25x dalam
+# mikrodetik (gaya HDR: galat relatif <= 25%, 1 us .. ~45 s). Histogram disimpan
+# di file mmap bersama (satu flock per permintaan) sehingga /metrics di worker
+# mana pun melihat total semua worker.
+METRICS_PATH = os.getenv("METRICS_PATH", DB_PATH + ".metrics")
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")  # Bearer token scraper Prometheus
+METRIC_STAGES = ("lang", "typo", "route", "cache", "gemini", "sanitize", "db", "total")
+METRIC_SOURCES = ("quick", "local", "local-prodi", "cache", "ai", "fallback")
+METRIC_BUCKET_BASE = 1.25
+METRIC_BUCKETS = 80
+METRIC_EXPORT_STEP = 4      # /metrics memakai tiap bucket ke-4 sebagai batas le (~2.4x)
+
+def _metric_bucket(us: float) -> int:
+    return min(METRIC_BUCKETS - 1, max(0, math.ceil(math.log(max(us, 1.0), METRIC_BUCKET_BASE))))
+
+class _stage:
+    """with _stage("cache"): ... -> durasi blok ditambahkan ke g.stages["cache"]
+    (hanya di dalam permintaan chat). Kelas biasa, bukan @contextmanager: ~1 us."""
+    __slots__ = ("name", "t0")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+
+    def __exit__(self, *exc):
+        stages = g.get("stages") if has_request_context() else None
+        if stages is not None:
+            stages[self.name] = stages.get(self.name, 0.0) + time.perf_counter() - self.t0
+
+class SharedHistograms:
+    """Header: magic layout, rasio sampel profil (double), epoch profil; lalu per
+    (tahap, source) sel [count, sum_us, bucket0..bucketN] sebagai uint64."""
+    HEADER = 24
+
+    def __init__(self, path: str, stages, sources, buckets: int):
+        self.path = path
+        self.stages = {s: i for i, s in enumerate(stages)}
+        self.sources = {s: i for i, s in enumerate(sources)}
+        self.buckets = buckets
+        self.cell = 2 + buckets
+        self.size = self.HEADER + len(stages) * len(sources) * self.cell * 8
+        self._q = None  # memoryview uint64 atas mmap: indeks langsung tanpa struct
+        layout = repr((tuple(stages), tuple(sources), buckets)).encode()
+        self.magic = int.from_bytes(hashlib.sha1(layout).digest()[:8], "little")
+        self.lock = threading.Lock()  # lihat SharedGeneration: flock tidak mengecualikan thread
+        self._fd = None
+        self._mm = None
+        self._pid = None
+
+    def _map(self):
+        # sama dengan SharedGeneration: mmap dibuka ulang per pid
+        if self._pid != os.getpid():
+            with self.lock:
+                if self._pid != os.getpid():
+                    self._open()
+        return self._mm
+
+    def _open(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            # file baru atau layout berubah (tahap/source ditambah) -> mulai dari nol
+            if os.fstat(fd).st_size != self.size or struct.unpack("<Q", os.pread(fd, 8, 0))[0] != self.magic:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, self.size)
+                os.pwrite(fd, struct.pack("<Qd", self.magic, PROFILE_SAMPLE_RATE), 0)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        self._fd, self._mm = fd, mmap.mmap(fd, self.size)
+        self._q = memoryview(self._mm).cast("Q")
+        self._pid = os.getpid()  # terakhir: thread lain baru memakai _q setelah siap
+
+    def _index(self, stage: int, source: int) -> int:
+        # indeks uint64 awal sel (header = 3 slot)
+        return self.HEADER // 8 + (stage * len(self.sources) + source) * self.cell
+
+    def observe(self, source: str, stages: dict):
+        """stages: {tahap: detik} dari satu permintaan."""
+        src = self.sources.get(source)
+        if src is None:
+            return
+        try:
+            self._map()
+            q = self._q
+            with self.lock:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+                try:
+                    for name, secs in stages.items():
+                        st = self.stages.get(name)
+                        if st is None:
+                            continue
+                        us = secs * 1e6
+                        i = self._index(st, src)
+                        q[i] += 1
+                        q[i + 1] += int(us)
+                        q[i + 2 + _metric_bucket(us)] += 1
+                finally:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+        except Exception as e:
+            logger.warning("Gagal mencatat metrics: %s", e)
+
+    def snapshot(self) -> dict:
+        """-> {(tahap, source): (count, sum_us, [bucket...])} untuk sel yang terisi."""
+        self._map()
+        out = {}
+        for stage, st in self.stages.items():
+            for source, src in self.sources.items():
+                i = self._index(st, src)
+                cell = self._q[i:i + self.cell].tolist()
+                if cell[0]:
+                    out[(stage, source)] = (cell[0], cell[1], list(cell[2:]))
+        return out
+
+    def profile_state(self):
+        try:
+            return struct.unpack_from("<dQ", self._map(), 8)
+        except Exception:
+            return 0.0, 0
+
+    def set_profile(self, rate: float, reset: bool = False):
+        mm = self._map()
+        with self.lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                epoch = struct.unpack_from("<Q", mm, 16)[0]
+                struct.pack_into("<dQ", mm, 8, rate, epoch + 1 if reset else epoch)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+# ====== Profil cProfile tersampel ======
+# Rasio sampel ada di header file metrics: POST /admin/profile mengubahnya untuk
+# semua worker tanpa restart. Tiap worker menggabungkan profil sampelnya dan
+# menulisnya ke PROFILE_DIR/timu-<pid>.pstats; GET /admin/profile menggabungkan
+# file semua worker. Reset menaikkan epoch agar worker membuang profil lamanya.
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(TMP_DIR, "timu-profile"))
+_profile = {"stats": None, "epoch": None, "lock": threading.Lock()}
+_profiling = threading.local()  # satu profiler per thread (loop ASGI berbagi thread)
+
+metrics = SharedHistograms(METRICS_PATH, METRIC_STAGES, METRIC_SOURCES, METRIC_BUCKETS)
+
+def _profile_start():
+    rate, _ = metrics.profile_state()
+    if rate <= 0 or getattr(_profiling, "active", False) or random.random() >= rate:
+        return
+    import cProfile
+    g.profiler = cProfile.Profile()
+    _profiling.active = True
+    g.profiler.enable()
+
+def _profile_stop():
+    prof = g.pop("profiler", None)
+    if prof is None:
+        return
+    prof.disable()
+    _profiling.active = False
+    import pstats
+    _, epoch = metrics.profile_state()
+    path = os.path.join(PROFILE_DIR, f"timu-{os.getpid()}.pstats")
+    with _profile["lock"]:
+        if _profile["stats"] is None or _profile["epoch"] != epoch:
+            _profile["stats"], _profile["epoch"] = pstats.Stats(prof), epoch
+        else:
+            _profile["stats"].add(prof)
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            _profile["stats"].dump_stats(path + ".tmp")
+            os.replace(path + ".tmp", path)
+        except Exception as e:
+            logger.warning("Gagal menyimpan profil: %s", e)
+
+def read_profiles(sort: str = "cumulative", top: int = 40) -> str:
+    import io
+    import pstats
+    files = [os.path.join(PROFILE_DIR, f) for f in sorted(os.listdir(PROFILE_DIR))
+             if f.endswith(".pstats")] if os.path.isdir(PROFILE_DIR) else []
+    if not files:
+        return "Belum ada sampel profil.\n"
+    out = io.StringIO()
+    pstats.Stats(*files, stream=out).sort_stats(sort).print_stats(top)
+    return out.getvalue()
+
+def clear_profiles():
+    if os.path.isdir(PROFILE_DIR):
+        for f in os.listdir(PROFILE_DIR):
+            if f.endswith(".pstats"):
+                os.remove(os.path.join(PROFILE_DIR, f))
+
+@app.teardown_request
+def _observe_chat(exc):
+    if "stages" not in g:
+        return
+    _profile_stop()
+    source = g.get("chat_source")
+    if source:
+        g.stages["total"] = time.perf_counter() - g.chat_started
+        metrics.observe(source, g.stages)
+
+def render_metrics() -> str:
+    """Format teks Prometheus (histogram kumulatif, batas le dalam detik)."""
+    edges = range(0, METRIC_BUCKETS - 1, METRIC_EXPORT_STEP)
+    les = [f"{METRIC_BUCKET_BASE ** b / 1e6:.6g}" for b in edges]
+    lines = [
+        "# HELP timu_chat_stage_seconds Durasi tahap pipeline chat per source.",
+        "# TYPE timu_chat_stage_seconds histogram",
+    ]
+    for (stage, source), (count, sum_us, buckets) in metrics.snapshot().items():
+        labels = f'stage="{stage}",source="{source}"'
+        cum, prev = 0, 0
+        for b, le in zip(edges, les):
+            cum += sum(buckets[prev:b + 1])
+            prev = b + 1
+            lines.append(f'timu_chat_stage_seconds_bucket{{{labels},le="{le}"}} {cum}')
+        lines.append(f'timu_chat_stage_seconds_bucket{{{labels},le="+Inf"}} {count}')
+        lines.append(f"timu_chat_stage_seconds_sum{{{labels}}} {sum_us / 1e6:.6f}")
+        lines.append(f"timu_chat_stage_seconds_count{{{labels}}} {count}")
+    rate, _ = metrics.profile_state()
+    lines += [
+        "# HELP timu_profile_sample_rate Rasio permintaan chat yang diprofil cProfile.",
+        "# TYPE timu_profile_sample_rate gauge",
+        f"timu_profile_sample_rate {rate:g}",
+        "# HELP timu_gemini_calls_total Hasil panggilan Gemini (worker ini saja).",
+        "# TYPE timu_gemini_calls_total counter",
+    ]
+    lines += [f'timu_gemini_calls_total{{result="{k}",pid="{os.getpid()}"}} {v}'
+              for k, v in sorted(gemini.stats.items())]
+    return "\n".join(lines) + "\n"
+
+@app.route("/metrics")
+@limiter.limit("30/minute")
+def metrics_endpoint():
+    auth = request.headers.get("Authorization", "")
+    token_ok = bool(METRICS_TOKEN) and secrets.compare_digest(auth, f"Bearer {METRICS_TOKEN}")
+    if not (token_ok or session.get("admin_logged_in")):
+        abort(403)
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/admin/profile", methods=["GET", "POST"])
+@limiter.limit("10/minute")
+def admin_profile():
+    if not session.get("admin_logged_in"):
+        return redirect(url_for("login"))
+    if request.method == "POST":
+        _precheck_request()
+        payload = request.get_json(silent=True) or request.form
+        try:
+            rate = min(1.0, max(0.0, float(payload.get("rate", metrics.profile_state()[0]))))
+        except (TypeError, ValueError):
+            return jsonify({"error": "rate harus angka 0..1"}), 400
+        reset = str(payload.get("reset", "")).lower() in ("1", "true", "yes")
+        metrics.set_profile(rate, reset=reset)
+        if reset:
+            clear_profiles()
+        logger.info("🔬 Sampel profil diubah: rate=%s reset=%s", rate, reset)
+        return jsonify({"rate": rate, "reset": reset})
+    sort = request.args.get("sort", "cumulative")
+    if sort not in ("cumulative", "tottime", "calls", "ncalls"):
+        sort = "cumulative"
+    top = min(200, max(1, request.args.get("top", 40, type=int)))
+    rate, _ = metrics.profile_state()
+    body = f"# rate={rate:g} sort={sort} top={top}\n" + read_profiles(sort, top)
+    return Response(body, mimetype="text/plain")
 
 # ==================== Security headers ====================
 @app.after_request
@@ -776,16 +3611,30 @@ def not_found(e):
 
 @app.errorhandler(429)
 def rate_limited(e):
-    return jsonify({"error": "Terlalu banyak permintaan. Coba lagi nanti."}), 429
+    resp = jsonify({"error": "Terlalu banyak permintaan. Coba lagi nanti."})
+    if g.get("retry_after"):
+        resp.headers["Retry-After"] = str(g.retry_after)
+    return resp, 429
 
 @app.errorhandler(500)
 def internal_error(e):
     logger.error("Error 500: %s", e)
     return jsonify({"error": "Terjadi kesalahan di server TIMU."}), 500
 
+# ==================== Startup (preload gunicorn) ====================
+# Dengan preload_app (gunicorn.conf.py) modul ini diimpor sekali di master: kamus
+# SymSpell, data JSON + indeks turunannya, google-genai dan client-nya sudah ada
+# sebelum fork dan dibagi copy-on-write ke semua worker. Thread latar, koneksi
+# SQLite dan mmap dibuat ulang per pid, jadi master tidak boleh menyimpannya.
+def warm_shared_state():
+    # modul yang biasanya lazy dimuat di master agar worker tidak memuatnya sendiri
+    _langdetect()
+
+def prepare_fork():
+    close_db_conn()
+
 # ==================== Main ====================
 if __name__ == "__main__":
-    init_db()
     port = int(os.environ.get("PORT", 10000))
     logger.info("TIMU berjalan di port %s, DB=%s", port, DB_PATH)
     app.run(host="0.0.0.0", port=port)
\ No newline at end of file
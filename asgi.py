@@ -0,0 +1,147 @@
+# Entry point ASGI TIMU (mode asyncio), pendamping wsgi.py.
+#
+#   gunicorn -k uvicorn.workers.UvicornWorker -w 2 asgi:application
+#
+# POST chat non-streaming (/api/chat, /chat) dilayani langsung oleh
+# chat_handler_async: panggilan Gemini, cache dan penyimpanan di-await sehingga
+# satu worker tidak terkunci selama menunggu Gemini. Route lain (UI, admin,
+# SSE) tetap lewat aplikasi Flask WSGI yang dibungkus asgiref.
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+import app as timu
+
+flask_app = timu.app
+wsgi_fallback = WsgiToAsgi(flask_app)
+
+# jumlah thread untuk I/O blocking (SQLite, client.aio google-genai) per worker
+ASGI_IO_THREADS = int(os.getenv("ASGI_IO_THREADS", "64"))
+ASYNC_CHAT_PATHS = {"/api/chat", "/chat"}
+
+# ProxyFix yang sama dengan app.wsgi_app, tapi hanya mengembalikan environ-nya
+_proxy_fix = ProxyFix(lambda environ, start_response: environ, x_for=1, x_proto=1)
+_executor_ready = set()
+
+
+def _ensure_executor():
+    loop = asyncio.get_running_loop()
+    if id(loop) not in _executor_ready:
+        loop.set_default_executor(ThreadPoolExecutor(ASGI_IO_THREADS, thread_name_prefix="timu-io"))
+        _executor_ready.add(id(loop))
+
+
+def _is_async_chat(scope) -> bool:
+    if scope["type"] != "http" or scope["method"] != "POST":
+        return False
+    if scope["path"] not in ASYNC_CHAT_PATHS:
+        return False
+    # klien SSE tetap ke handler streaming WSGI
+    for name, value in scope.get("headers", []):
+        if name == b"accept" and b"text/event-stream" in value:
+            return False
+    return True
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+
+def _environ(scope, body: bytes) -> dict:
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf8").decode("latin1"),
+        "PATH_INFO": scope["path"].encode("utf8").decode("latin1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("ascii"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1] or 80),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin1")
+        value = value.decode("latin1")
+        if name == "content-length":
+            key = "CONTENT_LENGTH"
+        elif name == "content-type":
+            key = "CONTENT_TYPE"
+        else:
+            key = "HTTP_" + name.upper().replace("-", "_")
+        if key in environ:
+            value = environ[key] + "," + value
+        environ[key] = value
+    return _proxy_fix(environ, None)
+
+
+async def _dispatch_chat():
+    """full_dispatch_request Flask, tapi view-nya di-await."""
+    try:
+        rv = flask_app.preprocess_request()
+        if rv is None:
+            timu.limiter.check()  # limit route chat (bucket IP + sesi bersama)
+            timu._precheck_request()
+            rv = await timu.chat_handler_async()
+    except Exception as e:
+        rv = flask_app.handle_user_exception(e)
+    return flask_app.finalize_request(rv)
+
+
+async def _async_chat(scope, receive, send):
+    body = await _read_body(receive)
+    ctx = flask_app.request_context(_environ(scope, body))
+    error = None
+    try:
+        ctx.push()
+        try:
+            response = await _dispatch_chat()
+        except Exception as e:
+            error = e
+            response = flask_app.handle_exception(e)
+        payload = response.get_data()
+        headers = [(k.lower().encode("latin1"), v.encode("latin1"))
+                   for k, v in response.headers.items()]
+        status = response.status_code
+    finally:
+        ctx.pop(error)
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": payload})
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                timu.flush_chat_writes()
+                timu.flush_cache_hits()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    _ensure_executor()
+    if _is_async_chat(scope):
+        await _async_chat(scope, receive, send)
+    else:
+        await wsgi_fallback(scope, receive, send)
@@ -0,0 +1,93 @@
+"""Bandingkan dua hasil bench JSON (mis. dari dua commit).
+
+Jalankan dari root repo:  python bench/compare.py lama.json baru.json [--filter p50] [--threshold 0.1] [--fail]
+
+Semua angka di hasil diratakan menjadi path (functions_us.cache_get_miss.p50, ...).
+Untuk latensi/waktu lebih kecil lebih baik; untuk throughput, success_rate dan
+match_rate lebih besar lebih baik; jumlah sampel (n, count, requests) tidak dinilai.
+Perubahan yang lebih buruk dari --threshold ditandai REGRESI; --fail -> exit 1.
+--normalize membagi metrik waktu dengan rasio meta.calibration_us kedua run
+(mengurangi noise mesin yang sedang sibuk atau mesin yang berbeda).
+"""
+import argparse
+import json
+import re
+import sys
+
+SKIP_KEYS = {"meta", "config"}  # di level mana pun (mis. load.config)
+HIGHER_BETTER = re.compile(r"(rps|throughput|success_rate|match_rate|hit_rate|distinct)")
+TIME_KEY = re.compile(r"(_us|_ms|_s)(\.|$)|(^|\.)(p50|p95|p99|mean|max)$")
+NEUTRAL = re.compile(r"(^|\.)(n|count|requests|messages|calls|runs|rounds|modules|workers|cpus)$")
+
+
+def flatten(node, prefix=""):
+    out = {}
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key in SKIP_KEYS:
+                continue
+            out.update(flatten(value, f"{prefix}.{key}" if prefix else str(key)))
+    elif isinstance(node, (int, float)) and not isinstance(node, bool):
+        out[prefix] = float(node)
+    return out
+
+
+def diff(old, new, threshold, pattern=None, normalize=False):
+    a, b = flatten(old), flatten(new)
+    scale = 1.0
+    if normalize:
+        ca = old.get("meta", {}).get("calibration_us")
+        cb = new.get("meta", {}).get("calibration_us")
+        scale = ca / cb if ca and cb else 1.0
+    rows = []
+    for key in sorted(a.keys() & b.keys()):
+        if pattern and not re.search(pattern, key):
+            continue
+        before, after = a[key], b[key]
+        if TIME_KEY.search(key) and not HIGHER_BETTER.search(key):
+            after *= scale
+        change = (after - before) / before if before else (0.0 if after == before else float("inf"))
+        if NEUTRAL.search(key):
+            verdict = ""
+        else:
+            worse = -change if HIGHER_BETTER.search(key) else change
+            verdict = "REGRESI" if worse > threshold else ("lebih baik" if worse < -threshold else "")
+        rows.append({"key": key, "old": before, "new": after, "change": change, "verdict": verdict})
+    return rows, sorted(a.keys() - b.keys()), sorted(b.keys() - a.keys())
+
+
+def _fmt(x):
+    return f"{x:.4g}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--filter", help="regex path yang ditampilkan (mis. 'p50|rps')")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    parser.add_argument("--normalize", action="store_true", help="koreksi kecepatan mesin (calibration_us)")
+    parser.add_argument("--all", action="store_true", help="tampilkan juga yang tidak berubah berarti")
+    parser.add_argument("--fail", action="store_true", help="exit 1 bila ada regresi")
+    parser.add_argument("--out", help="simpan hasil perbandingan JSON")
+    args = parser.parse_args()
+    with open(args.old, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    rows, removed, added = diff(old, new, args.threshold, args.filter, args.normalize)
+    print(f"lama: {old.get('meta', {}).get('commit')}  baru: {new.get('meta', {}).get('commit')}  "
+          f"ambang: {args.threshold:.0%}")
+    width = max((len(r["key"]) for r in rows), default=10)
+    for r in rows:
+        if args.all or r["verdict"]:
+            change = "baru" if r["change"] == float("inf") else f"{r['change']:+.1%}"
+            print(f"{r['key']:<{width}}  {_fmt(r['old']):>10} -> {_fmt(r['new']):>10}  {change:>8}  {r['verdict']}")
+    if removed or added:
+        print(f"({len(removed)} metrik hilang, {len(added)} metrik baru)")
+    regressions = [r for r in rows if r["verdict"] == "REGRESI"]
+    print(f"{len(regressions)} regresi, {sum(r['verdict'] == 'lebih baik' for r in rows)} lebih baik")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"rows": rows, "removed": removed, "added": added}, f, ensure_ascii=False, indent=2)
+    sys.exit(1 if args.fail and regressions else 0)
@@ -0,0 +1,204 @@
+"""Korpus pertanyaan calon mahasiswa yang bisa diputar ulang (replay) untuk benchmark.
+
+Jalankan dari root repo:  python bench/corpus.py [--n 800] [--seed 7] [--out bench/corpus.jsonl]
+
+Korpus dibangkitkan deterministik dari seed: pertanyaan baku per kategori,
+variasi typo/singkatan chat, campur Inggris (code-mixing), Jawa/Sunda, balasan
+singkat, dan pertanyaan terbuka di luar data lokal (ke Gemini, kecuali cache
+kemiripan menganggapnya sama dengan pertanyaan sebelumnya). Frekuensi pertanyaan
+mengikuti distribusi Zipf sehingga ada pengulangan seperti trafik asli.
+bench/corpus.jsonl adalah hasil `--n 800 --seed 7` dan dipakai bench lain agar
+hasil antar commit membandingkan input yang sama persis.
+"""
+import argparse
+import json
+import os
+import random
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CORPUS_PATH = os.path.join(HERE, "corpus.jsonl")
+
+BASE = {
+    "biaya": [
+        "berapa biaya kuliah per semester",
+        "biaya kuliah di tmm berapa ya kak",
+        "apakah ada uang gedung",
+        "berapa kali cicilan biaya kuliah",
+        "biaya pendaftaran berapa",
+    ],
+    "pendaftaran": [
+        "bagaimana cara daftar kuliah di tmm",
+        "pendaftaran gelombang berapa sekarang",
+        "link daftar online dimana",
+        "syarat dokumen pendaftaran apa saja",
+        "tes masuk online atau offline",
+        "kapan pendaftaran ditutup",
+    ],
+    "prodi": [
+        "jurusan apa saja yang ada di tmm",
+        "jurusan animasi ada kelas malam ga",
+        "prospek kerja lulusan broadcasting apa aja",
+        "akreditasi prodi dkv apa",
+        "d4 kemasan belajar apa saja",
+        "apa bedanya dkv sama desain iklan",
+        "ada jurusan game design ga",
+    ],
+    "beasiswa": [
+        "beasiswa kip masih buka?",
+        "apakah ada beasiswa selain kip",
+        "kapan batas pendaftaran akun kip kuliah",
+        "nomor hotline kip kuliah berapa",
+    ],
+    "kampus": [
+        "dimana kampus trisakti multimedia",
+        "fasilitas kampus apa saja",
+        "apakah tmm sama dengan universitas trisakti",
+        "tahun berapa tmm didirikan",
+        "kegiatan mahasiswa apa saja",
+        "jam kerja kantor kampus",
+    ],
+    "kontak": [
+        "nomor whatsapp admin berapa",
+        "email kampus apa",
+        "minta kontak admin dong",
+    ],
+    "brosur": [
+        "minta brosur kampus dong",
+        "download brosur dimana",
+    ],
+    "quick": ["ok", "oke", "iya", "wkwk", "hmm", "ga"],
+    "sapaan": [
+        "halo kak mau tanya dong",
+        "selamat pagi kak",
+        "permisi kak mau nanya",
+    ],
+}
+
+# campur Inggris-Indonesia (pesan ambigu -> sering jatuh ke langdetect)
+MIXED = [
+    "how much biaya kuliah di tmm",
+    "ada scholarship ga buat s1",
+    "is there evening class buat animasi",
+    "where is the campus lokasinya dimana",
+    "what majors ada di trisakti multimedia",
+    "can i apply online pendaftarannya",
+    "tuition fee per semester berapa",
+]
+# Jawa / Sunda
+REGIONAL = [
+    "piye carane daftar kuliah neng tmm",
+    "biayane pinten nggih",
+    "kampuse neng ngendi",
+    "kumaha carana daftar ka tmm",
+    "sabaraha biaya kuliahna",
+    "aya beasiswa teu",
+]
+# singkatan chat yang lazim
+SLANG = {
+    "bagaimana": "gmn", "berapa": "brp", "yang": "yg", "dimana": "dmn", "tidak": "gk",
+    "kuliah": "kulyah", "sudah": "udh", "saja": "aja", "dong": "dng", "pendaftaran": "pendaftran",
+}
+KEYBOARD = "qwertyuiopasdfghjklzxcvbnm"
+OPEN_SUBJECTS = ["portofolio", "magang", "laptop", "kos", "organisasi", "lomba", "dosen",
+                 "kurikulum", "software", "transportasi", "asrama", "wisuda", "ijazah"]
+OPEN_ASKS = ["tolong jelaskan soal {s} untuk mahasiswa baru",
+             "kalau soal {s} gimana ya kak di tmm",
+             "saran {s} buat anak dkv apa",
+             "apakah {s} disediakan kampus atau cari sendiri"]
+
+
+def _typo_word(word, rng):
+    if len(word) < 4:
+        return word
+    i = rng.randrange(1, len(word) - 1)
+    op = rng.choice(("swap", "drop", "dup", "near"))
+    if op == "swap":
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    if op == "drop":
+        return word[:i] + word[i + 1:]
+    if op == "dup":
+        return word[:i] + word[i] + word[i:]
+    return word[:i] + rng.choice(KEYBOARD) + word[i + 1:]
+
+
+def add_typos(text, rng, rate=0.3):
+    out = []
+    for word in text.split():
+        if word in SLANG and rng.random() < 0.5:
+            out.append(SLANG[word])
+        elif rng.random() < rate:
+            out.append(_typo_word(word, rng))
+        else:
+            out.append(word)
+    return " ".join(out)
+
+
+def _pool(rng):
+    """Pertanyaan berbeda (sebelum pengulangan) beserta jenisnya."""
+    pool = []
+    for cat, items in BASE.items():
+        kind = "quick" if cat == "quick" else "faq"
+        pool += [{"message": m, "kind": kind, "category": cat} for m in items]
+    pool += [{"message": m, "kind": "mixed", "category": "mixed"} for m in MIXED]
+    pool += [{"message": m, "kind": "regional", "category": "regional"} for m in REGIONAL]
+    # varian typo dari pertanyaan baku (tetap bisa berulang: typo yang sama dikirim lagi)
+    faqs = [p for p in pool if p["kind"] == "faq"]
+    for p in rng.sample(faqs, k=min(len(faqs), 25)):
+        variant = add_typos(p["message"], rng)
+        if variant != p["message"]:
+            pool.append({"message": variant, "kind": "typo", "category": p["category"]})
+    # variasi kapitalisasi/tanda baca (dinormalisasi cache, bukan oleh routing)
+    for p in rng.sample(faqs, k=min(len(faqs), 8)):
+        pool.append({"message": p["message"].capitalize() + "??", "kind": "faq", "category": p["category"]})
+    rng.shuffle(pool)
+    return pool
+
+
+def generate(n=800, seed=7, open_rate=0.15, zipf_s=1.1):
+    """-> list dict {message, kind, category}; `open_rate` bagian pertanyaan terbuka."""
+    rng = random.Random(seed)
+    pool = _pool(rng)
+    weights = [1.0 / (rank + 1) ** zipf_s for rank in range(len(pool))]
+    out, opened = [], 0
+    for _ in range(n):
+        if rng.random() < open_rate:
+            opened += 1
+            ask = rng.choice(OPEN_ASKS).format(s=rng.choice(OPEN_SUBJECTS))
+            out.append({"message": f"{ask} #{opened}", "kind": "open", "category": "open"})
+        else:
+            out.append(dict(rng.choices(pool, weights)[0]))
+    return out
+
+
+def load(path=CORPUS_PATH, limit=None):
+    """Korpus dari file (default bench/corpus.jsonl); dibangkitkan bila file tidak ada."""
+    if not os.path.exists(path):
+        items = generate()
+    else:
+        with open(path, encoding="utf-8") as f:
+            items = [json.loads(line) for line in f if line.strip()]
+    return items[:limit] if limit else items
+
+
+def summary(items):
+    kinds = {}
+    for it in items:
+        kinds[it["kind"]] = kinds.get(it["kind"], 0) + 1
+    distinct = len({it["message"] for it in items})
+    return {"messages": len(items), "distinct": distinct,
+            "repeat_rate": round(1 - distinct / max(1, len(items)), 3), "kinds": kinds}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=800)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--open-rate", type=float, default=0.15)
+    parser.add_argument("--out", help="tulis korpus JSONL (mis. bench/corpus.jsonl)")
+    args = parser.parse_args()
+    items = generate(args.n, args.seed, args.open_rate)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            for it in items:
+                f.write(json.dumps(it, ensure_ascii=False) + "\n")
+    print(json.dumps(summary(items), indent=2))
@@ -0,0 +1,159 @@
+"""Server Gemini palsu untuk uji beban lokal (tanpa jaringan, tanpa kuota).
+
+Jalankan:  python bench/fake_gemini.py --port 8089 --latency 0.8
+lalu start TIMU dengan  GEMINI_BASE_URL=http://127.0.0.1:8089
+
+Melayani endpoint yang dipakai google-genai:
+  POST /v1beta/models/<model>:generateContent
+  POST /v1beta/models/<model>:streamGenerateContent   (SSE, alt=sse)
+  POST /v1beta/cachedContents
+Latensi (tetap atau lognormal dengan median `latency`), ekor lambat
+(slow_rate/slow_latency), rasio error dan campuran kode error-nya bisa diatur
+agar timeout, retry, circuit breaker dan hedging bisa diuji tanpa jaringan.
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY = (
+    "Halo! TIMU di sini 😊 Trisakti School of Multimedia punya beberapa program studi "
+    "kreatif. Info lengkap ada di https://trisaktimultimedia.ac.id ya."
+)
+
+
+STATUS_NAMES = {400: "INVALID_ARGUMENT", 429: "RESOURCE_EXHAUSTED", 500: "INTERNAL",
+                503: "UNAVAILABLE", 504: "DEADLINE_EXCEEDED"}
+
+
+def _candidate(text: str, finish: bool = True) -> dict:
+    cand = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+    if finish:
+        cand["finishReason"] = "STOP"
+    return {"candidates": [cand]}
+
+
+class FakeGemini(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.5        # detik per panggilan (generateContent) / per potongan (stream)
+    latency_dist = "fixed"   # "fixed" | "lognormal" (median = latency, sebaran = sigma)
+    sigma = 0.5
+    jitter = 0.0
+    error_rate = 0.0
+    error_codes = (503,)     # kode error dipilih acak dari daftar ini
+    slow_rate = 0.0      # sebagian panggilan memakai slow_latency (ekor p99)
+    slow_latency = 5.0
+    stream_chunks = 4
+    calls = 0
+    lock = threading.Lock()
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _latency(self) -> float:
+        if random.random() < self.slow_rate:
+            return self.slow_latency
+        if self.latency_dist == "lognormal" and self.latency > 0:
+            return random.lognormvariate(math.log(self.latency), self.sigma)
+        return self.latency
+
+    def _sleep(self, seconds: float):
+        if seconds > 0:
+            time.sleep(max(0.0, seconds + random.uniform(-self.jitter, self.jitter)))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        with FakeGemini.lock:
+            FakeGemini.calls += 1
+
+        if self.path.startswith("/v1beta/cachedContents"):
+            self._send_json(200, {"name": f"cachedContents/fake-{FakeGemini.calls}"})
+            return
+        if random.random() < self.error_rate:
+            self._sleep(self._latency())
+            code = random.choice(self.error_codes)
+            self._send_json(code, {"error": {"code": code, "message": "fake error",
+                                             "status": STATUS_NAMES.get(code, "UNKNOWN")}})
+            return
+        if ":streamGenerateContent" in self.path:
+            self._stream()
+            return
+        if ":generateContent" in self.path:
+            self._sleep(self._latency())
+            self._send_json(200, _candidate(REPLY))
+            return
+        self._send_json(404, {"error": {"code": 404, "message": "not found", "status": "NOT_FOUND"}})
+
+    def _stream(self):
+        words = REPLY.split(" ")
+        size = max(1, len(words) // self.stream_chunks)
+        parts = [" ".join(words[i:i + size]) + " " for i in range(0, len(words), size)]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        latency = self._latency()
+        for i, part in enumerate(parts):
+            self._sleep(latency / len(parts))
+            event = _candidate(part, finish=i == len(parts) - 1)
+            self.wfile.write(b"data: " + json.dumps(event).encode("utf-8") + b"\r\n\r\n")
+            self.wfile.flush()
+        self.close_connection = True
+
+
+def configure(**opts):
+    """Ubah perilaku server yang sedang berjalan (latency, error_rate, slow_rate, ...)."""
+    for key, value in opts.items():
+        if not hasattr(FakeGemini, key):
+            raise AttributeError(key)
+        setattr(FakeGemini, key, value)
+
+
+def serve(port: int, latency: float = 0.5, error_rate: float = 0.0, jitter: float = 0.0, **opts):
+    """Start server di thread latar; kembalikan objek server (panggil .shutdown())."""
+    configure(latency=latency, error_rate=error_rate, jitter=jitter, **opts)
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeGemini)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--port", type=int, default=8089)
+    ap.add_argument("--latency", type=float, default=0.5)
+    ap.add_argument("--latency-dist", choices=("fixed", "lognormal"), default="fixed")
+    ap.add_argument("--sigma", type=float, default=0.5)
+    ap.add_argument("--jitter", type=float, default=0.0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--error-codes", default="503", help="mis. 503,429,500")
+    ap.add_argument("--slow-rate", type=float, default=0.0)
+    ap.add_argument("--slow-latency", type=float, default=5.0)
+    args = ap.parse_args()
+    serve(args.port, args.latency, args.error_rate, args.jitter,
+          latency_dist=args.latency_dist, sigma=args.sigma,
+          error_codes=tuple(int(c) for c in args.error_codes.split(",")),
+          slow_rate=args.slow_rate, slow_latency=args.slow_latency)
+    print(f"fake Gemini di http://127.0.0.1:{args.port} (latency={args.latency}s)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
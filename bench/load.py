@@ -0,0 +1,228 @@
+"""Uji beban end-to-end: korpus replay -> /api/chat lewat gunicorn -> Gemini palsu.
+
+Jalankan dari root repo:
+  python bench/load.py [--mode sync|asgi] [--workers 2] [--requests 800]
+                       [--concurrency 16 | --rate 40] [--users 50]
+                       [--latency 0.8 --latency-dist lognormal --sigma 0.6]
+                       [--error-rate 0.05 --error-codes 503,429]
+                       [--slow-rate 0.02 --slow-latency 8] [--out hasil.json]
+
+Pesan diambil berurutan dari bench/corpus.jsonl (diulang bila --requests lebih
+besar) sehingga campuran jalur lokal/cache/AI sama di setiap run. Tiap user
+virtual punya cookie sesi sendiri (penulisan sesi SQLite ikut terukur).
+Tanpa --rate: closed loop, --concurrency klien mengirim lagi begitu dibalas.
+Dengan --rate: open loop, kedatangan Poisson R permintaan/detik; server yang
+lambat tidak menurunkan laju kedatangan sehingga ekor latensi terlihat jujur.
+Di akhir /metrics di-scrape untuk rincian per tahap dan source dari sisi server.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+import corpus  # noqa: E402
+import fake_gemini  # noqa: E402
+import results  # noqa: E402
+from load_async import MODES, _start_server  # noqa: E402
+
+METRICS_TOKEN = "bench-metrics"
+METRIC_LINE = re.compile(
+    r'^timu_chat_stage_seconds_(bucket|sum|count)\{stage="([^"]+)",source="([^"]+)"(?:,le="([^"]+)")?\} (\S+)$'
+)
+
+
+def _post(opener, port, message):
+    body = json.dumps({"message": message}).encode("utf-8")
+    req = urllib.request.Request(f"http://127.0.0.1:{port}/api/chat", data=body,
+                                 headers={"Content-Type": "application/json"})
+    t0 = time.perf_counter()
+    try:
+        with opener.open(req, timeout=120) as resp:
+            status, payload = resp.status, json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        status, payload = e.code, {}
+    except OSError:
+        status, payload = 0, {}
+    dt = time.perf_counter() - t0
+    # source hanya ada di body untuk cache/ai/fallback; 200 tanpa source = jawaban lokal
+    source = payload.get("source") or ("local" if status == 200 else "error")
+    return dt, status, source
+
+
+def _drive(port, items, concurrency, rate, users, seed):
+    openers = [urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+               for _ in range(users)]
+    records, lock = [], threading.Lock()
+
+    def one(i, item):
+        dt, status, source = _post(openers[i % users], port, item["message"])
+        with lock:
+            records.append((item["kind"], dt, status, source))
+
+    t0 = time.perf_counter()
+    if rate:
+        rng = random.Random(seed)
+        with ThreadPoolExecutor(max_workers=max(concurrency, 256)) as pool:
+            due = time.perf_counter()
+            for i, item in enumerate(items):
+                due += rng.expovariate(rate)
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(one, i, item)
+    else:
+        queue = iter(enumerate(items))
+        qlock = threading.Lock()
+
+        def client():
+            while True:
+                with qlock:
+                    nxt = next(queue, None)
+                if nxt is None:
+                    return
+                one(*nxt)
+
+        threads = [threading.Thread(target=client) for _ in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    return records, time.perf_counter() - t0
+
+
+def _summarize(records, wall):
+    def group(key):
+        out = {}
+        for rec in records:
+            out.setdefault(rec[key], []).append(rec[1])
+        return {k: results.percentiles(v, scale=1000) for k, v in sorted(out.items())}
+
+    statuses = {}
+    for _, _, status, _ in records:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    ok = sum(1 for r in records if r[2] == 200)
+    return {
+        "requests": len(records),
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(records) / wall, 2),
+        "success_rate": round(ok / max(1, len(records)), 4),
+        "latency_ms": results.percentiles([r[1] for r in records], scale=1000),
+        "by_kind_ms": group(0),
+        "by_source_ms": group(3),
+        "statuses": statuses,
+    }
+
+
+def scrape_metrics(port):
+    """/metrics -> {tahap: {source: {count, mean_ms, p50_ms, p95_ms, p99_ms}}}."""
+    req = urllib.request.Request(f"http://127.0.0.1:{port}/metrics",
+                                 headers={"Authorization": f"Bearer {METRICS_TOKEN}"})
+    try:
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            text = resp.read().decode("utf-8")
+    except OSError as e:
+        return {"error": str(e)}
+    series = {}
+    for line in text.splitlines():
+        m = METRIC_LINE.match(line)
+        if not m:
+            continue
+        kind, stage, source, le, value = m.groups()
+        s = series.setdefault((stage, source), {"buckets": []})
+        if kind == "bucket" and le != "+Inf":
+            s["buckets"].append((float(le), float(value)))
+        elif kind in ("sum", "count"):
+            s[kind] = float(value)
+    out = {}
+    for (stage, source), s in series.items():
+        count = s.get("count", 0)
+        if not count:
+            continue
+
+        def q(p):
+            for le, cum in s["buckets"]:
+                if cum >= p * count:
+                    return round(le * 1000, 3)
+            return None  # di atas batas le terbesar
+
+        out.setdefault(stage, {})[source] = {
+            "count": int(count), "mean_ms": round(s.get("sum", 0) / count * 1000, 3),
+            "p50_ms": q(0.5), "p95_ms": q(0.95), "p99_ms": q(0.99),
+        }
+    return out
+
+
+def run(args):
+    items = corpus.load()
+    items = list(itertools.islice(itertools.cycle(items), args.requests))
+    gemini = fake_gemini.serve(
+        args.port - 1, latency=args.latency, error_rate=args.error_rate, jitter=args.jitter,
+        latency_dist=args.latency_dist, sigma=args.sigma,
+        error_codes=tuple(int(c) for c in args.error_codes.split(",")),
+        slow_rate=args.slow_rate, slow_latency=args.slow_latency,
+    )
+    os.environ["METRICS_TOKEN"] = METRICS_TOKEN
+    os.environ["GUNICORN_PRELOAD"] = "1" if args.preload else "0"
+    config = {k: v for k, v in vars(args).items() if k not in ("out",)}
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            proc = _start_server(args.mode, args.port, args.workers,
+                                 f"http://127.0.0.1:{args.port - 1}", tmp)
+            try:
+                calls_before = fake_gemini.FakeGemini.calls
+                records, wall = _drive(args.port, items, args.concurrency, args.rate,
+                                       args.users, args.seed)
+                out = {
+                    "config": config,
+                    "corpus": corpus.summary(items),
+                    "client": _summarize(records, wall),
+                    "gemini_calls": fake_gemini.FakeGemini.calls - calls_before,
+                    "server_stages": scrape_metrics(args.port),
+                }
+            finally:
+                proc.terminate()
+                proc.wait(timeout=30)
+    finally:
+        gemini.shutdown()
+    return out
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", help="simpan hasil JSON ke file")
+    parser.add_argument("--mode", choices=tuple(MODES), default="sync")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--no-preload", dest="preload", action="store_false")
+    parser.add_argument("--requests", type=int, default=800)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rate", type=float, default=0.0, help="open loop: permintaan/detik (0 = closed loop)")
+    parser.add_argument("--users", type=int, default=50, help="jumlah cookie sesi berbeda")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--port", type=int, default=8290)
+    parser.add_argument("--latency", type=float, default=0.8, help="latensi (median) Gemini palsu, detik")
+    parser.add_argument("--latency-dist", choices=("fixed", "lognormal"), default="lognormal")
+    parser.add_argument("--sigma", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-codes", default="503")
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-latency", type=float, default=8.0)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results.save(run(args), args.out)
@@ -0,0 +1,140 @@
+"""Uji beban: gunicorn sync workers (app:app) vs mode ASGI (asgi:application).
+
+Jalankan dari root repo:  python bench/load_async.py [--out hasil.json]
+
+Keduanya memakai server Gemini palsu (bench/fake_gemini.py) dengan latensi tetap,
+jumlah worker yang sama, dan pesan unik per permintaan (tidak kena cache lokal),
+sehingga selisih throughput murni berasal dari cara worker menunggu Gemini.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_gemini  # noqa: E402
+
+MODES = {
+    "sync": ["app:app"],
+    "asgi": ["-k", "uvicorn.workers.UvicornWorker", "asgi:application"],
+}
+
+
+def _start_server(mode, port, workers, gemini_url, tmp):
+    env = dict(os.environ,
+               GEMINI_API_KEY="bench", GEMINI_BASE_URL=gemini_url,
+               ALLOW_TESTING="1", RATELIMIT_ENABLED="0",
+               DB_PATH=os.path.join(tmp, f"{mode}.db"), LOG_FILE=os.path.join(tmp, "app.log"))
+    cmd = [sys.executable, "-m", "gunicorn", "-w", str(workers),
+           "-b", f"127.0.0.1:{port}", "--timeout", "120", *MODES[mode]]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/api/chat", timeout=1).read()
+            return proc
+        except urllib.error.HTTPError:
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"server {mode} tidak start")
+
+
+def _message(rng):
+    # kata acak (suku kata KV) agar tiap pesan lolos cache kemiripan dan sampai ke Gemini
+    words = ["".join(rng.choice("bcdgjklmnprstw") + rng.choice("aiueo") for _ in range(3))
+             for _ in range(5)]
+    return "tolong jelaskan " + " ".join(words)
+
+
+def _post(port, message):
+    body = json.dumps({"message": message}).encode("utf-8")
+    req = urllib.request.Request(f"http://127.0.0.1:{port}/api/chat", data=body,
+                                 headers={"Content-Type": "application/json"})
+    t0 = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=120) as resp:
+            status = resp.status
+            payload = json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        status, payload = e.code, {}
+    return time.perf_counter() - t0, status, payload.get("source", "ai" if "reply" in payload else "error")
+
+
+def _load(port, concurrency, total, tag):
+    latencies, statuses, lock = [], {}, threading.Lock()
+    rng = random.Random(tag)
+    messages = iter([_message(rng) for _ in range(total)])
+
+    def worker():
+        for message in messages:
+            dt, status, source = _post(port, message)
+            with lock:
+                latencies.append(dt)
+                key = f"{status}:{source}"
+                statuses[key] = statuses.get(key, 0) + 1
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    latencies.sort()
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(total / wall, 2),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+        "statuses": statuses,
+    }
+
+
+def run(latency=0.5, workers=2, concurrency=(2, 8, 32), per_level=4, port=8190):
+    gemini = fake_gemini.serve(port - 1, latency=latency)
+    results = {"gemini_latency_s": latency, "workers": workers, "modes": {}}
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for n, mode in enumerate(MODES):
+                app_port = port + n
+                proc = _start_server(mode, app_port, workers, f"http://127.0.0.1:{port - 1}", tmp)
+                try:
+                    results["modes"][mode] = [
+                        _load(app_port, c, c * per_level, f"{mode}-{c}") for c in concurrency
+                    ]
+                finally:
+                    proc.terminate()
+                    proc.wait(timeout=30)
+    finally:
+        gemini.shutdown()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", help="simpan hasil JSON ke file")
+    parser.add_argument("--latency", type=float, default=0.5, help="latensi Gemini palsu (detik)")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--concurrency", default="2,8,32")
+    args = parser.parse_args()
+    levels = tuple(int(c) for c in args.concurrency.split(","))
+    text = json.dumps(run(args.latency, args.workers, levels), indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
@@ -0,0 +1,164 @@
+"""Micro-benchmark tiap fungsi pipeline chat di app.py atas korpus replay.
+
+Jalankan dari root repo:  python bench/pipeline.py [--rounds 5] [--only cache_get_hit_l1,...] [--out hasil.json]
+
+Setiap fungsi dipanggil untuk semua pesan korpus (bench/corpus.jsonl) sebanyak
+--rounds putaran; waktu per panggilan dilaporkan dalam mikrodetik (p50/p95/p99).
+Varian "cold" mengosongkan memo/cache in-process sebelum tiap putaran.
+DB sementara dipakai agar bench tidak menyentuh data asli; e2e_inprocess memakai
+server Gemini palsu tanpa latensi sehingga yang terukur hanya biaya TIMU.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+PORT = 8392
+_tmp = tempfile.TemporaryDirectory(prefix="timu-bench-")
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+os.environ["GEMINI_BASE_URL"] = f"http://127.0.0.1:{PORT}"
+os.environ["DB_PATH"] = os.path.join(_tmp.name, "bench.db")
+os.environ["LOG_FILE"] = os.path.join(_tmp.name, "app.log")
+os.environ.setdefault("ALLOW_TESTING", "1")
+os.environ.setdefault("RATELIMIT_ENABLED", "0")
+
+import corpus  # noqa: E402
+import fake_gemini  # noqa: E402
+import results  # noqa: E402
+import app as timu  # noqa: E402
+
+ANSWER = fake_gemini.REPLY + (
+    "\n\n**Biaya** bisa dicicil 3 kali. Cek https://trisaktimultimedia.ac.id/pendaftaran "
+    "atau WhatsApp +6287742997808 untuk info gelombang terbaru. `Semangat` ya! 🎓"
+)
+
+
+def _measure(fn, inputs, rounds, setup=None):
+    samples = []
+    for _ in range(rounds):
+        if setup:
+            setup()
+        for args in inputs:
+            t0 = time.perf_counter_ns()
+            fn(*args)
+            samples.append(time.perf_counter_ns() - t0)
+    return results.percentiles(samples, scale=1e-3, digits=2)
+
+
+def _clear_l1():
+    timu.answer_l1.data.clear()
+
+
+def _once(fn):
+    done = []
+
+    def setup():
+        if not done:
+            done.append(fn())
+    return setup
+
+
+def cases(items):
+    msgs = [(it["message"],) for it in items]
+    corrected = [(timu.correct_typo(m),) for (m,) in msgs]
+    routed = [(c, timu.route_message(c)[0]) for (c,) in corrected]
+    faq = list(dict.fromkeys(timu.correct_typo(it["message"]) for it in items if it["kind"] != "open"))
+    rows = [("2025-01-01T10:00:00", m, ANSWER, "ai", 850.0) for (m,) in msgs[:200]]
+    # 200 klien: bucket per IP + per sesi seperti route chat (kapasitas besar agar tidak 429)
+    buckets = [([(timu._bucket_hash(f"chat|ip:{i % 200}"), 10**9, 1e6),
+                 (timu._bucket_hash(f"chat|s:{i}"), 10**9, 1e6)],) for i in range(len(msgs))]
+    origins = [SimpleNamespace(headers=h) for h in (
+        {"Origin": "https://trisaktimultimedia.ac.id"},
+        {"Referer": "https://www.trisaktimultimedia.ac.id/pendaftaran/?utm=wa"},
+        {"Origin": "https://trisaktimultimedia.ac.id.evil.com"},
+        {},
+    )] * 50
+
+    def build_prompt(msg, category):
+        with timu.app.test_request_context("/api/chat", method="POST"):
+            timu._build_prompt(msg, "id", timu.get_current_registration_status(), category)
+
+    def save_and_flush():
+        for row in rows:
+            timu.save_chat_db(*row[1:4], latency_ms=row[4])
+        timu.flush_chat_writes()
+
+    return {
+        # profil langdetect dimuat sekali dulu: "cold" = memo kosong, bukan impor pertama
+        "detect_language_cold": (timu.detect_language, msgs,
+                                 lambda: (timu._langdetect(), timu._detect_language_norm.cache_clear())),
+        "detect_language_warm": (timu.detect_language, msgs, None),
+        "correct_typo_cold": (timu.correct_typo, msgs, timu._correct_word.cache_clear),
+        "correct_typo_warm": (timu.correct_typo, msgs, None),
+        "route_message": (timu.route_message, corrected, None),
+        "registration_status": (timu.get_current_registration_status, [()] * len(msgs), None),
+        "retrieve_knowledge": (timu.retrieve_knowledge, routed, None),
+        "build_prompt": (build_prompt, routed, None),
+        "cache_put_answer": (lambda m: timu.cache_put_answer(m, timu.format_reply(ANSWER)),
+                             [(m,) for m in faq], None),
+        "cache_get_hit_l1": (timu.cache_get_answer, [(m,) for m in faq],
+                             _once(lambda: [timu.cache_get_answer(m) for m in faq])),
+        "cache_get_hit_sqlite": (timu.cache_get_answer, [(m,) for m in faq], _clear_l1),
+        "cache_get_miss": (timu.cache_get_answer,
+                           [(f"pertanyaan acak nomor {i} tentang topik lain",) for i in range(200)], None),
+        "rate_limit_take": (timu.limiter.table.take, buckets, None),
+        "origin_check": (timu._is_allowed_origin, [(r,) for r in origins], None),
+        "format_reply": (timu.format_reply, [(ANSWER,)] * 200, None),
+        "sanitize_html": (timu.sanitize_html, [(timu.format_reply(ANSWER),)] * 200, None),
+        "save_chat_db_enqueue": (lambda *r: timu.save_chat_db(*r[1:4], latency_ms=r[4]), rows,
+                                 timu.flush_chat_writes),
+        # 200 baris per panggilan: dibagi 200 untuk biaya per baris (lihat run())
+        "chat_write_batch_200": (save_and_flush, [()], None),
+    }
+
+
+def e2e_inprocess(items, rounds):
+    """POST /api/chat lewat test client Flask (routing, cache, sesi SQLite, Gemini palsu 0 ms)."""
+    client = timu.app.test_client()
+    by_kind = {}
+    for _ in range(rounds):
+        for it in items:
+            t0 = time.perf_counter_ns()
+            client.post("/api/chat", json={"message": it["message"]}, base_url="https://localhost")
+            by_kind.setdefault(it["kind"], []).append(time.perf_counter_ns() - t0)
+    timu.flush_chat_writes()
+    every = [x for v in by_kind.values() for x in v]
+    out = {"all": results.percentiles(every, scale=1e-3, digits=1)}
+    out.update({k: results.percentiles(v, scale=1e-3, digits=1) for k, v in sorted(by_kind.items())})
+    return out
+
+
+def run(rounds=5, only=None, limit=None):
+    items = corpus.load(limit=limit)
+    server = fake_gemini.serve(PORT, latency=0.0)
+    try:
+        functions = {}
+        for name, (fn, inputs, setup) in cases(items).items():
+            if only and name not in only:
+                continue
+            n = 1 if name == "chat_write_batch_200" else rounds
+            functions[name] = _measure(fn, inputs, n, setup)
+        if "chat_write_batch_200" in functions:
+            functions["chat_write_per_row_us"] = round(functions["chat_write_batch_200"]["p50"] / 200, 2)
+        out = {"corpus": corpus.summary(items), "rounds": rounds, "functions_us": functions}
+        if not only or "e2e_inprocess" in only:
+            out["e2e_inprocess_us"] = e2e_inprocess(items, max(1, rounds // 2))
+        return out
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", help="simpan hasil JSON ke file")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--limit", type=int, help="pakai N pesan pertama korpus saja")
+    parser.add_argument("--only", help="daftar nama bench dipisah koma (termasuk e2e_inprocess)")
+    args = parser.parse_args()
+    only = set(args.only.split(",")) if args.only else None
+    results.save(run(args.rounds, only, args.limit), args.out)
@@ -0,0 +1,84 @@
+"""Bandingkan ukuran prompt dan kecocokan fakta: retrieval BM25 vs dump penuh.
+
+Jalankan dari root repo:  python bench/prompt_retrieval.py [--out hasil.json]
+
+"Answer-match" diukur offline: sebuah pertanyaan dianggap cocok bila semua
+fakta yang dibutuhkan untuk menjawabnya ikut masuk ke prompt.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "timu-bench.log"))
+
+import app as timu  # noqa: E402
+
+# (pertanyaan, fakta yang harus ada di konteks)
+QUESTIONS = [
+    ("berapa kali cicilan biaya kuliah", ["Cicilan 3 kali"]),
+    ("apakah ada uang gedung", ["Tidak ada uang gedung"]),
+    ("beasiswa apa saja yang tersedia", ["Beasiswa KIP Kuliah", "Yayasan Beasiswa Trisakti"]),
+    ("kapan batas pendaftaran akun kip kuliah", ["2025-10-31"]),
+    ("nomor hotline kip kuliah", ["+6221-572-0406"]),
+    ("fasilitas kampus apa saja", ["Studio Podcast & Broadcasting"]),
+    ("apakah ada kelas malam", ["kelas malam"]),
+    ("apakah tmm sama dengan universitas trisakti", ["Grogol"]),
+    ("kapan semester genap dimulai", ["2026-01-12"]),
+    ("tahun berapa tmm didirikan", ["1985"]),
+    ("visi trisakti multimedia", ["vision"]),
+    ("prospek kerja lulusan animasi", ["Animator"]),
+    ("syarat dokumen pendaftaran", ["Pas foto ukuran 3x4"]),
+    ("tes masuk online atau offline", ["outside_jabodetabek"]),
+    ("kerja sama dengan industri", ["PT. Guava Production"]),
+    ("testimoni alumni d4 kemasan", ["Packaging Designer"]),
+    ("jam kerja kantor kampus", ["Senin-Jumat, 08:00-16:00 WIB"]),
+    ("email resmi kampus", ["info@trisaktimultimedia.ac.id"]),
+    ("ada workshop desain digital kapan", ["Workshop Desain Digital"]),
+    ("kegiatan mahasiswa apa saja", ["klub desain"]),
+]
+
+
+def run():
+    full = json.dumps(timu.knowledge.current().data, ensure_ascii=False)
+    rows = []
+    t0 = time.perf_counter()
+    for question, facts in QUESTIONS:
+        category = timu.get_category(question)
+        ctx = timu.retrieve_knowledge(question, category)
+        rows.append({
+            "question": question,
+            "category": category,
+            "chars": len(ctx),
+            "match": all(f in ctx for f in facts),
+            "full_match": all(f in full for f in facts),
+        })
+    elapsed_ms = (time.perf_counter() - t0) * 1000 / len(QUESTIONS)
+    n = len(rows)
+    return {
+        "questions": n,
+        "full_dump_chars": len(full),
+        "retrieval_avg_chars": sum(r["chars"] for r in rows) / n,
+        "retrieval_match_rate": sum(r["match"] for r in rows) / n,
+        "full_dump_match_rate": sum(r["full_match"] for r in rows) / n,
+        "retrieval_ms_per_question": round(elapsed_ms, 3),
+        "misses": [r["question"] for r in rows if not r["match"]],
+        "rows": rows,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", help="simpan hasil JSON ke file")
+    args = parser.parse_args()
+    result = run()
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    summary = {k: v for k, v in result.items() if k != "rows"}
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
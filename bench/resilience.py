@@ -0,0 +1,120 @@
+"""Skenario ketahanan client Gemini (ResilientGemini) terhadap server palsu.
+
+Jalankan dari root repo:  python bench/resilience.py [--out hasil.json]
+
+  timeout  : upstream macet -> panggilan berhenti di deadline, bukan menggantung
+  flaky    : 30% error 503 -> tingkat sukses tanpa vs dengan retry
+  breaker  : upstream mati -> setelah breaker terbuka panggilan gagal instan
+  hedge    : 5% panggilan lambat (ekor) -> p99 tanpa vs dengan hedging
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+PORT = 8391
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "timu-bench.log"))
+os.environ["GEMINI_BASE_URL"] = f"http://127.0.0.1:{PORT}"
+
+import fake_gemini  # noqa: E402
+import app as timu  # noqa: E402
+
+KWARGS = {"model": timu.GEMINI_MODEL, "contents": "halo"}
+
+
+def _gateway(**opts):
+    breaker = timu.CircuitBreaker(opts.pop("threshold", 5), opts.pop("cooldown", 30))
+    return timu.ResilientGemini(timu.client, breaker=breaker, **opts)
+
+
+def _calls(gw, n):
+    ok, times = 0, []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        try:
+            gw.generate_content(**KWARGS)
+            ok += 1
+        except timu.GeminiUnavailable:
+            pass
+        times.append(time.perf_counter() - t0)
+    times.sort()
+    return {
+        "success_rate": round(ok / n, 3),
+        "p50_ms": round(statistics.median(times) * 1000, 1),
+        "p99_ms": round(times[int(n * 0.99) - 1] * 1000, 1),
+        "max_ms": round(times[-1] * 1000, 1),
+    }
+
+
+def scenario_timeout():
+    fake_gemini.configure(latency=5.0, error_rate=0.0, slow_rate=0.0)
+    gw = _gateway(timeout=0.5, deadline=1.5, retries=1)
+    return {"upstream_latency_s": 5.0, **_calls(gw, 3), "stats": dict(gw.stats)}
+
+
+def scenario_flaky(n=200):
+    fake_gemini.configure(latency=0.01, error_rate=0.3, slow_rate=0.0)
+    out = {}
+    for retries in (0, 2):
+        # breaker dibuat longgar agar yang diukur hanya efek retry
+        gw = _gateway(timeout=2, deadline=10, retries=retries, threshold=10_000)
+        out[f"retries_{retries}"] = {**_calls(gw, n), "stats": dict(gw.stats)}
+    return out
+
+
+def scenario_breaker():
+    fake_gemini.configure(latency=0.2, error_rate=1.0, slow_rate=0.0)
+    gw = _gateway(timeout=2, deadline=10, retries=2, threshold=5, cooldown=1.0)
+    before_open = _calls(gw, 3)
+    state = gw.breaker.state
+    short = _calls(gw, 50)
+    fake_gemini.configure(error_rate=0.0, latency=0.01)
+    time.sleep(1.1)
+    recovered = _calls(gw, 5)
+    return {"while_failing": before_open, "state_after": state,
+            "short_circuited": short, "after_cooldown": recovered,
+            "final_state": gw.breaker.state, "stats": dict(gw.stats)}
+
+
+def scenario_hedge(n=300):
+    out = {}
+    for hedge in (False, True):
+        fake_gemini.configure(latency=0.05, error_rate=0.0, slow_rate=0.05, slow_latency=1.5)
+        gw = _gateway(timeout=5, deadline=10, retries=0, hedge=hedge)
+        calls_before = fake_gemini.FakeGemini.calls
+        res = _calls(gw, n)
+        res["upstream_calls"] = fake_gemini.FakeGemini.calls - calls_before
+        res["hedge_delay_ms"] = round((gw.hedge_delay() or 0) * 1000, 1)
+        out["hedge" if hedge else "no_hedge"] = res
+    return out
+
+
+def run():
+    server = fake_gemini.serve(PORT, latency=0.05)
+    try:
+        return {
+            "timeout": scenario_timeout(),
+            "flaky": scenario_flaky(),
+            "breaker": scenario_breaker(),
+            "hedge": scenario_hedge(),
+        }
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", help="simpan hasil JSON ke file")
+    args = parser.parse_args()
+    text = json.dumps(run(), indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
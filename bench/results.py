@@ -0,0 +1,75 @@
+"""Util bersama bench: metadata run (commit, mesin) dan penyimpanan hasil JSON.
+
+Setiap hasil membawa "meta" sehingga file dari commit berbeda bisa dibandingkan
+dengan  python bench/compare.py lama.json baru.json
+"""
+import json
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _git(*args):
+    try:
+        out = subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() if out.returncode == 0 else None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def calibration_us(repeat=7):
+    """Waktu beban Python tetap (min dari beberapa ulangan) sebagai ukuran kecepatan
+    mesin saat run; compare.py --normalize membagi metrik waktu dengan rasio ini."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        d = {}
+        for i in range(20000):
+            d[str(i)] = i * 2
+        sum(v for v in d.values() if v % 3)
+        best = min(best, time.perf_counter() - t0)
+    return round(best * 1e6, 1)
+
+
+def meta(**extra):
+    return {
+        "commit": _git("rev-parse", "--short", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "calibration_us": calibration_us(),
+        **extra,
+    }
+
+
+def percentiles(samples, scale=1.0, digits=1):
+    """samples: list angka (boleh belum terurut) -> ringkasan p50/p95/p99/mean/max."""
+    if not samples:
+        return {"n": 0}
+    s = sorted(samples)
+    n = len(s)
+
+    def at(q):
+        return round(s[min(n - 1, max(0, int(round(q * n)) - 1))] * scale, digits)
+
+    return {"n": n, "mean": round(sum(s) / n * scale, digits), "p50": at(0.50),
+            "p95": at(0.95), "p99": at(0.99), "max": round(s[-1] * scale, digits)}
+
+
+def save(result, out=None, echo=True):
+    """Tambahkan meta, tulis ke `out` (jika ada) dan cetak ke stdout."""
+    result = {"meta": meta(), **result}
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if out:
+        os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+        with open(out, "w", encoding="utf-8") as f:
+            f.write(text)
+    if echo:
+        print(text)
+    return result
@@ -0,0 +1,96 @@
+"""Micro-benchmark routing per pesan: loop lama vs router Aho-Corasick.
+
+Jalankan dari root repo:  python bench/routing.py [--out hasil.json]
+
+Daftar keyword diperbesar secara sintetis (x1, x10, x100) untuk melihat
+bagaimana biaya per pesan tumbuh seiring bertambahnya keyword.
+"""
+import argparse
+import copy
+import json
+import os
+import random
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "timu-bench.log"))
+
+import app as timu  # noqa: E402
+
+MESSAGES = [
+    "halo kak mau tanya dong",
+    "bagaimana cara daftar kuliah di tmm",
+    "jurusan animasi ada kelas malam ga",
+    "beasiswa kip masih buka?",
+    "dimana kampus trisakti multimedia",
+    "prospek kerja lulusan broadcasting apa aja",
+    "minta brosur kampus dong",
+    "biaya kuliah per semester berapa ya",
+]
+
+
+def legacy_route(data, msg):
+    """Implementasi sebelum router: get_category + find_program_by_alias."""
+    m = msg.lower()
+    category = "general"
+    for cat, keys in (data.get("keywords") or {}).items():
+        if any(k in m for k in keys):
+            category = cat
+            break
+    for prog in data.get("academic_programs", []):
+        name = (prog.get("name") or "").lower()
+        if name and (name in m or m in name):
+            return category, prog
+        for a in (prog.get("aliases") or []):
+            if a and (a.lower() in m or m in a.lower()):
+                return category, prog
+        for s in prog.get("specializations", []):
+            title = ((s.get("title") if isinstance(s, dict) else s) or "").lower()
+            if title and (title in m or m in title):
+                return category, prog
+    return category, None
+
+
+def scaled(data, factor, rng):
+    out = copy.deepcopy(data)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    for cat, keys in out["keywords"].items():
+        extra = ["".join(rng.choice(letters) for _ in range(rng.randint(4, 10)))
+                 for _ in range(len(keys) * (factor - 1))]
+        out["keywords"][cat] = keys + extra
+    return out
+
+
+def run(number=2000):
+    rng = random.Random(7)
+    results = []
+    for factor in (1, 10, 100):
+        data = scaled(timu.knowledge.current().data, factor, rng)
+        n_keywords = sum(len(v) for v in data["keywords"].values())
+        router = timu.build_router(data)
+        legacy = timeit.timeit(lambda: [legacy_route(data, m) for m in MESSAGES], number=number)
+        compiled = timeit.timeit(lambda: [timu.route_message(m, router) for m in MESSAGES], number=number)
+        per_msg = number * len(MESSAGES)
+        results.append({
+            "keyword_factor": factor,
+            "keywords": n_keywords,
+            "legacy_us_per_msg": round(legacy / per_msg * 1e6, 2),
+            "router_us_per_msg": round(compiled / per_msg * 1e6, 2),
+        })
+    return {"messages": len(MESSAGES), "results": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", help="simpan hasil JSON ke file")
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+    result = run(args.number)
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
@@ -0,0 +1,179 @@
+"""Fuzz diferensial: sanitizer cepat (sanitize_html / format_reply) vs bleach.
+
+Jalankan dari root repo:  python bench/sanitizer_fuzz.py [--cases 20000] [--out hasil.json]
+
+Input acak dibangun dari potongan HTML "jahat" dan umum (tag diizinkan/terlarang,
+atribut berkutip/tanpa kutip/ganda, URL polos, entitas, spasi unicode, tag
+bersilang, komentar, karakter kontrol). Tiap input dibandingkan byte demi byte:
+  sanitize_html(x)        == bleach_clean(x)
+  format_reply(x, seen)   == bleach_clean(format_links(x, seen))   (+ isi seen sama)
+Lalu diukur waktu per balasan pada contoh balasan AI yang realistis.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "timu-bench.log"))
+
+import app as timu  # noqa: E402
+
+WORDS = ["halo", "Trisakti", "biaya", "kuliah", "DKV", "jadwal", "😊", "a", "b", "x=1", "ok!",
+         "Rp 5.000.000", "*tebal*", "2+2", "ya.", "tanya?"]
+URLS = ["https://trisaktimultimedia.ac.id", "http://pmb.tsm.ac.id/daftar?a=1&b=2",
+        "https://x.id/", "HTTPS://X.ID", "https://a.b/c_(d)", "http://x.id/a;b`c",
+        "https://x.id/&amp;q", "https://x.id/%20", "http://x", "https://x.id/é"]
+ENTITIES = ["&amp;", "&lt;", "&gt;", "&quot;", "&nbsp;", "&copy", "&not", "&notin;", "&foo;",
+            "&#65;", "&#x41;", "&#x;", "&#99999999;", "&#0;", "&", "&&", "&amp", "&AMP;"]
+SPACES = [" ", "  ", "\n", "\n\n", "\t", "\xa0", " ", " \n ", "\x0c", "\r\n", " "]
+CHARS = ["<", ">", "'", '"', "<3", "a<b", "a > b", "< /b>", "<>", "</>", "<!", "<?x?>",
+         "<!-- c -->", "<![CDATA[x]]>", "`", "=", "/", "\x00", "\x01", "\x7f", "�", ""]
+TAGS = ["b", "B", "strong", "em", "i", "p", "div", "DIV", "span", "br", "BR", "a", "A",
+        "script", "style", "ul", "li", "h1", "table", "img", "iframe", "b\xa0x", "svg"]
+ATTR_NAMES = ["href", "HREF", "target", "rel", "title", "onclick", "style", "class", "x"]
+ATTR_VALUES = ["https://x.id", "http://x.id/a&b", "/rel/path", "#top", "javascript:alert(1)",
+               "mailto:a@b.c", "_blank", "noopener", "", "a b", "a'b", 'a"b', "a<b>", "&amp;x",
+               "&lt;", "&foo;", "x&y", "jav&#x61;script:1", " https://x.id ", "HTTPS://X",
+               "ftp://x", "data:x", "a\nb", "a  b", "//x.id", "?q=1", "é"]
+
+
+def _attr(rng):
+    name = rng.choice(ATTR_NAMES)
+    value = rng.choice(ATTR_VALUES)
+    form = rng.random()
+    if form < 0.45:
+        return f'{name}="{value.replace(chr(34), "")}"'
+    if form < 0.75:
+        return f"{name}='{value.replace(chr(39), '')}'"
+    if form < 0.85:
+        return f"{name} = \"{value.replace(chr(34), '')}\""
+    if form < 0.93:
+        return f"{name}={value.split()[0] if value.split() else 'v'}"
+    return name
+
+
+def _tag(rng):
+    name = rng.choice(TAGS)
+    r = rng.random()
+    if r < 0.35:
+        return f"</{name}>"
+    attrs = "".join(rng.choice([" ", "  ", "\n", "\t"]) + _attr(rng)
+                    for _ in range(rng.choice([0, 0, 1, 1, 2, 3])))
+    end = rng.choice([">", ">", ">", "/>", " />", " >"])
+    return f"<{name}{attrs}{end}"
+
+
+def _piece(rng):
+    r = rng.random()
+    if r < 0.30:
+        return rng.choice(WORDS)
+    if r < 0.50:
+        return rng.choice(SPACES)
+    if r < 0.70:
+        return _tag(rng)
+    if r < 0.80:
+        return rng.choice(URLS)
+    if r < 0.90:
+        return rng.choice(ENTITIES)
+    return rng.choice(CHARS)
+
+
+def gen_case(rng) -> str:
+    return "".join(_piece(rng) for _ in range(rng.randint(1, 14)))
+
+
+def gen_benign(rng) -> str:
+    # subset yang lebih mirip balasan AI: tanpa karakter kontrol/komentar
+    out = []
+    for _ in range(rng.randint(1, 14)):
+        p = _piece(rng)
+        if any(c in p for c in "\x00\x01\x7f�") or p.startswith(("<!", "<?")):
+            continue
+        out.append(p)
+    return "".join(out)
+
+
+def _reference_format(text, seen):
+    return timu.bleach_clean(timu.format_links(text, seen))
+
+
+def fuzz(cases: int, seed: int):
+    rng = random.Random(seed)
+    mismatches, bails = [], {"sanitize": 0, "format": 0}
+    for i in range(cases):
+        text = gen_case(rng) if i % 2 else gen_benign(rng)
+        ref = timu.bleach_clean(text)
+        got = timu.sanitize_html(text)
+        try:
+            timu._fast_clean(text)
+        except timu._SanitizerBail:
+            bails["sanitize"] += 1
+        if got != ref:
+            mismatches.append({"kind": "sanitize", "input": text, "expected": ref, "got": got})
+
+        pre = {u.strip().rstrip("/").lower() for u in rng.sample(URLS, rng.randint(0, 2))}
+        seen_ref, seen_new = set(pre), set(pre)
+        ref = _reference_format(text, seen_ref)
+        got = timu.format_reply(text, seen_new)
+        try:
+            timu._fast_clean(text, linkify=True, seen=set(pre), new_seen=set())
+        except timu._SanitizerBail:
+            bails["format"] += 1
+        if got != ref or seen_ref != seen_new:
+            mismatches.append({"kind": "format", "input": text, "expected": ref, "got": got,
+                               "seen_expected": sorted(seen_ref), "seen_got": sorted(seen_new)})
+    return mismatches, bails
+
+
+SAMPLE_REPLY = (
+    "Halo! 😊 Untuk **biaya kuliah** DKV semester 1 sekitar Rp 5.000.000 & uang pangkal "
+    "bisa dicicil. Info lengkap: https://trisaktimultimedia.ac.id/biaya\n\n"
+    "Pendaftaran gelombang 2 dibuka sampai 30 Juni — daftar di https://pmb.tsm.ac.id/daftar?ref=timu "
+    "ya. Kalau ada pertanyaan lain, tanya aja! <b>Semangat!</b>"
+)
+
+
+def _per_call_us(fn, text, n):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn(text)
+    return round((time.perf_counter() - t0) / n * 1e6, 1)
+
+
+def timing(n=2000):
+    formatted = timu.format_reply(SAMPLE_REPLY)
+    return {
+        "reply_chars": len(SAMPLE_REPLY),
+        "format_links+bleach_us": _per_call_us(lambda t: _reference_format(t, set()), SAMPLE_REPLY, n),
+        "format_reply_us": _per_call_us(timu.format_reply, SAMPLE_REPLY, n),
+        "bleach_on_formatted_us": _per_call_us(timu.bleach_clean, formatted, n),
+        "sanitize_html_on_formatted_us": _per_call_us(timu.sanitize_html, formatted, n),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cases", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=18)
+    parser.add_argument("--out", help="simpan hasil JSON ke file")
+    args = parser.parse_args()
+    mismatches, bails = fuzz(args.cases, args.seed)
+    result = {
+        "cases": args.cases,
+        "mismatches": len(mismatches),
+        "bail_rate": {k: round(v / args.cases, 3) for k, v in bails.items()},
+        "first_mismatches": mismatches[:5],
+        "timing": timing(),
+    }
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+    sys.exit(1 if mismatches else 0)
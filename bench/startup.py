@@ -0,0 +1,177 @@
+"""Benchmark cold start: waktu impor app.py (-X importtime) dan boot gunicorn.
+
+Jalankan dari root repo:  python bench/startup.py [--out hasil.json]
+
+  import   : `python -X importtime -c "import app"` di proses baru (min dari N run);
+             total, waktu body modul app, dan modul termahal yang diimpor langsung
+  gunicorn : (--gunicorn) waktu sampai permintaan pertama dilayani + RSS/PSS worker,
+             dengan dan tanpa preload_app (GUNICORN_PRELOAD)
+
+Sebagai penjaga regresi:  --budget-ms 900  atau  --baseline hasil_lama.json
+(gagal bila total impor > baseline x (1 + --tolerance)); exit code 1 bila gagal.
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def _env(tmp, **extra):
+    return dict(os.environ, GEMINI_API_KEY="bench", ALLOW_TESTING="1", RATELIMIT_ENABLED="0",
+                DB_PATH=os.path.join(tmp, "startup.db"), LOG_FILE=os.path.join(tmp, "app.log"), **extra)
+
+
+def parse_importtime(stderr: str):
+    """-> (self_us, cumulative_us, depth, module) per baris output -X importtime."""
+    rows = []
+    for line in stderr.splitlines():
+        m = IMPORT_RE.match(line)
+        if m:
+            rows.append((int(m.group(1)), int(m.group(2)), len(m.group(3)) // 2, m.group(4)))
+    return rows
+
+
+def import_run(tmp):
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"],
+                          cwd=ROOT, env=_env(tmp), capture_output=True, text=True)
+    wall = time.perf_counter() - t0
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr[-2000:])
+    rows = parse_importtime(proc.stderr)
+    app_row = next(r for r in rows if r[3] == "app")
+    # modul yang diimpor langsung oleh app (depth 1 = satu tingkat di bawah baris app)
+    direct = sorted((r for r in rows if r[2] == 1), key=lambda r: r[1], reverse=True)
+    return {
+        "wall_ms": round(wall * 1000, 1),
+        "import_total_ms": round(app_row[1] / 1000, 1),
+        "module_body_ms": round(app_row[0] / 1000, 1),
+        "modules": len(rows),
+        "top_imports_ms": {r[3]: round(r[1] / 1000, 1) for r in direct[:10]},
+    }
+
+
+def bench_import(runs):
+    with tempfile.TemporaryDirectory() as tmp:
+        import_run(tmp)  # run pertama membuat DB + snapshot SymSpell, tidak dihitung
+        results = [import_run(tmp) for _ in range(runs)]
+    best = min(results, key=lambda r: r["import_total_ms"])
+    best["runs"] = runs
+    best["import_total_ms_all"] = [r["import_total_ms"] for r in results]
+    return best
+
+
+def _mem_kb(pid):
+    out = {}
+    for path, key, field in ((f"/proc/{pid}/status", "rss_kb", "VmRSS:"),
+                             (f"/proc/{pid}/smaps_rollup", "pss_kb", "Pss:")):
+        try:
+            with open(path) as f:
+                for line in f:
+                    if line.startswith(field):
+                        out[key] = int(line.split()[1])
+                        break
+        except OSError:
+            pass
+    return out
+
+
+def _children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+def gunicorn_run(preload, workers, port, tmp):
+    env = _env(tmp, GUNICORN_PRELOAD="1" if preload else "0")
+    cmd = [sys.executable, "-m", "gunicorn", "-w", str(workers), "-b", f"127.0.0.1:{port}", "app:app"]
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        ready = None
+        while time.perf_counter() - t0 < 60:
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/api/chat", timeout=1).read()
+                ready = time.perf_counter() - t0
+            except urllib.error.HTTPError:
+                ready = time.perf_counter() - t0
+            except OSError:
+                time.sleep(0.02)
+                continue
+            break
+        if ready is None:
+            raise RuntimeError("gunicorn tidak start")
+        # tunggu semua worker selesai boot sebelum mengukur memori
+        deadline = time.time() + 30
+        while len(_children(proc.pid)) < workers and time.time() < deadline:
+            time.sleep(0.1)
+        time.sleep(1.0)
+        mem = [_mem_kb(pid) for pid in _children(proc.pid)]
+        return {
+            "first_response_ms": round(ready * 1000, 1),
+            "master": _mem_kb(proc.pid),
+            "workers_rss_kb": sum(m.get("rss_kb", 0) for m in mem),
+            "workers_pss_kb": sum(m.get("pss_kb", 0) for m in mem),
+        }
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def bench_gunicorn(workers, port):
+    with tempfile.TemporaryDirectory() as tmp:
+        gunicorn_run(True, 1, port, tmp)  # pemanasan: DB + snapshot SymSpell
+        return {
+            "workers": workers,
+            "preload": gunicorn_run(True, workers, port, tmp),
+            "no_preload": gunicorn_run(False, workers, port + 1, tmp),
+        }
+
+
+def check(result, budget_ms, baseline, tolerance):
+    total = result["import"]["import_total_ms"]
+    failures = []
+    if budget_ms and total > budget_ms:
+        failures.append(f"impor {total}ms > budget {budget_ms}ms")
+    if baseline:
+        with open(baseline, encoding="utf-8") as f:
+            base = json.load(f)["import"]["import_total_ms"]
+        if total > base * (1 + tolerance):
+            failures.append(f"impor {total}ms > baseline {base}ms (+{tolerance:.0%})")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", help="simpan hasil JSON ke file")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--gunicorn", action="store_true", help="ukur juga boot gunicorn")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--port", type=int, default=8290)
+    parser.add_argument("--budget-ms", type=float, help="batas total waktu impor")
+    parser.add_argument("--baseline", help="hasil JSON sebelumnya sebagai pembanding")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    result = {"import": bench_import(args.runs)}
+    if args.gunicorn:
+        result["gunicorn"] = bench_gunicorn(args.workers, args.port)
+    failures = check(result, args.budget_ms, args.baseline, args.tolerance)
+    result["regressions"] = failures
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+    sys.exit(1 if failures else 0)
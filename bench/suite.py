@@ -0,0 +1,72 @@
+"""Jalankan paket benchmark standar dan gabungkan hasilnya dalam satu JSON.
+
+Jalankan dari root repo:  python bench/suite.py --out bench-results/$(git rev-parse --short HEAD).json
+lalu bandingkan antar commit:  python bench/compare.py bench-results/A.json bench-results/B.json
+
+  pipeline : micro-benchmark fungsi pipeline + e2e in-process (bench/pipeline.py)
+  load     : korpus replay lewat gunicorn ke Gemini palsu (bench/load.py)
+  startup  : waktu impor app.py (bench/startup.py)
+
+Setiap bench jalan di proses sendiri (DB sementara, port sendiri) agar tidak
+saling memanaskan cache. --quick memperkecil ukuran untuk cek cepat.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+
+import results  # noqa: E402
+
+
+def plan(quick):
+    if quick:
+        return {
+            "pipeline": ["pipeline.py", "--rounds", "2", "--limit", "200"],
+            "load": ["load.py", "--requests", "200", "--latency", "0.2"],
+            "startup": ["startup.py", "--runs", "2"],
+        }
+    return {
+        "pipeline": ["pipeline.py", "--rounds", "5"],
+        "load": ["load.py", "--requests", "800", "--concurrency", "16"],
+        "load_faults": ["load.py", "--requests", "400", "--rate", "20", "--error-rate", "0.05",
+                        "--error-codes", "503,429", "--slow-rate", "0.02", "--port", "8300"],
+        "startup": ["startup.py", "--runs", "5"],
+    }
+
+
+def run(quick=False, only=None):
+    out = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, cmd in plan(quick).items():
+            if only and name not in only:
+                continue
+            path = os.path.join(tmp, f"{name}.json")
+            t0 = time.perf_counter()
+            proc = subprocess.run([sys.executable, os.path.join(HERE, cmd[0]), *cmd[1:], "--out", path],
+                                  cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+            if not os.path.exists(path):
+                out[name] = {"error": proc.stderr[-2000:], "returncode": proc.returncode}
+                continue
+            with open(path, encoding="utf-8") as f:
+                result = json.load(f)
+            result.pop("meta", None)
+            result["elapsed_s"] = round(time.perf_counter() - t0, 1)
+            out[name] = result
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", help="simpan hasil JSON ke file")
+    parser.add_argument("--quick", action="store_true")
+    parser.add_argument("--only", help="daftar bench dipisah koma (pipeline,load,load_faults,startup)")
+    args = parser.parse_args()
+    only = set(args.only.split(",")) if args.only else None
+    results.save(run(args.quick, only), args.out)
@@ -0,0 +1,86 @@
+"""Startup dan latensi koreksi typo: build dari kamus, lookup vs memo.
+
+Jalankan dari root repo:  python bench/typo.py [--out hasil.json]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "timu-bench.log"))
+
+import app as timu  # noqa: E402
+from symspellpy.symspellpy import SymSpell, Verbosity  # noqa: E402
+
+MESSAGES = [
+    "bagaimana cara daftar kuliah di tmm",
+    "jurusan animasi ada kelas malam ga",
+    "beasiswa kip masih buka?",
+    "Apa itu TMM",
+    "brosur kampus dong kak",
+    "akreditasi prodi dkv apa",
+]
+
+
+def _new():
+    return SymSpell(max_dictionary_edit_distance=timu.SYMSPELL_MAX_EDIT,
+                    prefix_length=timu.SYMSPELL_PREFIX_LEN)
+
+
+def startup_ms(repeat=20):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        _new().load_dictionary(timu.DICT_PATH, 0, 1)
+    return round((time.perf_counter() - t0) / repeat * 1000, 3)
+
+
+def per_message_us(rounds=500):
+    sym = timu.symspell
+
+    def legacy(text):
+        out = []
+        for word in text.split():
+            s = sym.lookup(word, Verbosity.CLOSEST, max_edit_distance=2)
+            out.append(s[0].term if s else word)
+        return " ".join(out)
+
+    n = rounds * len(MESSAGES)
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for m in MESSAGES:
+            legacy(m)
+    before = (time.perf_counter() - t0) / n * 1e6
+    timu._correct_word.cache_clear()
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for m in MESSAGES:
+            timu.correct_typo(m)
+    after = (time.perf_counter() - t0) / n * 1e6
+    return round(before, 2), round(after, 2)
+
+
+def run():
+    build = startup_ms()
+    before, after = per_message_us()
+    return {
+        "dictionary_words": len(timu.symspell.words),
+        "startup_build_ms": build,
+        "correct_us_per_msg_before": before,
+        "correct_us_per_msg_after": after,
+        "memo": timu._correct_word.cache_info()._asdict(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", help="simpan hasil JSON ke file")
+    args = parser.parse_args()
+    text = json.dumps(run(), indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
@@ -0,0 +1,34 @@
+# Konfigurasi gunicorn TIMU (dimuat otomatis dari direktori kerja).
+import gc
+import os
+import sys
+
+# Preload-and-fork: app diimpor sekali di master lalu worker di-fork (copy-on-write),
+# jadi tiap worker siap tanpa mengimpor ulang google-genai, SymSpell, JSON, dst.
+# GUNICORN_PRELOAD=0 untuk mode lama (setiap worker mengimpor app sendiri).
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+
+def when_ready(server):
+    timu = sys.modules.get("app")
+    if timu is None:
+        return
+    timu.warm_shared_state()
+    # objek hasil impor dipindah ke generasi permanen: GC di worker tidak menyentuh
+    # header-nya sehingga halaman memori master tetap terbagi
+    gc.freeze()
+
+
+def pre_fork(server, worker):
+    timu = sys.modules.get("app")
+    if timu is not None:
+        timu.prepare_fork()
+
+
+def worker_exit(server, worker):
+    # tulis antrean write-behind (chat_history, hits cache) sebelum worker berhenti
+    timu = sys.modules.get("app")
+    if timu is None:
+        return
+    timu.flush_chat_writes()
+    timu.flush_cache_hits()
@@ -55,6 +55,30 @@ document.addEventListener("DOMContentLoaded", () => {
     typeChar();
   }
 
+  // 🔹 Parser Server-Sent Events sederhana di atas fetch (EventSource tidak mendukung POST)
+  async function readEventStream(res, onEvent) {
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let idx;
+      while ((idx = buffer.indexOf("\n\n")) >= 0) {
+        const raw = buffer.slice(0, idx);
+        buffer = buffer.slice(idx + 2);
+        let event = "message";
+        let data = "";
+        for (const line of raw.split("\n")) {
+          if (line.startsWith("event:")) event = line.slice(6).trim();
+          else if (line.startsWith("data:")) data += line.slice(5).trim();
+        }
+        if (data) onEvent(event, JSON.parse(data));
+      }
+    }
+  }
+
   // 🔹 Sambutan awal hanya saat halaman dimuat
   renderBotMessage(
     "👋 Halo! Saya <b>TIMU</b>, asisten AI Trisakti School of Multimedia.<br>Ada yang bisa saya bantu hari ini?",
@@ -73,20 +97,48 @@ document.addEventListener("DOMContentLoaded", () => {
     scrollToBottom();
 
     try {
-      const res = await fetch("/api/chat", {
+      const res = await fetch("/api/chat/stream", {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: { "Content-Type": "application/json", "Accept": "text/event-stream" },
         body: JSON.stringify({ message })
       });
 
-      const data = await res.json();
-      typing.style.display = "none";
-
-      if (data.reply) {
-        renderBotMessage(data.reply, true);
-      } else if (data.error) {
-        renderMessage("bot", "⚠️ " + data.error);
+      // Error validasi (400/413/429) tetap dikirim sebagai JSON
+      if (!(res.headers.get("Content-Type") || "").includes("text/event-stream")) {
+        const data = await res.json();
+        typing.style.display = "none";
+        if (data.reply) {
+          renderBotMessage(data.reply, true);
+        } else if (data.error) {
+          renderMessage("bot", "⚠️ " + data.error);
+        }
+        return;
       }
+
+      let container = null;
+      let streamed = "";
+      await readEventStream(res, (event, data) => {
+        typing.style.display = "none";
+        if (event === "chunk") {
+          if (!container) {
+            container = document.createElement("div");
+            container.classList.add("message", "bot");
+            chatBox.appendChild(container);
+          }
+          streamed += data.html;
+          container.innerHTML = streamed; // HTML sudah disanitasi server
+          scrollToBottom();
+        } else if (event === "done") {
+          if (container) {
+            container.innerHTML = data.reply; // versi final menggantikan potongan
+            scrollToBottom();
+          } else {
+            renderBotMessage(data.reply, true);
+          }
+        } else if (event === "error") {
+          renderMessage("bot", "⚠️ " + data.error);
+        }
+      });
     } catch (err) {
       typing.style.display = "none";
       renderMessage("bot", "⚠️ Koneksi bermasalah. Coba lagi nanti.");
@@ -1,3 +1,5 @@
+const TIMU_API = "https://ai-asistan-tmm.onrender.com";
+
 document.addEventListener("DOMContentLoaded", () => {
   const timuWidget = document.createElement("div");
   timuWidget.className = "timu-widget";
@@ -32,6 +34,34 @@ document.addEventListener("DOMContentLoaded", () => {
   sendBtn.addEventListener("click", sendMessage);
   input.addEventListener("keypress", e => { if (e.key === "Enter") sendMessage(); });
 
+  // Widget ditanam di situs lain: tampilkan teks saja (tanpa innerHTML)
+  function toText(html) {
+    return new DOMParser().parseFromString(html, "text/html").body.textContent;
+  }
+
+  async function readEventStream(res, onEvent) {
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let idx;
+      while ((idx = buffer.indexOf("\n\n")) >= 0) {
+        const raw = buffer.slice(0, idx);
+        buffer = buffer.slice(idx + 2);
+        let event = "message";
+        let data = "";
+        for (const line of raw.split("\n")) {
+          if (line.startsWith("event:")) event = line.slice(6).trim();
+          else if (line.startsWith("data:")) data += line.slice(5).trim();
+        }
+        if (data) onEvent(event, JSON.parse(data));
+      }
+    }
+  }
+
   async function sendMessage() {
     const msg = input.value.trim();
     if (!msg) return;
@@ -49,13 +79,25 @@ document.addEventListener("DOMContentLoaded", () => {
     body.scrollTop = body.scrollHeight;
 
     try {
-      const res = await fetch("https://ai-asistan-tmm.onrender.com", {
+      const res = await fetch(TIMU_API + "/api/chat/stream", {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: { "Content-Type": "application/json", "Accept": "text/event-stream" },
         body: JSON.stringify({ message: msg })
       });
-      const data = await res.json();
-      botMsg.textContent = data.reply || "Maaf, aku belum tahu jawabannya 😅";
+      if (!(res.headers.get("Content-Type") || "").includes("text/event-stream")) {
+        const data = await res.json();
+        botMsg.textContent = toText(data.reply || data.error || "") || "Maaf, aku belum tahu jawabannya 😅";
+      } else {
+        let streamed = "";
+        await readEventStream(res, (event, data) => {
+          if (event === "chunk") streamed += data.html;
+          else if (event === "done") streamed = data.reply;
+          else if (event === "error") streamed = "⚠️ " + data.error;
+          botMsg.textContent = toText(streamed);
+          body.scrollTop = body.scrollHeight;
+        });
+        if (!streamed) botMsg.textContent = "Maaf, aku belum tahu jawabannya 😅";
+      }
     } catch (err) {
       botMsg.textContent = "⚠️ Tidak dapat terhubung ke server TIMU.";
     }
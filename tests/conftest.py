@@ -0,0 +1,14 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# app.py membaca konfigurasi saat diimpor: DB, log, dan kunci palsu di direktori sementara
+_tmp = tempfile.mkdtemp(prefix="timu-test-")
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.environ["DB_PATH"] = os.path.join(_tmp, "test.db")
+os.environ["LOG_FILE"] = os.path.join(_tmp, "app.log")
+os.environ.setdefault("ALLOW_TESTING", "1")
+os.environ.setdefault("RATELIMIT_ENABLED", "0")
@@ -0,0 +1,121 @@
+import random
+from difflib import SequenceMatcher
+
+import pytest
+
+import app as timu
+
+N_ENTRIES = 50_000
+N_PROBES = 60
+
+
+def _corpus(rng):
+    # kosakata kecil: banyak entri berbagi gram, kasus tersulit untuk index
+    words = [line.split("\t")[0] for line in open(timu.DICT_PATH, encoding="utf-8")]
+    vocab = rng.sample(words, 150) + ["apa", "berapa", "biaya", "kuliah", "jurusan", "di",
+                                      "yang", "untuk", "bagaimana", "cara", "daftar", "kampus"]
+    rows = [" ".join(rng.choice(vocab) for _ in range(rng.randint(4, 9))) for _ in range(N_ENTRIES)]
+    return vocab, [timu._norm_q(r) for r in rows]
+
+
+def _perturb(rng, vocab, s):
+    words = s.split()
+    op = rng.choice(("typo", "typo2", "drop", "swap", "add"))
+    if op.startswith("typo"):
+        chars = list(s)
+        for _ in range(1 if op == "typo" else 2):
+            chars[rng.randrange(len(chars))] = rng.choice("abcdefghijklmnopqrstuvwxyz")
+        return timu._norm_q("".join(chars))
+    if op == "drop" and len(words) > 4:
+        words.pop(rng.randrange(len(words)))
+    elif op == "swap":
+        i = rng.randrange(len(words) - 1)
+        words[i], words[i + 1] = words[i + 1], words[i]
+    else:
+        words.insert(rng.randrange(len(words) + 1), rng.choice(vocab))
+    return " ".join(words)
+
+
+def _best(candidates, qn):
+    sm = SequenceMatcher(None, "", qn)
+    best = 0.0
+    for cq in candidates:
+        sm.set_seq1(cq)
+        if sm.real_quick_ratio() >= timu.SIM_THRESHOLD_HIT and sm.quick_ratio() >= timu.SIM_THRESHOLD_HIT:
+            best = max(best, sm.ratio())
+    return best
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    rng = random.Random(7)
+    vocab, rows = _corpus(rng)
+    index = timu.NgramIndex()
+    index.add_many(list(enumerate(rows, 1)))
+    probes = [_perturb(rng, vocab, rng.choice(rows)) for _ in range(N_PROBES)]
+    return rows, index, probes
+
+
+def test_recall_matches_brute_force(corpus):
+    rows, index, probes = corpus
+    brute = [_best(rows, qn) >= timu.SIM_THRESHOLD_HIT for qn in probes]
+    found = [_best([cq for _, cq in index.search(qn)], qn) >= timu.SIM_THRESHOLD_HIT for qn in probes]
+    assert sum(brute) >= N_PROBES // 2
+    assert found == brute
+
+
+def test_short_typo_found_among_many_sharing_entries():
+    # "kulaih" hanya berbagi 2 trigram dengan "kuliah", sama seperti ribuan entri lain
+    index = timu.NgramIndex()
+    index.add_many([(i, f"kuliah malam kelas {i}") for i in range(1, 3000)] + [(5000, "kuliah")])
+    assert 5000 in [cid for cid, _ in index.search("kulaih")]
+
+
+def test_remove_and_slot_reuse():
+    index = timu.NgramIndex()
+    index.add_many([(1, "biaya kuliah"), (2, "jadwal kuliah"), (3, "lokasi kampus")])
+    index.remove(1)
+    assert 1 not in [cid for cid, _ in index.search("biaya kuliah")]
+    index.add(4, "biaya kuliah reguler")
+    assert index.search("biaya kuliah")[0][0] == 4
+    assert len(index.slot_cid) == 3
+
+
+def test_snapshot_roundtrip_via_sqlite():
+    timu.init_db()
+    conn = timu.db_conn()
+    conn.execute("DELETE FROM ai_cache")
+    conn.execute("DELETE FROM ai_cache_ngram")
+    conn.executemany(
+        "INSERT INTO ai_cache (question_norm, answer, ts, last_hit_ts, kb_version, hits, sanitized) "
+        "VALUES (?, 'a', 'x', 'x', 'v', 0, 1)",
+        [(q,) for q in ("biaya kuliah", "jadwal kuliah", "lokasi kampus", "beasiswa kip")]
+    )
+    conn.commit()
+    ids = [r[0] for r in conn.execute("SELECT id FROM ai_cache ORDER BY id")]
+    saved = timu.NgramIndex()
+    saved.load(conn)
+    saved.save(force=True)
+    assert conn.execute("SELECT COUNT(*) FROM ai_cache_ngram WHERE key = '#meta'").fetchone()[0] == 1
+
+    # baris yang dihapus setelah snapshot dibuang, baris baru ikut di-sync
+    conn.execute("DELETE FROM ai_cache WHERE id = ?", (ids[0],))
+    conn.execute("INSERT INTO ai_cache (question_norm, answer, ts, last_hit_ts, kb_version, hits, sanitized) "
+                 "VALUES ('biaya wisuda', 'a', 'x', 'x', 'v', 0, 1)")
+    conn.commit()
+    restored = timu.NgramIndex()
+    restored.load(conn)
+    assert ids[0] not in restored.entries
+    assert sorted(cq for cq in (e[1] for e in restored.entries.values())) == \
+        ["beasiswa kip", "biaya wisuda", "jadwal kuliah", "lokasi kampus"]
+    assert restored.search("jadwal kuliah")[0][1] == "jadwal kuliah"
+
+
+def test_corrupt_snapshot_rebuilds_from_ai_cache():
+    conn = timu.db_conn()
+    conn.execute("DELETE FROM ai_cache_ngram")
+    conn.execute("INSERT INTO ai_cache_ngram (key, value) VALUES ('#meta', 'bukan json')")
+    conn.commit()
+    index = timu.NgramIndex()
+    index.load(conn)
+    assert len(index.entries) == conn.execute("SELECT COUNT(*) FROM ai_cache").fetchone()[0]
@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+import pytest
+
+import app as timu
+
+
+def test_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        timu.PromptContextCache(60)
+
+
+def test_local_stub_creates_once_per_prefix():
+    cache = timu.LocalContextCache(3600)
+    first = cache.request("PREFIX A\n", "tanya 1")
+    second = cache.request("PREFIX A\n", "tanya 2")
+    assert cache.created == 1 and cache.hits == 2
+    assert first["contents"] == "PREFIX A\ntanya 1"
+    assert second["contents"] == "PREFIX A\ntanya 2"
+    cache.request("PREFIX B\n", "tanya 3")  # data di-reload -> prefix baru
+    assert cache.created == 2
+
+
+def test_expired_entry_is_recreated():
+    cache = timu.LocalContextCache(0)
+    cache.request("P", "x")
+    cache.request("P", "y")
+    assert cache.created == 2
+
+
+def test_create_failure_sends_full_prompt_and_cools_down():
+    class Failing(timu.PromptContextCache):
+        calls = 0
+
+        def _create(self, prefix):
+            Failing.calls += 1
+            raise RuntimeError("cache tidak didukung model")
+
+    cache = Failing(3600)
+    assert cache.request("P", "x") == {"model": timu.GEMINI_MODEL, "contents": "Px"}
+    assert cache.request("P", "y")["contents"] == "Py"
+    assert Failing.calls == 1
+
+
+def test_no_context_cache_always_sends_prefix():
+    cache = timu.NoContextCache(3600)
+    assert cache.request("P", "x") == {"model": timu.GEMINI_MODEL, "contents": "Px"}
+
+
+def test_chat_handler_uses_context_cache(monkeypatch):
+    cache = timu.LocalContextCache(3600)
+    sent = []
+
+    def fake_generate(**kwargs):
+        sent.append(kwargs)
+        return SimpleNamespace(text="Jawaban uji dari model.")
+
+    monkeypatch.setattr(timu, "context_cache", cache)
+    monkeypatch.setattr(timu.gemini, "generate_content", fake_generate)
+    client = timu.app.test_client()
+    for message in ("ceritakan filosofi warna hangat dalam desain poster festival",
+                    "bagaimana cara menulis naskah podcast horor yang menegangkan"):
+        resp = client.post("/api/chat", json={"message": message}, base_url="https://localhost")
+        assert resp.status_code == 200
+    prefix = timu.knowledge.current()["prompt_prefix"]
+    assert len(sent) == 2
+    assert cache.created == 1 and cache.hits == 2
+    assert all(kw["contents"].startswith(prefix) for kw in sent)
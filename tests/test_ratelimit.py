@@ -0,0 +1,82 @@
+import pytest
+
+import app as timu
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setitem(timu.app.config, "RATELIMIT_ENABLED", True)
+    monkeypatch.setattr(timu.limiter, "table", timu.TokenBucketTable(str(tmp_path / "rl"), 1024))
+    return timu.app.test_client()
+
+
+def get(client, path, ip="10.0.0.1"):
+    return client.get(path, base_url="https://localhost", environ_overrides={"REMOTE_ADDR": ip})
+
+
+def test_ip_bucket_exhaustion_returns_429_with_retry_after(client):
+    # /admin/stats: 10/minute per IP
+    for _ in range(10):
+        assert get(client, "/admin/stats").status_code == 302
+    resp = get(client, "/admin/stats")
+    assert resp.status_code == 429
+    assert 1 <= int(resp.headers["Retry-After"]) <= 6
+    assert "error" in resp.get_json()
+    # IP lain punya bucket sendiri
+    assert get(client, "/admin/stats", ip="10.0.0.2").status_code == 302
+
+
+def test_chat_session_bucket_follows_cookie_across_ips(client):
+    cookie = timu.app.config["SESSION_COOKIE_NAME"]
+    client.set_cookie(cookie, "sesi-a", domain="localhost")
+    session_cap = timu.parse_rate(timu.CHAT_SESSION_RATE).capacity
+    for i in range(session_cap):
+        assert get(client, "/api/chat", ip=f"10.1.0.{i}").status_code == 200
+    # IP baru, sesi sama: bucket sesi sudah habis
+    assert get(client, "/api/chat", ip="10.1.1.1").status_code == 429
+    # sesi lain dari IP yang sama masih boleh
+    client.set_cookie(cookie, "sesi-b", domain="localhost")
+    assert get(client, "/api/chat", ip="10.1.1.1").status_code == 200
+
+
+def test_chat_without_cookie_limited_by_ip_only(client):
+    ip_cap = timu.parse_rate(timu.CHAT_RATE).capacity
+    for _ in range(ip_cap):
+        assert get(client, "/api/chat").status_code == 200
+    assert get(client, "/api/chat").status_code == 429
+
+
+def test_route_limit_replaces_defaults(client, monkeypatch):
+    monkeypatch.setattr(timu.limiter, "defaults", (timu.parse_rate("2/minute"),))
+    # tanpa dekorator: default berlaku
+    assert get(client, "/logout").status_code == 302
+    assert get(client, "/logout").status_code == 302
+    assert get(client, "/logout").status_code == 429
+    # dengan dekorator 10/minute: default 2/minute tidak ikut ditumpuk
+    for _ in range(10):
+        assert get(client, "/admin/stats").status_code == 302
+    assert get(client, "/admin/stats").status_code == 429
+
+
+def test_fails_open_when_table_errors(client, monkeypatch):
+    def broken(buckets):
+        raise OSError("mmap rusak")
+
+    monkeypatch.setattr(timu.limiter.table, "take", broken)
+    errors = timu.limiter.errors
+    for _ in range(15):
+        assert get(client, "/admin/stats").status_code == 302
+    assert timu.limiter.errors == errors + 15
+
+
+def test_disabled_skips_table(client, monkeypatch):
+    monkeypatch.setitem(timu.app.config, "RATELIMIT_ENABLED", False)
+    for _ in range(15):
+        assert get(client, "/admin/stats").status_code == 302
+
+
+def test_parse_rate_formats():
+    assert timu.parse_rate("60/minute") == ("60/minute", 60, 1.0, "ip")
+    assert timu.parse_rate("600 per hour").capacity == 600
+    with pytest.raises(ValueError):
+        timu.parse_rate("banyak")
@@ -0,0 +1,194 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from google.genai import errors as genai_errors
+from requests import exceptions as requests_exceptions
+
+import app as timu
+
+
+class FakeModels:
+    """client.models palsu: panggilan ke-i menjalankan script[i] (callable atau nilai)."""
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def generate_content(self, **kwargs):
+        with self.lock:
+            step = self.script[min(self.calls, len(self.script) - 1)]
+            self.calls += 1
+        return step() if callable(step) else step
+
+
+def slow(seconds, value):
+    def step():
+        time.sleep(seconds)
+        return value
+    return step
+
+
+def fail(exc):
+    def step():
+        raise exc
+    return step
+
+
+def client_error(code=400):
+    body = {"error": {"code": code, "message": "bad request", "status": "INVALID_ARGUMENT"}}
+    return genai_errors.ClientError(code, SimpleNamespace(body_segments=[body]))
+
+
+def make(models, **kw):
+    kw.setdefault("timeout", 0.2)
+    kw.setdefault("deadline", 5.0)
+    kw.setdefault("breaker", timu.CircuitBreaker(3, 60))
+    return timu.ResilientGemini(SimpleNamespace(models=models), **kw)
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(timu, "GEMINI_BACKOFF", (0.001, 0.001))
+
+
+def test_timeout_then_retry_succeeds():
+    models = FakeModels(slow(0.6, "telat"), "ok")
+    g = make(models)
+    assert g.generate_content(contents="x") == "ok"
+    assert models.calls == 2
+    assert g.stats["timeout"] == 1 and g.stats["retry"] == 1 and g.stats["ok"] == 1
+    assert g.breaker.state == "closed" and g.breaker.failures == 0
+
+
+def test_async_timeout_then_retry_succeeds():
+    models = FakeModels(slow(0.6, "telat"), "ok")
+    g = make(models)
+    assert asyncio.run(g.agenerate_content(contents="x")) == "ok"
+    assert models.calls == 2 and g.stats["timeout"] == 1
+
+
+def test_retries_exhausted_raises_unavailable():
+    models = FakeModels(fail(requests_exceptions.ConnectionError("reset")))
+    g = make(models, retries=2)
+    with pytest.raises(timu.GeminiUnavailable):
+        g.generate_content(contents="x")
+    assert models.calls == 3 and g.stats["retry"] == 2
+
+
+def test_breaker_opens_then_half_open_allows_single_probe():
+    gate = threading.Event()
+    models = FakeModels(fail(requests_exceptions.ConnectionError("down")),
+                        fail(requests_exceptions.ConnectionError("down")),
+                        lambda: gate.wait(5) and "pulih")
+    g = make(models, retries=0, breaker=timu.CircuitBreaker(2, 0.2))
+    for _ in range(2):
+        with pytest.raises(timu.GeminiUnavailable):
+            g.generate_content(contents="x")
+    assert g.breaker.state == "open"
+
+    # selama open: ditolak tanpa menyentuh upstream
+    with pytest.raises(timu.GeminiUnavailable):
+        g.generate_content(contents="x")
+    assert models.calls == 2 and g.stats["short_circuit"] == 1
+
+    time.sleep(0.25)
+    g.timeout = 5.0
+    result = {}
+    probe = threading.Thread(target=lambda: result.setdefault("r", g.generate_content(contents="x")))
+    probe.start()
+    for _ in range(100):
+        if models.calls == 3:
+            break
+        time.sleep(0.01)
+    assert g.breaker.state == "half_open"
+    # probe masih berjalan: panggilan lain tetap ditolak
+    with pytest.raises(timu.GeminiUnavailable):
+        g.generate_content(contents="x")
+    assert models.calls == 3
+
+    gate.set()
+    probe.join(5)
+    assert result["r"] == "pulih"
+    assert g.breaker.state == "closed"
+
+
+def test_failed_probe_reopens_breaker():
+    models = FakeModels(fail(requests_exceptions.ConnectionError("down")))
+    g = make(models, retries=0, breaker=timu.CircuitBreaker(1, 0.1))
+    with pytest.raises(timu.GeminiUnavailable):
+        g.generate_content(contents="x")
+    time.sleep(0.15)
+    with pytest.raises(timu.GeminiUnavailable):
+        g.generate_content(contents="x")
+    assert models.calls == 2 and g.breaker.state == "open"
+
+
+def test_non_retryable_error_closes_breaker_without_retry():
+    models = FakeModels(fail(client_error(400)))
+    g = make(models, retries=2, breaker=timu.CircuitBreaker(1, 0.1))
+    g.breaker.failure()
+    assert g.breaker.state == "open"
+    time.sleep(0.15)
+    with pytest.raises(timu.GeminiUnavailable):
+        g.generate_content(contents="x")
+    # upstream menjawab (400): probe dianggap sehat, tidak ada retry
+    assert models.calls == 1 and g.stats["retry"] == 0
+    assert g.breaker.state == "closed" and g.breaker.failures == 0
+
+
+def test_hedged_call_returns_first_success(monkeypatch):
+    monkeypatch.setattr(timu, "GEMINI_HEDGE_MIN", 0.05)
+    models = FakeModels(slow(1.0, "lambat"), "cepat")
+    g = make(models, timeout=3.0, hedge=True)
+    g.latencies.extend([0.01] * timu.GEMINI_HEDGE_SAMPLES)
+    assert g.hedge_delay() == 0.05
+
+    started = time.monotonic()
+    assert g.generate_content(contents="x") == "cepat"
+    assert time.monotonic() - started < 0.8
+    assert models.calls == 2 and g.stats["hedge"] == 1 and g.stats["timeout"] == 0
+
+
+def test_no_hedge_before_enough_samples():
+    g = make(FakeModels("ok"), hedge=True)
+    assert g.hedge_delay() is None
+    assert g.generate_content(contents="x") == "ok"
+    assert g.stats["hedge"] == 0
+
+
+def test_local_error_propagates_and_keeps_breaker_open():
+    models = FakeModels(fail(TypeError("argumen salah")), "ok")
+    g = make(models, retries=2, breaker=timu.CircuitBreaker(1, 0.1))
+    g.breaker.failure()
+    time.sleep(0.15)
+    # probe gagal karena bug lokal: error asli diteruskan, breaker tidak ditutup
+    with pytest.raises(TypeError):
+        g.generate_content(contents="x")
+    assert models.calls == 1 and g.stats["retry"] == 0
+    assert g.breaker.state == "half_open"
+    # probe dilepas: permintaan berikutnya boleh mencoba lagi
+    assert g.generate_content(contents="x") == "ok"
+    assert g.breaker.state == "closed"
+
+
+def test_local_error_does_not_reset_failure_count():
+    models = FakeModels(fail(requests_exceptions.ConnectionError("down")), fail(KeyError("text")))
+    g = make(models, retries=0, breaker=timu.CircuitBreaker(3, 60))
+    with pytest.raises(timu.GeminiUnavailable):
+        g.generate_content(contents="x")
+    with pytest.raises(KeyError):
+        g.generate_content(contents="x")
+    assert g.breaker.failures == 1 and g.breaker.state == "closed"
+
+
+def test_non_retryable_server_error_counts_as_failure():
+    body = {"error": {"code": 501, "message": "not implemented", "status": "UNIMPLEMENTED"}}
+    models = FakeModels(fail(genai_errors.ServerError(501, SimpleNamespace(body_segments=[body]))))
+    g = make(models, retries=2, breaker=timu.CircuitBreaker(1, 60))
+    with pytest.raises(timu.GeminiUnavailable):
+        g.generate_content(contents="x")
+    assert models.calls == 1 and g.breaker.state == "open"
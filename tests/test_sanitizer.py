@@ -0,0 +1,67 @@
+import random
+
+import bleach
+import pytest
+
+import app as timu
+from bench.sanitizer_fuzz import URLS, gen_benign, gen_case
+
+SEED = 18
+CASES = 4000
+
+
+def reference(text: str) -> str:
+    # langsung ke bleach (bukan timu.bleach_clean) agar upgrade bleach yang
+    # mengubah output ikut terdeteksi di sini
+    return bleach.clean(text, tags=timu.BLEACH_TAGS, attributes=timu.BLEACH_ATTRS,
+                        protocols=timu.BLEACH_PROTOCOLS, strip=True)
+
+
+def _cases():
+    rng = random.Random(SEED)
+    for i in range(CASES):
+        text = gen_case(rng) if i % 2 else gen_benign(rng)
+        pre = {u.strip().rstrip("/").lower() for u in rng.sample(URLS, rng.randint(0, 2))}
+        yield text, pre
+
+
+def _fast_path_used(text, **kw) -> bool:
+    try:
+        timu._fast_clean(text, **kw)
+        return True
+    except timu._SanitizerBail:
+        return False
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "halo <b>tebal</b> <script>alert(1)</script>",
+    '<a href="javascript:alert(1)" onclick="x">klik</a>',
+    "a < b &amp; c &foo; &#x41;",
+    "info: https://trisaktimultimedia.ac.id/biaya?a=1&b=2",
+])
+def test_sanitize_matches_bleach_examples(text):
+    assert timu.sanitize_html(text) == reference(text)
+
+
+def test_sanitize_html_equals_bleach_fuzz():
+    mismatches, fast = [], 0
+    for text, _ in _cases():
+        if timu.sanitize_html(text) != reference(text):
+            mismatches.append(text)
+        fast += _fast_path_used(text)
+    assert not mismatches, mismatches[:5]
+    # sebagian besar kasus harus lewat jalur cepat, bukan fallback ke bleach
+    assert fast > CASES // 4
+
+
+def test_format_reply_equals_bleach_fuzz():
+    mismatches, fast = [], 0
+    for text, pre in _cases():
+        seen_ref, seen_new = set(pre), set(pre)
+        expected = reference(timu.format_links(text, seen_ref))
+        if timu.format_reply(text, seen_new) != expected or seen_ref != seen_new:
+            mismatches.append(text)
+        fast += _fast_path_used(text, linkify=True, seen=set(pre), new_seen=set())
+    assert not mismatches, mismatches[:5]
+    assert fast > CASES // 4
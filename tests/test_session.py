@@ -0,0 +1,137 @@
+import time
+
+import pytest
+
+import app as timu
+
+BASE = "https://localhost"
+COOKIE = timu.app.config["SESSION_COOKIE_NAME"]
+
+
+@pytest.fixture
+def client():
+    return timu.app.test_client()
+
+
+def chat(client, message):
+    resp = client.post("/api/chat", json={"message": message}, base_url=BASE)
+    assert resp.status_code == 200
+    return resp
+
+
+def sid_of(client):
+    cookie = client.get_cookie(COOKIE, domain="localhost")
+    assert cookie is not None
+    return timu.app.session_interface._signer(timu.app).unsign(cookie.value).decode()
+
+
+def stored_turns(sid):
+    return timu.db_conn().execute(
+        "SELECT role, content FROM session_turns WHERE sid = ? ORDER BY seq", (sid,)
+    ).fetchall()
+
+
+def session_row(sid):
+    return timu.db_conn().execute("SELECT data, expires FROM sessions WHERE sid = ?", (sid,)).fetchone()
+
+
+def test_data_round_trip(client):
+    resp = client.post("/login", data={"password": timu.ADMIN_PASSWORD}, base_url=BASE)
+    assert resp.status_code == 302 and resp.headers["Location"].endswith("/admin/stats")
+    sid = sid_of(client)
+    data, expires = session_row(sid)
+    assert '"admin_logged_in": true' in data and expires > time.time()
+    # permintaan berikutnya memuat sesi yang sama dari SQLite
+    assert client.get("/admin/stats", base_url=BASE).status_code == 200
+    assert sid_of(client) == sid
+    client.get("/logout", base_url=BASE)
+    assert client.get("/admin/stats", base_url=BASE).status_code == 302
+
+
+def test_turns_round_trip_and_trim(client):
+    for message in ("ok", "oke", "iya", "wkwk"):
+        chat(client, message)
+    sid = sid_of(client)
+    conversation = client.get("/api/chat", base_url=BASE).get_json()["conversation"]
+    assert len(conversation) == timu.SESSION_HISTORY_TURNS
+    assert conversation[0] == {"role": "user", "content": "oke"}
+    assert conversation[-2] == {"role": "user", "content": "wkwk"}
+    assert conversation[-1]["role"] == "bot"
+    # yang disimpan hanya jendela yang dipakai prompt
+    rows = stored_turns(sid)
+    assert len(rows) == timu.SESSION_HISTORY_TURNS
+    assert [(t["role"], t["content"]) for t in conversation] == [tuple(r) for r in rows]
+
+
+def test_unknown_or_forged_cookie_gets_new_session(client):
+    client.set_cookie(COOKIE, "bukan-sid-bertanda-tangan", domain="localhost")
+    chat(client, "ok")
+    sid = sid_of(client)
+    assert sid != "bukan-sid-bertanda-tangan" and len(stored_turns(sid)) == 2
+
+
+def test_clear_session_drops_history(client):
+    chat(client, "ok")
+    chat(client, "iya")
+    sid = sid_of(client)
+    resp = client.post("/api/clear-session", base_url=BASE)
+    assert resp.get_json() == {"ok": True}
+    assert stored_turns(sid) == []
+    assert client.get("/api/chat", base_url=BASE).get_json()["conversation"] == []
+
+
+def test_clear_session_keeps_session_data(client):
+    client.post("/login", data={"password": timu.ADMIN_PASSWORD}, base_url=BASE)
+    chat(client, "ok")
+    sid = sid_of(client)
+    client.post("/api/clear-session", base_url=BASE)
+    assert stored_turns(sid) == []
+    assert '"admin_logged_in": true' in session_row(sid)[0]
+    assert sid_of(client) == sid
+
+
+def test_landing_deletes_session_and_cookie(client):
+    chat(client, "ok")
+    sid = sid_of(client)
+    resp = client.get("/", base_url=BASE)
+    assert resp.status_code == 200
+    assert any(h.startswith(f"{COOKIE}=;") for h in resp.headers.getlist("Set-Cookie"))
+    assert client.get_cookie(COOKIE, domain="localhost") is None
+    assert session_row(sid) is None and stored_turns(sid) == []
+
+
+def test_landing_without_session_sets_no_cookie(client):
+    resp = client.get("/", base_url=BASE)
+    assert resp.status_code == 200 and not resp.headers.getlist("Set-Cookie")
+
+
+def test_expired_session_is_not_reused(client):
+    chat(client, "ok")
+    sid = sid_of(client)
+    with timu.db_conn() as conn:
+        conn.execute("UPDATE sessions SET expires = ? WHERE sid = ?", (time.time() - 1, sid))
+    assert client.get("/api/chat", base_url=BASE).get_json()["conversation"] == []
+
+
+def test_sweep_removes_only_expired_sessions():
+    now = time.time()
+    with timu.db_conn() as conn:
+        for sid, expires in (("lama-1", now - 10), ("lama-2", now - 1), ("aktif", now + 3600)):
+            conn.execute("INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, '{}', ?)",
+                         (sid, expires))
+            conn.execute("INSERT OR REPLACE INTO session_turns (sid, seq, role, content) "
+                         "VALUES (?, 1, 'user', 'halo')", (sid,))
+    assert timu.sweep_sessions(timu.db_conn(), now) >= 2
+    assert session_row("lama-1") is None and stored_turns("lama-1") == []
+    assert session_row("lama-2") is None and stored_turns("lama-2") == []
+    assert session_row("aktif") is not None and len(stored_turns("aktif")) == 1
+
+
+def test_save_triggers_sweep_when_due(client, monkeypatch):
+    with timu.db_conn() as conn:
+        conn.execute("INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES ('basi', '{}', ?)",
+                     (time.time() - 5,))
+    monkeypatch.setitem(timu._session_sweep, "next", 0.0)
+    chat(client, "ok")
+    assert session_row("basi") is None
+    assert timu._session_sweep["next"] > time.time()
@@ -0,0 +1,78 @@
+import os
+import threading
+import time
+
+import app as timu
+
+THREADS = 8
+ROUNDS = 400
+
+
+def _hammer(fn):
+    start = threading.Barrier(THREADS)
+
+    def run():
+        start.wait()
+        for _ in range(ROUNDS):
+            fn()
+
+    threads = [threading.Thread(target=run) for _ in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def test_token_bucket_no_lost_updates_between_threads(tmp_path):
+    table = timu.TokenBucketTable(str(tmp_path / "rl"), 64)
+    find = table._find
+
+    def preempted_find(*args):
+        # lepas GIL di antara baca slot dan tulis balik: flock saja tidak
+        # mengecualikan thread lain yang memakai fd yang sama
+        found = find(*args)
+        time.sleep(0.0001)
+        return found
+
+    table._find = preempted_find
+    total = THREADS * ROUNDS
+    bucket = [(timu._bucket_hash("k"), float(total), 1e-9)]
+    table._map()
+    granted = []
+    _hammer(lambda: granted.append(table.take(bucket) == 0))
+    assert all(granted)
+    # tepat `total` token diambil: permintaan berikutnya harus ditolak
+    assert table.take(bucket) > 0
+
+
+def test_generation_bump_counts_every_thread(tmp_path):
+    gen = timu.SharedGeneration(str(tmp_path / "gen"))
+    gen._map()
+    _hammer(gen.bump)
+    assert gen.read() == THREADS * ROUNDS
+
+
+def test_histogram_observe_counts_every_thread(tmp_path):
+    hist = timu.SharedHistograms(str(tmp_path / "metrics"), ("total",), ("ai",), timu.METRIC_BUCKETS)
+    hist._map()
+    _hammer(lambda: hist.observe("ai", {"total": 0.001}))
+    count, _, buckets = hist.snapshot()[("total", "ai")]
+    assert count == THREADS * ROUNDS and sum(buckets) == count
+
+
+def test_concurrent_first_map_opens_one_fd(tmp_path):
+    gen = timu.SharedGeneration(str(tmp_path / "gen"))
+    maps = []
+    _hammer(lambda: maps.append(gen._map()))
+    assert len({id(mm) for mm in maps}) == 1
+
+
+def test_reopened_after_fork(tmp_path):
+    gen = timu.SharedGeneration(str(tmp_path / "gen"))
+    gen.bump()
+    pid = os.fork()
+    if pid == 0:
+        gen.bump()
+        os._exit(0)
+    os.waitpid(pid, 0)
+    assert gen.read() == 2
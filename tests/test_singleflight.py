@@ -0,0 +1,126 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import app as timu
+
+BASE = "https://localhost"
+
+
+@pytest.fixture(autouse=True)
+def local_context_cache(monkeypatch):
+    monkeypatch.setattr(timu, "context_cache", timu.LocalContextCache(3600))
+
+
+class Upstream:
+    """gemini.generate_content palsu: hitung panggilan, tahan sampai gate dibuka."""
+
+    def __init__(self, error=None):
+        self.calls = 0
+        self.started = threading.Event()
+        self.gate = threading.Event()
+        self.error = error
+
+    def __call__(self, **kwargs):
+        self.calls += 1
+        self.started.set()
+        self.gate.wait(10)
+        if self.error is not None:
+            raise self.error
+        return SimpleNamespace(text="Jawaban leader untuk pertanyaan kembar.")
+
+
+def post(message, out, key):
+    resp = timu.app.test_client().post("/api/chat", json={"message": message}, base_url=BASE)
+    out[key] = (resp.status_code, resp.get_json())
+
+
+def inflight_rows(message):
+    return timu.db_conn().execute(
+        "SELECT COUNT(*) FROM inflight WHERE question_norm = ?", (timu._norm_q(message),)
+    ).fetchone()[0]
+
+
+def follower_waiting(monkeypatch):
+    waiting = threading.Event()
+    real = timu._lease_wait
+
+    def wait(owner, user_msg):
+        waiting.set()
+        return real(owner, user_msg)
+
+    monkeypatch.setattr(timu, "_lease_wait", wait)
+    return waiting
+
+
+def test_concurrent_identical_misses_share_one_upstream_call(monkeypatch):
+    message = "bagaimana suasana studio fotografi kampus saat malam hari"
+    upstream = Upstream()
+    monkeypatch.setattr(timu.gemini, "generate_content", upstream)
+    waiting = follower_waiting(monkeypatch)
+    shared_before = timu.read_counters("coalesce_").get("coalesce_shared", 0)
+
+    out = {}
+    leader = threading.Thread(target=post, args=(message, out, "leader"))
+    leader.start()
+    assert upstream.started.wait(5)
+    follower = threading.Thread(target=post, args=(message, out, "follower"))
+    follower.start()
+    assert waiting.wait(5)
+    upstream.gate.set()
+    leader.join(10)
+    follower.join(10)
+
+    assert upstream.calls == 1
+    assert out["leader"][0] == out["follower"][0] == 200
+    assert out["leader"][1]["source"] == "ai" and out["follower"][1]["source"] == "cache"
+    assert out["leader"][1]["reply"] == out["follower"][1]["reply"]
+    assert timu.read_counters("coalesce_").get("coalesce_shared", 0) == shared_before + 1
+    assert inflight_rows(message) == 0
+
+
+@pytest.mark.parametrize("error, status", [
+    (timu.GeminiUnavailable("Gemini mati"), 500),   # fallback
+    (TypeError("bug lokal"), 500),                  # Kesalahan sistem internal
+])
+def test_lease_released_after_upstream_raises(monkeypatch, error, status):
+    message = f"apakah ada kelas tari tradisional untuk mahasiswa {type(error).__name__}"
+    upstream = Upstream(error)
+    upstream.gate.set()
+    monkeypatch.setattr(timu.gemini, "generate_content", upstream)
+    out = {}
+    post(message, out, "first")
+    assert out["first"][0] == status
+    assert inflight_rows(message) == 0
+    assert not timu._inflight_events
+
+    # permintaan berikutnya langsung jadi leader, tidak menunggu lease basi
+    started = time.monotonic()
+    post(message, out, "second")
+    assert time.monotonic() - started < 5
+    assert upstream.calls == 2
+
+
+def test_follower_takes_over_when_leader_fails(monkeypatch):
+    message = "berapa lama waktu tempuh dari stasiun terdekat ke gedung kampus"
+    upstream = Upstream(timu.GeminiUnavailable("Gemini mati"))
+    monkeypatch.setattr(timu.gemini, "generate_content", upstream)
+    waiting = follower_waiting(monkeypatch)
+
+    out = {}
+    leader = threading.Thread(target=post, args=(message, out, "leader"))
+    leader.start()
+    assert upstream.started.wait(5)
+    follower = threading.Thread(target=post, args=(message, out, "follower"))
+    follower.start()
+    assert waiting.wait(5)
+    upstream.gate.set()
+    leader.join(10)
+    follower.join(10)
+
+    # leader gagal tanpa jawaban: follower memanggil upstream sendiri
+    assert upstream.calls == 2
+    assert out["leader"][0] == out["follower"][0] == 500
+    assert inflight_rows(message) == 0
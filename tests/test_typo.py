@@ -0,0 +1,55 @@
+import pytest
+
+import app as timu
+
+COMMON_WORDS = [
+    "saya", "iya", "sekarang", "kalau", "sini", "kamu", "bedanya", "jelaskan",
+    "apa", "ada", "bisa", "mau", "tanya", "dong", "kak", "yang", "berapa",
+    "bagaimana", "kapan", "dimana", "jurusan", "kuliah", "biaya", "daftar",
+]
+
+
+@pytest.fixture(autouse=True)
+def fresh_memo():
+    timu._correct_word.cache_clear()
+    yield
+    timu._correct_word.cache_clear()
+
+
+@pytest.mark.parametrize("word", COMMON_WORDS)
+def test_common_words_pass_through(word):
+    assert timu.correct_typo(word) == word
+
+
+@pytest.mark.parametrize("key", sorted(timu.QUICK_REPLIES))
+def test_quick_reply_keys_pass_through(key):
+    assert timu.correct_typo(key) == key
+    assert timu.correct_typo(key).lower().strip() in timu.QUICK_REPLIES
+
+
+def test_sentence_passes_through():
+    text = "kalau saya mau tanya bedanya jurusan di sini sekarang"
+    assert timu.correct_typo(text) == text
+
+
+def test_dictionary_word_skips_lookup(monkeypatch):
+    word = next(iter(timu.symspell.words))
+
+    def boom(*args, **kwargs):
+        raise AssertionError("lookup tidak boleh dipanggil untuk kata di kamus")
+
+    monkeypatch.setattr(timu.symspell, "lookup", boom)
+    assert timu._correct_word(word) == word
+
+
+def test_repeated_words_served_from_memo(monkeypatch):
+    timu.correct_typo("halo kak mau tanya")
+    info = timu._correct_word.cache_info()
+    assert info.misses == 4 and info.hits == 0
+
+    def boom(*args, **kwargs):
+        raise AssertionError("kata yang sudah di-memo tidak boleh di-lookup ulang")
+
+    monkeypatch.setattr(timu.symspell, "lookup", boom)
+    assert timu.correct_typo("kak mau tanya halo") == "kak mau tanya halo"
+    assert timu._correct_word.cache_info().hits == 4